@@ -0,0 +1,406 @@
+#! /usr/bin/python3.5
+
+"""
+BENCHMARKS FOR MY 2D GAME ENGINE
+Generates synthetic maps (.tmx) and npc files (.json) at several scales, and measures for each of them how long
+the overworld takes to load the map, the time of every frame's update and draw, and the peak memory of the process.
+Every scale runs in its own process with SDL's dummy video driver.  Also times the per-frame collision checks
+of the overworld as the number of world objects grows.
+
+The results are written as json, so runs on two commits can be compared.
+
+usage: python3 benchmark.py [--scales small,medium,...] [--frames N] [--compile] [--dirty] [--output results.json]
+                            [--compare baseline.json] [--keep-maps DIRECTORY]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from collections import OrderedDict
+
+import numpy
+import pygame
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import spatialhash
+
+TILE_SIZE = 32 #pixels
+OBJECT_COUNTS = (100, 1000, 10000, 50000)
+QUERIES = 1000 #collision checks timed per object count
+
+#tiles of map per blocker, so maps grow with their number of objects like real maps do
+TILES_PER_OBJECT = 16
+
+#synthetic map scales: (name, width in tiles, height in tiles, blockers, npcs)
+SCALES = (('small', 75, 75, 10, 0),
+          ('medium', 250, 250, 1000, 100),
+          ('large', 500, 500, 10000, 1000),
+          ('huge', 1000, 1000, 50000, 5000))
+
+FRAMES = 300 #frames timed per scale
+FRAME_TIME = 1. / 60 #seconds simulated per frame
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+
+#tileset of the synthetic maps, and the grass tiles of it the ground is made of
+TILESET = os.path.join('data', 'maps', 'tilesets', 'grass-tiles-2-small.png')
+TILESET_SIZE = (384, 192)
+GROUND_TILES = (1, 2, 13, 14, 50, 51, 55, 62, 63, 67)
+
+NPC_SPRITES = ('child_sprite_model.png', 'female_sprite_model.png', 'male_sprite_model.png')
+NPC_DIRECTIONS = ('up', 'down', 'left', 'right')
+
+
+def make_world(object_count, seed=0):
+    """
+    Scatter blocker rects over a square map big enough for the number of objects
+
+    :param: object_count, number of blockers
+    :rtype: (list of blocker rects, list of query rects the size of the player's feet)
+    """
+    rng = random.Random(seed)
+    map_size = int((object_count * TILES_PER_OBJECT) ** .5) * TILE_SIZE
+
+    blockers = [pygame.Rect(rng.randrange(map_size), rng.randrange(map_size),
+                            rng.choice((1, 1, 2, 4)) * TILE_SIZE, rng.choice((1, 1, 2, 4)) * TILE_SIZE)
+                for _ in range(object_count)]
+    feet = [pygame.Rect(rng.randrange(map_size), rng.randrange(map_size), 16, 8) for _ in range(QUERIES)]
+
+    return blockers, feet
+
+
+def make_map(directory, name, width, height, blocker_count, npc_count, seed=0):
+    """
+    Write a synthetic map and its npc file.  The npc file is named like the overworld expects (<map>_npcs.json)
+
+    :param: directory, folder to write the files to
+    :param: name, name of the map, without extension
+    :param: width, height, size of the map in tiles
+    :param: blocker_count, number of blocker objects scattered over the map
+    :param: npc_count, number of npcs scattered over the map
+    :rtype: absolute path to the .tmx file
+    """
+    rng = random.Random(seed)
+    pixel_width = width * TILE_SIZE
+    pixel_height = height * TILE_SIZE
+
+    #ground layer of random grass tiles
+    ground = numpy.random.RandomState(seed).choice(GROUND_TILES, size=(height, width))
+    ground_csv = ',\n'.join(','.join(map(str, row)) for row in ground.tolist())
+
+    objects = list()
+    object_id = 1
+
+    #blockers the size of a few tiles, away from the player in the center of the map
+    player = (pixel_width // 2, pixel_height // 2, TILE_SIZE, TILE_SIZE)
+    spawn = pygame.Rect(player).inflate(4 * TILE_SIZE, 4 * TILE_SIZE)
+    while object_id <= blocker_count:
+        blocker = pygame.Rect(rng.randrange(width) * TILE_SIZE, rng.randrange(height) * TILE_SIZE,
+                              rng.choice((1, 1, 2, 4)) * TILE_SIZE, rng.choice((1, 1, 2, 4)) * TILE_SIZE)
+        if blocker.colliderect(spawn):
+            continue
+        objects.append(' <object id="{}" name="blocker" type="blocker" x="{}" y="{}" width="{}" height="{}"/>'.format(
+            object_id, blocker.x, blocker.y, blocker.width, blocker.height))
+        object_id += 1
+
+    #npcs, using a few npc definitions each
+    npc_info = OrderedDict()
+    for number, sprite in enumerate(NPC_SPRITES, 1):
+        npc_info['{:04}'.format(number)] = {'name': 'Villager {}'.format(number),
+                                            'image_src': sprite,
+                                            'direction': NPC_DIRECTIONS[number % len(NPC_DIRECTIONS)],
+                                            'lines': ['Hello.', 'I am here to be counted.']}
+    npc_ids = list(npc_info)
+    for _ in range(npc_count):
+        objects.append(' <object id="{}" name="npc" type="{}" x="{}" y="{}" width="30" height="30"/>'.format(
+            object_id, rng.choice(npc_ids), rng.randrange(pixel_width - TILE_SIZE), rng.randrange(pixel_height - TILE_SIZE)))
+        object_id += 1
+
+    objects.append(' <object id="{}" name="player" type="player" x="{}" y="{}" width="{}" height="{}"/>'.format(
+        object_id, *player))
+
+    tileset = os.path.abspath(TILESET)
+    tmx = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<map version="1.0" orientation="orthogonal" renderorder="right-down" width="{width}" height="{height}" '
+           'tilewidth="{tile}" tileheight="{tile}" nextobjectid="{next_id}">\n'
+           ' <tileset firstgid="1" name="grass" tilewidth="{tile}" tileheight="{tile}" tilecount="72" columns="12">\n'
+           '  <image source="{tileset}" width="{tileset_width}" height="{tileset_height}"/>\n'
+           ' </tileset>\n'
+           ' <layer name="Background" width="{width}" height="{height}">\n'
+           '  <data encoding="csv">\n{ground}\n</data>\n'
+           ' </layer>\n'
+           ' <objectgroup name="Objects">\n{objects}\n </objectgroup>\n'
+           '</map>\n').format(width=width, height=height, tile=TILE_SIZE, next_id=object_id + 1, tileset=tileset,
+                              tileset_width=TILESET_SIZE[0], tileset_height=TILESET_SIZE[1],
+                              ground=ground_csv, objects='\n'.join(objects))
+
+    filename = os.path.abspath(os.path.join(directory, name + '.tmx'))
+    with open(filename, 'w') as tmx_file:
+        tmx_file.write(tmx)
+    with open(filename[:-4] + '_npcs.json', 'w') as npc_file:
+        json.dump(npc_info, npc_file, indent=4)
+
+    return filename
+
+
+def peak_memory():
+    """
+    :rtype: peak resident memory of this process in bytes, or None where it can not be measured
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #linux reports kilobytes, mac os bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def time_stats(times):
+    """
+    :param: times, array of times in seconds
+    :rtype: dictionary of the p50/p95/p99/mean/max times in seconds
+    """
+    p50, p95, p99 = numpy.percentile(times, (50, 95, 99))
+    return OrderedDict((('p50', float(p50)), ('p95', float(p95)), ('p99', float(p99)),
+                        ('mean', float(times.mean())), ('max', float(times.max()))))
+
+
+class WalkingKeys(object):
+    """
+    Keyboard state of a walk that stops every 'turn' frames and then goes on in a new direction,
+    so the camera spends time both scrolling over the map and standing still
+    """
+    def __init__(self, turn=60):
+        self.turn = turn
+        self.frame = 0
+
+    def __getitem__(self, key):
+        walk = (pygame.K_RIGHT, None, pygame.K_DOWN, None, pygame.K_LEFT, None, pygame.K_UP, None)
+        return key == walk[(self.frame // self.turn) % len(walk)]
+
+
+def benchmark_map(filename, frames=FRAMES, dirty_rendering=False, chunk_size=None):
+    """
+    Load a map and time its frames.  Meant to run in a process of its own, so the peak memory is the map's
+
+    :param: filename, absolute path to a .tmx map
+    :param: frames, number of frames to time
+    :param: dirty_rendering, True to only redraw what changed while the camera stands still
+    :param: chunk_size, tiles on a side of the map's chunks, or None to load the whole map
+    :rtype: dictionary of load time, update/draw times, profiled phase times (seconds) and peak memory (bytes)
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    surface = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+    import overworld
+
+    start = time.perf_counter()
+    game = overworld.Overworld(filename, screensize=(SCREEN_WIDTH, SCREEN_HEIGHT), profile=True,
+                               dirty_rendering=dirty_rendering, chunk_size=chunk_size)
+    load_time = time.perf_counter() - start
+
+    keyboard = WalkingKeys()
+    update_times = numpy.zeros(frames)
+    draw_times = numpy.zeros(frames)
+    for frame in range(frames):
+        keyboard.frame = frame
+
+        start = time.perf_counter()
+        game.handle_movement(keyboard)
+        game.update(FRAME_TIME)
+        middle = time.perf_counter()
+        game.draw(surface)
+        end = time.perf_counter()
+
+        update_times[frame] = middle - start
+        draw_times[frame] = end - middle
+
+    game.map_loader.shutdown()
+
+    return OrderedDict((('load', load_time),
+                        ('update', time_stats(update_times)),
+                        ('draw', time_stats(draw_times)),
+                        ('phases', OrderedDict((phase, stats['p50'])
+                                               for phase, stats in game.profiler.summary().items())),
+                        ('peak_memory', peak_memory())))
+
+
+def benchmark_scales(scales, frames=FRAMES, compile_maps=False, dirty_rendering=False, directory=None, chunk_size=None):
+    """
+    Generate a map for each scale and benchmark it in a new process
+
+    :param: scales, list of (name, width, height, blockers, npcs)
+    :param: frames, number of frames to time per map
+    :param: compile_maps, True to load the maps from compiled bundles
+    :param: dirty_rendering, True to only redraw what changed while the camera stands still
+    :param: directory, folder to keep the generated maps in, or None to use a temporary folder
+    :param: chunk_size, tiles on a side of the maps' chunks, or None to load whole maps
+    :rtype: dictionary of {scale name: results}
+    """
+    folder = directory or tempfile.mkdtemp(prefix='benchmark')
+    results = OrderedDict()
+
+    try:
+        for name, width, height, blocker_count, npc_count in scales:
+            filename = make_map(folder, name, width, height, blocker_count, npc_count)
+
+            if compile_maps:
+                import pytmx
+                import mapbundle
+                mapbundle.compile_map(pytmx.TiledMap(filename), mapbundle.get_bundle_name(filename),
+                                      filename[:-4] + '_npcs.json')
+
+            command = [sys.executable, os.path.abspath(__file__), '--run', filename, '--frames', str(frames)]
+            if dirty_rendering:
+                command.append('--dirty')
+            if chunk_size:
+                command.extend(('--chunk-size', str(chunk_size)))
+            output = subprocess.check_output(command,
+                                             cwd=os.path.dirname(os.path.abspath(__file__)),
+                                             stderr=subprocess.DEVNULL)
+
+            result = OrderedDict((('width', width), ('height', height),
+                                  ('blockers', blocker_count), ('npcs', npc_count)))
+            result.update(json.loads(output.decode().splitlines()[-1], object_pairs_hook=OrderedDict))
+            results[name] = result
+    finally:
+        if directory is None:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    return results
+
+
+def benchmark_collisions():
+    """
+    Time blocker collision checks against a flat list (Rect.collidelist) and a spatial hash
+
+    :rtype: list of (object count, list seconds per check, spatial hash seconds per check)
+    """
+    results = list()
+
+    for object_count in OBJECT_COUNTS:
+        blockers, feet = make_world(object_count)
+
+        index = spatialhash.SpatialHash(TILE_SIZE)
+        for blocker in blockers:
+            index.add(blocker)
+
+        flat = min(timeit.repeat(lambda: [rect.collidelist(blockers) for rect in feet], number=1, repeat=3))
+        hashed = min(timeit.repeat(lambda: [index.collideany(rect) for rect in feet], number=1, repeat=3))
+
+        results.append((object_count, flat / QUERIES, hashed / QUERIES))
+
+    return results
+
+
+def get_commit():
+    """
+    :rtype: short hash of the checked out git commit, or None
+    """
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+def compare(results, baseline):
+    """
+    Print the change of every measurement from a baseline run
+
+    :param: results, results of this run
+    :param: baseline, results of an earlier run
+    """
+    print('\ncompared to {} ({})'.format(baseline.get('commit'), baseline.get('date')))
+    print('{:<8} {:<12} {:>12} {:>12} {:>8}'.format('scale', 'measure', 'baseline', 'now', 'change'))
+
+    for name, result in results['scales'].items():
+        old = baseline.get('scales', {}).get(name)
+        if old is None:
+            continue
+
+        measures = (('load', old['load'], result['load']),
+                    ('update p50', old['update']['p50'], result['update']['p50']),
+                    ('update p95', old['update']['p95'], result['update']['p95']),
+                    ('draw p50', old['draw']['p50'], result['draw']['p50']),
+                    ('draw p95', old['draw']['p95'], result['draw']['p95']),
+                    ('peak MB', (old['peak_memory'] or 0) / 2.**20, (result['peak_memory'] or 0) / 2.**20))
+        for measure, before, now in measures:
+            change = '{:+.1f}%'.format((now - before) / before * 100) if before else '-'
+            print('{:<8} {:<12} {:>12.6f} {:>12.6f} {:>8}'.format(name, measure, before, now, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the overworld on synthetic maps')
+    parser.add_argument('--scales', default=','.join(scale[0] for scale in SCALES),
+                        help='comma separated scales to run: ' + ', '.join(scale[0] for scale in SCALES))
+    parser.add_argument('--frames', type=int, default=FRAMES, help='frames timed per scale')
+    parser.add_argument('--compile', action='store_true', help='load the maps from compiled bundles')
+    parser.add_argument('--dirty', action='store_true', help='only redraw what changed while the camera stands still')
+    parser.add_argument('--chunk-size', type=int, help='stream the maps in chunks this many tiles wide')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='json results of an earlier run to compare with')
+    parser.add_argument('--keep-maps', help='generate the maps in this folder and keep them')
+    parser.add_argument('--run', help=argparse.SUPPRESS) #benchmark one map in this process
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(benchmark_map(args.run, args.frames, args.dirty, args.chunk_size)))
+        return
+
+    names = args.scales.split(',')
+    scales = [scale for scale in SCALES if scale[0] in names]
+
+    results = OrderedDict((('commit', get_commit()),
+                           ('date', time.strftime('%Y-%m-%d %H:%M:%S')),
+                           ('python', platform.python_version()),
+                           ('pygame', pygame.version.ver),
+                           ('frames', args.frames),
+                           ('compiled', args.compile),
+                           ('dirty', args.dirty),
+                           ('chunk_size', args.chunk_size)))
+
+    if args.keep_maps:
+        os.makedirs(args.keep_maps, exist_ok=True)
+    results['scales'] = benchmark_scales(scales, args.frames, args.compile, args.dirty, args.keep_maps,
+                                          args.chunk_size)
+
+    print('{:<8} {:>11} {:>8} {:>6} {:>9} {:>12} {:>12} {:>12} {:>12} {:>9}'.format(
+        'scale', 'tiles', 'blockers', 'npcs', 'load (s)', 'update p50', 'update p95', 'draw p50', 'draw p95', 'peak MB'))
+    for name, result in results['scales'].items():
+        print('{:<8} {:>11} {:>8} {:>6} {:>9.3f} {:>10.1f}us {:>10.1f}us {:>10.1f}us {:>10.1f}us {:>9.1f}'.format(
+            name, '{}x{}'.format(result['width'], result['height']), result['blockers'], result['npcs'], result['load'],
+            result['update']['p50'] * 1e6, result['update']['p95'] * 1e6,
+            result['draw']['p50'] * 1e6, result['draw']['p95'] * 1e6, (result['peak_memory'] or 0) / 2.**20))
+
+    results['collisions'] = [OrderedDict((('objects', object_count), ('list', flat), ('hash', hashed)))
+                             for object_count, flat, hashed in benchmark_collisions()]
+
+    print('\n{:>10} {:>16} {:>16}'.format('objects', 'list (us/check)', 'hash (us/check)'))
+    for collision in results['collisions']:
+        print('{:>10} {:>16.2f} {:>16.2f}'.format(collision['objects'], collision['list'] * 1e6, collision['hash'] * 1e6))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(results, json.load(baseline_file, object_pairs_hook=OrderedDict))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import numpy
+
+CELL_SIZE = 32 #pixels.  about the size of the biggest rects looked at, so each rect is in a few cells at most
+
+
+def overlapping(first, second):
+    """
+    :param: first, second, arrays of (x, y, width, height) rects
+    :rtype: boolean array, True where the rects overlap.  rects that only touch do not overlap, like pygame's
+    """
+    return ((first[:, 0] < second[:, 0] + second[:, 2]) & (second[:, 0] < first[:, 0] + first[:, 2]) &
+            (first[:, 1] < second[:, 1] + second[:, 3]) & (second[:, 1] < first[:, 1] + first[:, 3]))
+
+
+class Broadphase(object):
+    """
+    BROADPHASE
+    Finds the pairs of overlapping rects among many moving rects, e.g. the feet of every active NPC, without testing
+    every rect against every other one.  The rects are put into the cells of a uniform grid they overlap, and only
+    rects sharing a cell are tested.  The grid is rebuilt with NumPy on every call, which costs about as much as
+    sorting the rects, so it does not matter how far they moved since the last call.
+
+    -pairs(rects, margin) - (first, second) arrays of the indexes of the rects that overlap, first < second.  Each
+     pair is found once, in the cell the top left corner of the overlap is in
+    """
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+
+    def pairs(self, rects, margin=0):
+        """
+        :param: rects, array of (x, y, width, height) rects
+        :param: margin, pixels to grow every rect by on each side, e.g. to find rects that are close without
+                overlapping
+        :rtype: (first, second) arrays of the indexes of the overlapping rects
+        """
+        rects = numpy.asarray(rects, dtype=float).reshape(-1, 4)
+        if margin:
+            rects = rects + (-margin, -margin, 2 * margin, 2 * margin)
+        count = len(rects)
+        size = self.cell_size
+
+        #the cells every rect overlaps.  an empty rect still belongs to the cell its corner is in
+        left = numpy.floor(rects[:, 0] / size).astype(numpy.int64)
+        top = numpy.floor(rects[:, 1] / size).astype(numpy.int64)
+        columns = numpy.maximum(numpy.ceil((rects[:, 0] + rects[:, 2]) / size).astype(numpy.int64) - left, 1)
+        rows = numpy.maximum(numpy.ceil((rects[:, 1] + rects[:, 3]) / size).astype(numpy.int64) - top, 1)
+
+        #one entry for each (rect, cell), numbered row by row within each rect
+        cells = columns * rows
+        owners = numpy.repeat(numpy.arange(count), cells)
+        offsets = numpy.arange(len(owners)) - numpy.repeat(numpy.cumsum(cells) - cells, cells)
+        cell_x = left[owners] + offsets % columns[owners]
+        cell_y = top[owners] + offsets // columns[owners]
+
+        #sort the entries by cell, so the entries of a cell are next to each other
+        keys = (cell_y - cell_y.min(initial=0)) * (cell_x.max(initial=0) - cell_x.min(initial=0) + 1) + cell_x
+        order = numpy.argsort(keys)
+        keys, owners = keys[order], owners[order]
+        cell_x, cell_y = cell_x[order], cell_y[order]
+
+        #every entry against the entries after it in the same cell
+        starts = numpy.flatnonzero(numpy.diff(keys, prepend=keys[:1] - 1))
+        sizes = numpy.diff(numpy.append(starts, len(keys)))
+        after = numpy.repeat(starts + sizes, sizes) - numpy.arange(len(keys)) - 1
+        first = numpy.repeat(numpy.arange(len(keys)), after)
+        second = numpy.arange(len(first)) - numpy.repeat(numpy.cumsum(after) - after, after) + first + 1
+
+        cell_x, cell_y = cell_x[first], cell_y[first]
+        first, second = owners[first], owners[second]
+        a, b = rects[first], rects[second]
+        corner_x = numpy.floor(numpy.maximum(a[:, 0], b[:, 0]) / size)
+        corner_y = numpy.floor(numpy.maximum(a[:, 1], b[:, 1]) / size)
+        found = overlapping(a, b) & (corner_x == cell_x) & (corner_y == cell_y)
+
+        return numpy.minimum(first, second)[found], numpy.maximum(first, second)[found]
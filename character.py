@@ -1,6 +1,9 @@
 import os.path
+import weakref
+
 import pygame.sprite
-import pyganim
+
+import spritesheets
 
 IMAGE_DISPLAY_TIME = 100
 
@@ -10,11 +13,48 @@ LEFT = 'left'
 RIGHT = 'right'
 
 
+#sprite sheet layout.  every character sheet is 4 rows of 8 frames
+SHEET_ROWS = 4
+SHEET_COLS = 8
+
+#frames (indexes into the sprite sheet) of the walking animations, in the order they are displayed
+WALKING_ANIMATIONS = {UP: (2, 1, 0, 2, 3, 4),
+                      DOWN: (10, 9, 8, 10, 11, 12),
+                      RIGHT: (16, 17, 18, 16, 21, 22),
+                      LEFT: (24, 25, 26, 24, 29, 30)}
+
+
 # make loading images a little easier
 def get_image_location(filename):
     return os.path.join('data', 'npcs', 'sprites', filename)
 
 
+def load_sprite_sheet(sprite, filename, deferred=False):
+    """
+    Get a character sprite sheet from the shared sprite atlas.
+    The sheet's reference is dropped when the sprite is garbage collected
+    
+    :param: sprite, the sprite that will use the sheet
+    :param: filename, name of the sprite sheet image in the sprites folder
+    :param: deferred, True to use a blank sheet until the image is loaded in the background
+    :rtype: spritesheets.SpriteSheet
+    """
+    sprite_sheet = spritesheets.ATLAS.acquire(get_image_location(filename), SHEET_ROWS, SHEET_COLS, deferred)
+    weakref.finalize(sprite, spritesheets.ATLAS.release, sprite_sheet)
+    return sprite_sheet
+
+
+def load_walking_animations(sprite_sheet):
+    """
+    Get the walking animations for a sprite.  The animations are the shared frames of the sprite sheet,
+    the playback state belongs to the sprite
+    
+    :param: sprite_sheet, spritesheets.SpriteSheet
+    :rtype: dictionary of {direction: tuple of frames}
+    """
+    return sprite_sheet.get_animation_set(WALKING_ANIMATIONS)
+
+
 class Character(pygame.sprite.Sprite):
     """
     CHARACTER
@@ -39,8 +79,9 @@ class Character(pygame.sprite.Sprite):
     def __init__(self):
         pygame.sprite.Sprite.__init__(self)
         
-        sprite_sheet = get_image_location('male_sprite_model.png')
-        animation_images = pyganim.getImagesFromSpriteSheet(sprite_sheet, rows=4, cols=8)
+        #get the individual frames from the character's sprite sheet.  frames are shared with every sprite using the same sheet
+        self.sprite_sheet = load_sprite_sheet(self, 'male_sprite_model.png')
+        animation_images = self.sprite_sheet.frames
 
         self.image = animation_images[10]
         self.velocity = [0, 0]
@@ -51,51 +92,17 @@ class Character(pygame.sprite.Sprite):
         
         self.direction = DOWN
         
-        #get the individual frames from the character's sprite sheet
-        
-        #create the animations for walking up/down/left/right.  zips a list of the images in order and the time each image is displayed
-        walking_up_images = list(zip([animation_images[2],
-                                           animation_images[1],
-                                           animation_images[0],
-                                           animation_images[2],
-                                           animation_images[3],
-                                           animation_images[4]], [IMAGE_DISPLAY_TIME]*6))
-        
-        walking_down_images = list(zip([animation_images[10],
-                                            animation_images[9],
-                                            animation_images[8],
-                                            animation_images[10],
-                                            animation_images[11],
-                                            animation_images[12]], [IMAGE_DISPLAY_TIME]*6))
-        
-        walking_right_images = list(zip([animation_images[16],
-                                             animation_images[17],
-                                             animation_images[18],
-                                             animation_images[16],
-                                             animation_images[21],
-                                             animation_images[22]], [IMAGE_DISPLAY_TIME]*6))
-        
-        walking_left_images = list(zip([animation_images[24],
-                                            animation_images[25],
-                                            animation_images[26],
-                                            animation_images[24],
-                                            animation_images[29],
-                                            animation_images[30]], [IMAGE_DISPLAY_TIME]*6))
-        
-        walking_up_animation = pyganim.PygAnimation(walking_up_images)
-        walking_down_animation = pyganim.PygAnimation(walking_down_images)
-        walking_left_animation = pyganim.PygAnimation(walking_left_images)
-        walking_right_animation = pyganim.PygAnimation(walking_right_images)
+        #create the animations for walking up/down/left/right
+        self.movement_directions = load_walking_animations(self.sprite_sheet)
         
-        self.movement_directions = {UP:walking_up_animation,
-                              DOWN:walking_down_animation,
-                              LEFT:walking_left_animation,
-                              RIGHT:walking_right_animation}
-        
-        self.move_conductor = pyganim.PygConductor(self.movement_directions)
-        self.move_conductor.convert_alpha()
+        #stand facing the starting direction.  the frame is only picked again when the frame or direction changes
+        self.image = self.movement_directions[self.direction][0]
         
+        #animation playback state.  'animation_time' is how far (in seconds) into the walking animation the sprite is
         self.paused = True
+        self.animation_time = 0
+        self.frame_number = 0
+        self.frame_direction = self.direction
         
     @property
     def position(self):
@@ -103,11 +110,13 @@ class Character(pygame.sprite.Sprite):
 
     @position.setter
     def position(self, value):
+        #placing the sprite also moves its old position, so it is not drawn between the two places
         self._position = list(value)
+        self._old_position = list(value)
 
     def update(self, dt):
         #update the sprite movement animation
-        self.update_animation()
+        self.update_animation(dt)
         
         #change the position of the sprite
         self._old_position = self._position[:]
@@ -124,34 +133,29 @@ class Character(pygame.sprite.Sprite):
         self.rect.topleft = self._position
         self.feet.midbottom = self.rect.midbottom
         
-    def update_animation(self):
+    def update_animation(self, dt=0):
         """
-        updates the current frame of the sprite animation.  
-        if not currently moving, sets the image to standing still facing last direction of movement
+        updates the current frame of the sprite animation from how long the sprite has been walking.
+        if not currently moving, sets the image to standing still facing last direction of movement.
+        'image' points at the shared frame, nothing is drawn or allocated
+        
+        :param: dt, the length of time (in seconds) since last updated
         """
-        temp_surface = pygame.Surface((self.image.get_width(), self.image.get_height()), pygame.SRCALPHA, 32)
-        temp_surface.convert_alpha()
+        frames = self.movement_directions[self.direction]
         
         if not self.paused:
-            if self.direction == UP:
-                self.movement_directions[UP].blit(temp_surface)
-            elif self.direction == DOWN:
-                self.movement_directions[DOWN].blit(temp_surface)
-            elif self.direction == LEFT:
-                self.movement_directions[LEFT].blit(temp_surface)
-            elif self.direction == RIGHT:
-                self.movement_directions[RIGHT].blit(temp_surface)
+            self.animation_time = (self.animation_time + dt) % (len(frames) * IMAGE_DISPLAY_TIME / 1000.)
+            frame_number = int(self.animation_time * 1000 // IMAGE_DISPLAY_TIME) % len(frames)
         else:
-            if self.direction == UP:
-                temp_surface.blit(self.movement_directions[UP].getFrame(0), (0, 0))
-            elif self.direction == DOWN:
-                temp_surface.blit(self.movement_directions[DOWN].getFrame(0), (0, 0))
-            elif self.direction == LEFT:
-                temp_surface.blit(self.movement_directions[LEFT].getFrame(0), (0, 0))
-            elif self.direction == RIGHT:
-                temp_surface.blit(self.movement_directions[RIGHT].getFrame(0), (0, 0))
-                
-        self.image = temp_surface
+            frame_number = 0
+        
+        #nothing to do if still showing the same frame
+        if frame_number == self.frame_number and self.direction == self.frame_direction:
+            return
+        
+        self.frame_number = frame_number
+        self.frame_direction = self.direction
+        self.image = frames[frame_number]
         
 class NPC(pygame.sprite.Sprite):
     """
@@ -172,6 +176,8 @@ class NPC(pygame.sprite.Sprite):
     collides with level walls.
     
     -The 'position' list is used for positioning the sprite
+    
+    -NPCs are moved and animated by npcpopulation.NPCPopulation, which writes their state back to the sprite
     """
 
     def __init__(self, NPC_info):
@@ -188,11 +194,10 @@ class NPC(pygame.sprite.Sprite):
         #set the NPC's name (does not have to be unique)
         self._name = NPC_info['name']
         
-        #load sprite sheet
-        sprite_sheet = get_image_location(NPC_info['image_src'])
-        
-        #get individual frames from sprite sheet
-        animation_images = pyganim.getImagesFromSpriteSheet(sprite_sheet, rows=4, cols=8)
+        #load sprite sheet and get individual frames from it.  frames are shared with every sprite using the same sheet
+        #the sheet is loaded in the background, the NPC is invisible until it is ready
+        self.sprite_sheet = load_sprite_sheet(self, NPC_info['image_src'], deferred=True)
+        animation_images = self.sprite_sheet.frames
 
         #set default image and create collision and position rects
         self.image = animation_images[10]
@@ -210,52 +215,17 @@ class NPC(pygame.sprite.Sprite):
             
         self.velocity = [0, 0]
 
+        #create the animations for walking up/down/left/right
+        self.movement_directions = load_walking_animations(self.sprite_sheet)
         
-        
-        #create the animations for walking up/down/left/right.  zips a list of the images in order and the time each image is displayed
-        walking_up_images = list(zip([animation_images[2],
-                                           animation_images[1],
-                                           animation_images[0],
-                                           animation_images[2],
-                                           animation_images[3],
-                                           animation_images[4]], [IMAGE_DISPLAY_TIME]*6))
-        
-        walking_down_images = list(zip([animation_images[10],
-                                            animation_images[9],
-                                            animation_images[8],
-                                            animation_images[10],
-                                            animation_images[11],
-                                            animation_images[12]], [IMAGE_DISPLAY_TIME]*6))
-        
-        walking_right_images = list(zip([animation_images[16],
-                                             animation_images[17],
-                                             animation_images[18],
-                                             animation_images[16],
-                                             animation_images[21],
-                                             animation_images[22]], [IMAGE_DISPLAY_TIME]*6))
-        
-        walking_left_images = list(zip([animation_images[24],
-                                            animation_images[25],
-                                            animation_images[26],
-                                            animation_images[24],
-                                            animation_images[29],
-                                            animation_images[30]], [IMAGE_DISPLAY_TIME]*6))
-        
-        walking_up_animation = pyganim.PygAnimation(walking_up_images)
-        walking_down_animation = pyganim.PygAnimation(walking_down_images)
-        walking_left_animation = pyganim.PygAnimation(walking_left_images)
-        walking_right_animation = pyganim.PygAnimation(walking_right_images)
-        
-        self.movement_directions = {UP:walking_up_animation,
-                                    DOWN:walking_down_animation,
-                                    LEFT:walking_left_animation,
-                                    RIGHT:walking_right_animation}
-        
-        self.move_conductor = pyganim.PygConductor(self.movement_directions)
-        self.move_conductor.convert_alpha()
+        #stand facing the starting direction.  the frame is only picked again when the frame or direction changes
+        self.image = self.movement_directions[self.direction][0]
         
         #initialize movement and animation info
         self.paused = True
+        self.animation_time = 0
+        self.frame_number = 0
+        self.frame_direction = self.direction
         self.moving_up = self.moving_down = self.moving_left = self.moving_right = False
         
         try:
@@ -283,66 +253,6 @@ class NPC(pygame.sprite.Sprite):
 
     @position.setter
     def position(self, value):
+        #placing the sprite also moves its old position, so it is not drawn between the two places
         self._position = list(value)
-
-    def update(self, dt):
-        #update the sprite movement animation
-        self.update_animation()
-        
-        if self.moving_up:
-            self.velocity[1] = -100
-            self.paused = False
-            self.move_conductor.play()
-        elif self.moving_down:
-            self.velocity[1] = 100
-            self.paused = False
-            self.move_conductor.play()
-        elif self.moving_left:
-            self.velocity[0] = -100
-            self.paused = False
-            self.move_conductor.play()
-        elif self.moving_right:
-            self.velocity[0] = 100
-            self.paused = False
-            self.move_conductor.play()
-        else:
-            self.velocity = [0, 0]
-            self.paused = True
-            self.move_conductor.pause()
-            
-        #change the position of the sprite
-        self._old_position = self._position[:]
-        self._position[0] += self.velocity[0] * dt
-        self._position[1] += self.velocity[1] * dt
-        self.rect.topleft = [self._position[0], self._position[1]]
-        self.feet.midbottom = self.rect.midbottom
-
-        
-    def update_animation(self):
-        """
-        updates the current frame of the sprite animation.  
-        if not currently moving, sets the image to standing still facing last direction of movement
-        """
-        temp_surface = pygame.Surface((self.image.get_width(), self.image.get_height()), pygame.SRCALPHA, 32)
-        temp_surface.convert_alpha()
-        
-        if not self.paused:
-            if self.direction == UP:
-                self.movement_directions[UP].blit(temp_surface)
-            elif self.direction == DOWN:
-                self.movement_directions[DOWN].blit(temp_surface)
-            elif self.direction == LEFT:
-                self.movement_directions[LEFT].blit(temp_surface)
-            elif self.direction == RIGHT:
-                self.movement_directions[RIGHT].blit(temp_surface)
-        else:
-            if self.direction == UP:
-                temp_surface.blit(self.movement_directions[UP].getFrame(0), (0, 0))
-            elif self.direction == DOWN:
-                temp_surface.blit(self.movement_directions[DOWN].getFrame(0), (0, 0))
-            elif self.direction == LEFT:
-                temp_surface.blit(self.movement_directions[LEFT].getFrame(0), (0, 0))
-            elif self.direction == RIGHT:
-                temp_surface.blit(self.movement_directions[RIGHT].getFrame(0), (0, 0))
-                
-        self.image = temp_surface
\ No newline at end of file
+        self._old_position = list(value)
@@ -0,0 +1,395 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+import collisionmap
+import npcpopulation
+import npcstore
+import spatialhash
+import worldobjects
+
+CHUNK_SIZE = 32 #tiles on a side of a chunk
+LOAD_RADIUS = 1 #chunks around the player that must be loaded before the player can move on
+PRELOAD_RADIUS = 2 #chunks around the player loaded in the background
+MAX_CHUNK_BYTES = 64 * 1024 * 1024 #estimated memory kept by loaded chunks before far away ones are dropped
+
+#rough memory use (in bytes) of a loaded world object and npc, for the memory budget
+OBJECT_BYTES = 400
+NPC_BYTES = 2000
+
+#world objects streamed with the chunks.  the player's starting position is kept for the whole map
+OBJECT_KINDS = ('blocker', 'portal', 'sign', 'item', 'npc')
+
+
+class ObjectTable(object):
+    """
+    OBJECT TABLE
+    One kind of world object of a map, sorted by the chunks they overlap.
+
+    -indexes(key) - the objects in a chunk, as indexes into 'rects' and 'values'.  Found with a binary search,
+     so looking up a chunk costs the same no matter how many objects the map has
+    -objects that overlap several chunks are listed in every one of them.  With 'spawn_only' objects are only
+     listed in the chunk their top left corner is in (npcs, which wander away from where they start anyway)
+    """
+    def __init__(self, rects, values, chunk_width, chunk_height, columns, rows, spawn_only=False):
+        self.rects = rects
+        self.values = values
+
+        boxes = numpy.asarray(rects, dtype=numpy.int64).reshape(-1, 4)
+        left = numpy.clip(boxes[:, 0] // chunk_width, 0, columns - 1)
+        top = numpy.clip(boxes[:, 1] // chunk_height, 0, rows - 1)
+        if spawn_only:
+            right, bottom = left, top
+        else:
+            right = numpy.clip((boxes[:, 0] + boxes[:, 2] - 1) // chunk_width, left, columns - 1)
+            bottom = numpy.clip((boxes[:, 1] + boxes[:, 3] - 1) // chunk_height, top, rows - 1)
+
+        #one (chunk, object) pair for every chunk an object overlaps
+        spans = right - left + 1
+        counts = spans * (bottom - top + 1)
+        objects = numpy.repeat(numpy.arange(len(boxes)), counts)
+        steps = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        keys = (top[objects] + steps // spans[objects]) * columns + left[objects] + steps % spans[objects]
+
+        order = numpy.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.objects = objects[order]
+
+    def indexes(self, key):
+        """
+        :param: key, number of the chunk (row * columns + column)
+        :rtype: array of the indexes of the objects in the chunk
+        """
+        start = numpy.searchsorted(self.keys, key, 'left')
+        end = numpy.searchsorted(self.keys, key, 'right')
+        return self.objects[start:end]
+
+
+class Chunk(object):
+    """
+    CHUNK
+    A square region of a map, built on the chunk worker thread.
+
+    -area - (x, y, width, height) of the chunk in tiles
+    -objects - dictionary of {object name: array of indexes into the map's object tables}
+    -collision_map - the chunk's blocking tiles, or None if the map only uses blocker objects
+    -size - estimate (in bytes) of the memory the chunk keeps loaded
+    """
+    def __init__(self, key, area, objects, collision_map=None):
+        self.key = key
+        self.area = area
+        self.objects = objects
+        self.collision_map = collision_map
+
+        self.size = sum(len(indexes) for kind, indexes in objects.items() if kind != 'npc') * OBJECT_BYTES
+        self.size += len(objects.get('npc', ())) * NPC_BYTES
+        if collision_map is not None:
+            self.size += len(collision_map.bits)
+
+
+class ChunkedCollisionMap(collisionmap.CollisionMap):
+    """
+    CHUNKED COLLISION MAP
+    Collision map of a whole map made of the collision maps of its loaded chunks.
+    Tiles of chunks that are not loaded never block, the same as tiles outside of the map
+    """
+    def __init__(self, width, height, tilewidth, tileheight, chunk_size):
+        self.width = width
+        self.height = height
+        self.tilewidth = tilewidth
+        self.tileheight = tileheight
+        self.chunk_size = chunk_size
+        self.columns = -(-width // chunk_size)
+        self.maps = dict() #{chunk key: CollisionMap}
+
+    def __len__(self):
+        return sum(len(collision_map) for collision_map in self.maps.values())
+
+    def set_blocked(self, x, y, blocked=True):
+        collision_map = self.maps.get((y // self.chunk_size) * self.columns + x // self.chunk_size)
+        if collision_map is None or not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError('tile ({}, {}) is not loaded'.format(x, y))
+        collision_map.set_blocked(x, y, blocked)
+
+    def is_blocked(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+
+        collision_map = self.maps.get((y // self.chunk_size) * self.columns + x // self.chunk_size)
+        return collision_map is not None and collision_map.is_blocked(x, y)
+
+
+class ChunkedWorld(object):
+    """
+    CHUNKED WORLD
+    The world objects of a map too big to keep loaded at once.  The map is split into square chunks, and only
+    the chunks around the player have their blockers, portals, signs, items, npcs and blocking tiles loaded.
+
+    -update(position) - loads the chunks around a position (in pixels).  Chunks within 'load_radius' are waited for,
+     the ones within 'preload_radius' are built on a worker thread.  Chunks further away are dropped, least recently
+     needed first, once the loaded chunks are estimated to use more than 'max_bytes'.
+     returns True if any chunk was loaded or dropped
+    -blockers/portals/signs/items/npcs, their spatial indexes, 'collision_map' and 'npc_population' only hold the
+     objects of the loaded chunks, and are kept up to date in place so the overworld can share them
+    -npcs are loaded with the chunk they start in, but dropped with the chunk they stand in, so an npc that walked
+     into a chunk that is still loaded stays.  An npc still loaded is not loaded again with the chunk it started in
+    -tile layers are not split: the renderer only draws the tiles in view, and compiled maps keep their tile layers
+     memory mapped, so only the parts of them that were looked at are read from disk
+    """
+    def __init__(self, tmx_data, world_objects, npc_definitions, chunk_size=CHUNK_SIZE, collision_tiles=False,
+                 load_radius=LOAD_RADIUS, preload_radius=PRELOAD_RADIUS, max_bytes=MAX_CHUNK_BYTES):
+        self.tmx_data = tmx_data
+        self.npc_definitions = npc_definitions
+        self.chunk_size = chunk_size
+        self.load_radius = load_radius
+        self.preload_radius = max(load_radius, preload_radius)
+        self.max_bytes = max_bytes
+
+        self.columns = -(-tmx_data.width // chunk_size)
+        self.rows = -(-tmx_data.height // chunk_size)
+        self.chunk_width = chunk_size * tmx_data.tilewidth
+        self.chunk_height = chunk_size * tmx_data.tileheight
+
+        #the objects of the whole map, sorted by chunk
+        self.tables = dict()
+        for kind in OBJECT_KINDS:
+            rects, values = world_objects[kind]
+            self.tables[kind] = ObjectTable(rects, values, self.chunk_width, self.chunk_height,
+                                            self.columns, self.rows, spawn_only=kind == 'npc')
+
+        #the objects of the loaded chunks
+        cell_size = max(tmx_data.tilewidth, tmx_data.tileheight)
+        self.blockers = list()
+        self.portals = list()
+        self.signs = list()
+        self.items = list()
+        self.npcs = list()
+        self.blocker_index = spatialhash.SpatialHash(cell_size)
+        self.portal_index = spatialhash.SpatialHash(cell_size)
+        self.sign_index = spatialhash.SpatialHash(cell_size)
+        self.item_index = spatialhash.SpatialHash(cell_size)
+        self.npc_population = npcpopulation.NPCPopulation([])
+
+        self.lists = {'blocker': self.blockers, 'portal': self.portals, 'sign': self.signs, 'item': self.items,
+                      'npc': self.npcs}
+        self.indexes = {'blocker': self.blocker_index, 'portal': self.portal_index, 'sign': self.sign_index,
+                        'item': self.item_index}
+
+        #objects overlapping several chunks are loaded once.  {object name: {object index: [chunks using it, object]}}
+        self.loaded = {kind: dict() for kind in OBJECT_KINDS}
+
+        #blocking tiles, read from the map's layers a chunk at a time
+        if collision_tiles:
+            self.collision_layers = collisionmap.collision_layers(tmx_data)
+            self.collision_map = ChunkedCollisionMap(tmx_data.width, tmx_data.height,
+                                                     tmx_data.tilewidth, tmx_data.tileheight, chunk_size)
+        else:
+            self.collision_layers = None
+            self.collision_map = None
+
+        self.chunks = OrderedDict() #loaded chunks, least recently needed first
+        self.size = 0
+        self.center = None
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = dict() #{chunk key: future of the Chunk}
+
+    def chunk_at(self, position):
+        """
+        :param: position, (x, y) in pixels
+        :rtype: (column, row) of the chunk the position is in
+        """
+        column = min(max(int(position[0] // self.chunk_width), 0), self.columns - 1)
+        row = min(max(int(position[1] // self.chunk_height), 0), self.rows - 1)
+        return column, row
+
+    def chunks_around(self, center, radius):
+        """
+        :param: center, (column, row) of a chunk
+        :param: radius, chunks in every direction
+        :rtype: list of the keys of the chunks within 'radius' of the center, nearest first
+        """
+        column, row = center
+        around = [(max(abs(x - column), abs(y - row)), y * self.columns + x)
+                  for y in range(max(0, row - radius), min(self.rows, row + radius + 1))
+                  for x in range(max(0, column - radius), min(self.columns, column + radius + 1))]
+        return [key for _, key in sorted(around)]
+
+    def build_chunk(self, key):
+        """
+        Find the objects and blocking tiles of a chunk.  Runs on the worker thread
+
+        :param: key, number of the chunk (row * columns + column)
+        :rtype: Chunk
+        """
+        row, column = divmod(key, self.columns)
+        x = column * self.chunk_size
+        y = row * self.chunk_size
+        area = (x, y, min(self.chunk_size, self.tmx_data.width - x), min(self.chunk_size, self.tmx_data.height - y))
+
+        objects = {kind: table.indexes(key) for kind, table in self.tables.items()}
+
+        collision_map = None
+        if self.collision_layers is not None:
+            layers, blocking_gids = self.collision_layers
+            collision_map = collisionmap.CollisionMap.from_layers(layers, blocking_gids, self.tmx_data.tilewidth,
+                                                                  self.tmx_data.tileheight, area)
+
+        return Chunk(key, area, objects, collision_map)
+
+    def update(self, position):
+        """
+        Load the chunks around a position and drop far away chunks over the memory budget
+
+        :param: position, (x, y) in pixels, usually the player's
+        :rtype: True if any chunk was loaded or dropped
+        """
+        center = self.chunk_at(position)
+        if center == self.center and not self._pending:
+            return False
+        self.center = center
+
+        needed = self.chunks_around(center, self.load_radius)
+        wanted = self.chunks_around(center, self.preload_radius)
+
+        #start building the missing chunks, nearest first
+        for key in wanted:
+            if key not in self.chunks and key not in self._pending:
+                self._pending[key] = self._executor.submit(self.build_chunk, key)
+
+        #chunks the player can reach are waited for, the rest are taken once they are built
+        changed = False
+        wanted_keys = set(wanted)
+        for key in needed + list(self._pending):
+            future = self._pending.get(key)
+            if future is None:
+                continue
+            if key in needed or future.done():
+                del self._pending[key]
+                self.load_chunk(future.result())
+                changed = True
+            elif key not in wanted_keys and future.cancel():
+                del self._pending[key]
+
+        #the chunks around the player were needed last, the nearest ones most recently
+        for key in reversed(wanted):
+            if key in self.chunks:
+                self.chunks.move_to_end(key)
+
+        #drop the least recently needed chunks.  chunks around the player are kept, even over the budget
+        while self.size > self.max_bytes:
+            key = next(iter(self.chunks))
+            if key in wanted_keys:
+                break
+            self.drop_chunk(key)
+            changed = True
+
+        return changed
+
+    def load_chunk(self, chunk):
+        """
+        Add the objects and blocking tiles of a built chunk to the world
+
+        :param: chunk, Chunk
+        """
+        if chunk.key in self.chunks:
+            return
+
+        for kind, indexes in chunk.objects.items():
+            if kind == 'npc':
+                continue
+            table = self.tables[kind]
+            loaded = self.loaded[kind]
+            objects = self.lists[kind]
+            index = self.indexes.get(kind)
+
+            for number in indexes.tolist():
+                entry = loaded.get(number)
+                if entry is not None:
+                    entry[0] += 1
+                    continue
+
+                rect = table.rects[number].tolist()
+                world_object = worldobjects.make_world_object(kind, rect, table.values[number])
+                #objects keep the order they have in the map, so the same one wins when several collide
+                index.add(rect, world_object, order=number)
+
+                loaded[number] = [1, world_object]
+                objects.append(world_object)
+
+        #npcs are built by the chunk they start in, unless they are still loaded from before
+        table = self.tables['npc']
+        numbers = [number for number in chunk.objects['npc'].tolist() if number not in self.loaded['npc']]
+        new_npcs = npcstore.build_npcs(self.npc_definitions, table.rects[numbers].tolist(),
+                                       [table.values[number] for number in numbers], self.tmx_data.filename)
+        for number, npc in zip(numbers, new_npcs):
+            self.loaded['npc'][number] = [1, npc]
+        self.npcs.extend(new_npcs)
+        self.npc_population.add(new_npcs)
+        if chunk.collision_map is not None:
+            self.collision_map.maps[chunk.key] = chunk.collision_map
+
+        self.chunks[chunk.key] = chunk
+        self.size += chunk.size
+
+    def drop_chunk(self, key):
+        """
+        Remove the objects and blocking tiles of a chunk from the world, unless other loaded chunks share them
+
+        :param: key, number of the chunk
+        """
+        chunk = self.chunks.pop(key)
+        self.size -= chunk.size
+        if self.collision_map is not None:
+            self.collision_map.maps.pop(key, None)
+
+        self.drop_npcs()
+
+        for kind, indexes in chunk.objects.items():
+            if kind == 'npc':
+                continue
+            loaded = self.loaded[kind]
+            index = self.indexes.get(kind)
+
+            removed = list()
+            for number in indexes.tolist():
+                entry = loaded[number]
+                entry[0] -= 1
+                if entry[0] == 0:
+                    del loaded[number]
+                    removed.append(entry[1])
+            if not removed:
+                continue
+
+            for world_object in removed:
+                index.remove(world_object if kind == 'blocker' else world_object.position, world_object)
+
+            removed = set(map(id, removed))
+            objects = self.lists[kind]
+            objects[:] = [world_object for world_object in objects if id(world_object) not in removed]
+
+    def drop_npcs(self):
+        """
+        Remove the npcs that do not stand in a loaded chunk, wherever they started
+        """
+        population = self.npc_population
+        if not len(population):
+            return
+
+        feet = population.positions + population.feet_offsets
+        columns = numpy.clip(feet[:, 0] // self.chunk_width, 0, self.columns - 1).astype(numpy.int64)
+        rows = numpy.clip(feet[:, 1] // self.chunk_height, 0, self.rows - 1).astype(numpy.int64)
+        loaded_chunks = numpy.array(list(self.chunks), dtype=numpy.int64)
+        away = ~numpy.isin(rows * self.columns + columns, loaded_chunks)
+        if not away.any():
+            return
+
+        removed = [population.npcs[index] for index in numpy.flatnonzero(away).tolist()]
+        population.remove(removed)
+
+        removed = set(map(id, removed))
+        loaded = self.loaded['npc']
+        for number in [number for number, (_, npc) in loaded.items() if id(npc) in removed]:
+            del loaded[number]
+        self.npcs[:] = [npc for npc in self.npcs if id(npc) not in removed]
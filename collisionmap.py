@@ -0,0 +1,179 @@
+import numpy
+import pytmx
+
+import mapbundle
+
+COLLISION_LAYER = 'Collision' #every tile drawn on a tile layer with this name blocks movement
+BLOCKER_PROPERTY = 'blocker' #tiles with this property set to true in their tileset block movement on any layer
+
+
+def is_true(value):
+    """
+    Tiled stores untyped properties as strings
+
+    :rtype: True if a tile property value means true
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes')
+    return bool(value)
+
+
+def collision_layers(tmx_data, layer_name=COLLISION_LAYER):
+    """
+    Find the tiles of a map that block movement
+
+    :param: tmx_data, pytmx TiledMap or mapbundle.CompiledMap
+    :param: layer_name, name of the tile layer whose tiles all block movement
+    :rtype: (list of (2D gid array of a tile layer, True if every tile of the layer blocks), list of blocking gids)
+    """
+    blocking_gids = [gid for gid, properties in tmx_data.tile_properties.items()
+                     if is_true(properties.get(BLOCKER_PROPERTY, False))]
+
+    layers = list()
+    for layer in tmx_data.layers:
+        if not isinstance(layer, (pytmx.TiledTileLayer, mapbundle.TileLayer)):
+            continue
+
+        if layer.name == layer_name:
+            layers.append((numpy.asarray(layer.data), True))
+        elif blocking_gids:
+            layers.append((numpy.asarray(layer.data), False))
+
+    return layers, blocking_gids
+
+
+def blocking_tiles(layers, blocking_gids, area):
+    """
+    :param: layers, blocking_gids, the map's blocking tiles, from collision_layers()
+    :param: area, (x, y, width, height) in tiles of the part of the map to look at
+    :rtype: (height, width) NumPy array, True where a tile blocks movement
+    """
+    x, y, width, height = area
+    blocked = numpy.zeros((height, width), dtype=bool)
+
+    for data, blocks in layers:
+        data = data[y:y + height, x:x + width]
+        if blocks:
+            blocked |= data != 0
+        else:
+            blocked |= numpy.isin(data, blocking_gids)
+
+    return blocked
+
+
+class CollisionMap(object):
+    """
+    COLLISION MAP
+    Bit-packed passability grid of a tile map.  One bit per tile, set if the tile blocks movement.
+
+    -is_blocked(x, y) - whether the tile at column x, row y blocks movement
+    -collide_rect(rect) - whether any tile under a rect (in pixels) blocks movement.  Only the few tiles
+     under the rect are looked at, no matter how many blocking tiles the map has
+    -tiles outside of the map never block, the same as a map without blocker objects there
+    -a collision map can cover just part of a map.  'x' and 'y' are the column and row of its first tile
+    """
+    def __init__(self, width, height, tilewidth, tileheight, x=0, y=0):
+        self.width = width
+        self.height = height
+        self.tilewidth = tilewidth
+        self.tileheight = tileheight
+        self.x = x
+        self.y = y
+
+        self.row_bytes = (width + 7) // 8
+        self.bits = bytearray(self.row_bytes * height)
+
+    @classmethod
+    def from_grid(cls, blocked, tilewidth, tileheight, x=0, y=0):
+        """
+        Build a collision map from a grid of blocking tiles
+
+        :param: blocked, (height, width) NumPy array, true where a tile blocks movement
+        :param: tilewidth, tileheight, size of the tiles in pixels
+        :param: x, y, column and row of the map the grid starts at
+        :rtype: CollisionMap
+        """
+        height, width = blocked.shape
+        collision_map = cls(width, height, tilewidth, tileheight, x, y)
+        collision_map.bits[:] = numpy.packbits(blocked.astype(bool), axis=1, bitorder='little').tobytes()
+
+        return collision_map
+
+    @classmethod
+    def from_tmx(cls, tmx_data, layer_name=COLLISION_LAYER):
+        """
+        Build the collision map of a tmx map from its collision layer and from tiles with the blocker property
+
+        :param: tmx_data, pytmx TiledMap or mapbundle.CompiledMap
+        :param: layer_name, name of the tile layer whose tiles all block movement
+        :rtype: CollisionMap
+        """
+        layers, blocking_gids = collision_layers(tmx_data, layer_name)
+        return cls.from_layers(layers, blocking_gids, tmx_data.tilewidth, tmx_data.tileheight,
+                               (0, 0, tmx_data.width, tmx_data.height))
+
+    @classmethod
+    def from_layers(cls, layers, blocking_gids, tilewidth, tileheight, area):
+        """
+        Build the collision map of part of a map
+
+        :param: layers, blocking_gids, the map's blocking tiles, from collision_layers()
+        :param: tilewidth, tileheight, size of the tiles in pixels
+        :param: area, (x, y, width, height) in tiles of the part of the map to build
+        :rtype: CollisionMap
+        """
+        x, y, width, height = area
+        return cls.from_grid(blocking_tiles(layers, blocking_gids, area), tilewidth, tileheight, x, y)
+
+    def __len__(self):
+        """
+        :rtype: number of blocking tiles
+        """
+        return sum(bin(byte).count('1') for byte in self.bits)
+
+    def set_blocked(self, x, y, blocked=True):
+        """
+        Mark a tile as blocking movement or not
+
+        :param: x, y, column and row of the tile
+        :param: blocked, True if the tile blocks movement
+        """
+        if not (0 <= x - self.x < self.width and 0 <= y - self.y < self.height):
+            raise IndexError('tile ({}, {}) is outside of the map'.format(x, y))
+        x -= self.x
+        y -= self.y
+
+        index = y * self.row_bytes + (x >> 3)
+        if blocked:
+            self.bits[index] |= 1 << (x & 7)
+        else:
+            self.bits[index] &= ~(1 << (x & 7)) & 0xFF
+
+    def is_blocked(self, x, y):
+        """
+        :param: x, y, column and row of the tile
+        :rtype: True if the tile blocks movement
+        """
+        x -= self.x
+        y -= self.y
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+
+        return bool(self.bits[y * self.row_bytes + (x >> 3)] & (1 << (x & 7)))
+
+    def collide_rect(self, rect):
+        """
+        :param: rect, pygame Rect in map pixels
+        :rtype: True if any tile under the rect blocks movement
+        """
+        left = rect.left // self.tilewidth
+        top = rect.top // self.tileheight
+        right = max(left, (rect.right - 1) // self.tilewidth)
+        bottom = max(top, (rect.bottom - 1) // self.tileheight)
+
+        for y in range(top, bottom + 1):
+            for x in range(left, right + 1):
+                if self.is_blocked(x, y):
+                    return True
+
+        return False
@@ -0,0 +1,140 @@
+import math
+
+
+def pixel(value):
+    """
+    :rtype: the pixel a sprite at 'value' is drawn at.  pygame rounds positions given to a rect's attributes
+    """
+    return int(math.floor(value + .5))
+
+
+class CollisionResolver(object):
+    """
+    COLLISION RESOLVER
+    Moves collision rects through the world without letting them into blocker objects or blocking tiles.
+
+    -move(rect, position, dx, dy, obstacles) - moves a rect along x, then along y.  Each axis is swept over the whole
+     step, so a rect stops against the first thing in its way no matter how far it moves in one update, and a rect
+     that is blocked on one axis still slides along the other.  'obstacles' are rects that block it like blockers for
+     this move only, e.g. the feet of the npcs around the player
+    -move_sprite(sprite, obstacles) - moves a sprite from its old position towards its new one, colliding with its
+     'feet' rect
+    -only the blockers in the spatial index cells the sweep crosses and the tiles it crosses are looked at.
+     Things a rect already overlaps do not block it, so a rect placed inside a wall can walk out of it
+    """
+    def __init__(self, blocker_index, collision_map=None):
+        self.blocker_index = blocker_index
+        self.collision_map = collision_map
+
+    def move(self, rect, position, dx, dy, obstacles=()):
+        """
+        Move a rect as far as it can go
+
+        :param: rect, pygame Rect at 'position'.  moved in place
+        :param: position, (x, y) the rect's pixel position is rounded from
+        :param: dx, dy, distance to move in pixels
+        :param: obstacles, more pygame Rects the rect can not move into
+        :rtype: (x, y) position the rect was moved to
+        """
+        x, y = position
+
+        if dx:
+            dx = self.sweep(rect, dx, 0, obstacles)
+            rect.x += pixel(x + dx) - pixel(x)
+        if dy:
+            dy = self.sweep(rect, dy, 1, obstacles)
+            rect.y += pixel(y + dy) - pixel(y)
+
+        return x + dx, y + dy
+
+    def move_sprite(self, sprite, obstacles=()):
+        """
+        Move a sprite that moved from '_old_position' to '_position' only as far as its feet can go
+
+        :param: sprite, character.Character or character.NPC
+        :param: obstacles, more pygame Rects its feet can not move into
+        """
+        old_x, old_y = sprite._old_position[:2]
+        new_x, new_y = sprite._position[:2]
+        if new_x == old_x and new_y == old_y:
+            return
+
+        rect = sprite.rect.copy()
+        rect.topleft = (old_x, old_y)
+        feet = sprite.feet.copy()
+        feet.midbottom = rect.midbottom
+
+        position = self.move(feet, (old_x, old_y), new_x - old_x, new_y - old_y, obstacles)
+        if position != (new_x, new_y):
+            sprite._position = list(position)
+            sprite.rect.topleft = sprite._position
+            sprite.feet.midbottom = sprite.rect.midbottom
+
+    def sweep(self, rect, distance, axis, obstacles=()):
+        """
+        Find how far a rect can move along one axis
+
+        :param: rect, pygame Rect
+        :param: distance, pixels to move, negative to move left or up
+        :param: axis, 0 for x, 1 for y
+        :param: obstacles, more pygame Rects that block it
+        :rtype: the distance the rect can move, no further than 'distance'
+        """
+        #edges along the axis and across it
+        start, size = (rect.x, rect.width) if axis == 0 else (rect.y, rect.height)
+        side, breadth = (rect.y, rect.height) if axis == 0 else (rect.x, rect.width)
+        end = start + size
+
+        #every pixel the rect passes over
+        reach = int(math.ceil(distance)) if distance > 0 else int(math.floor(distance))
+        swept = rect.union(rect.move((reach, 0) if axis == 0 else (0, reach)))
+
+        blockers = self.blocker_index.query(swept)
+        if obstacles:
+            blockers += [obstacle for obstacle in obstacles if swept.colliderect(obstacle)]
+
+        for blocker in blockers:
+            near, far = (blocker.left, blocker.right) if axis == 0 else (blocker.top, blocker.bottom)
+            across, across_end = (blocker.top, blocker.bottom) if axis == 0 else (blocker.left, blocker.right)
+            if not (across < side + breadth and across_end > side):
+                continue
+            if distance > 0 and near >= end:
+                distance = min(distance, near - end)
+            elif distance < 0 and far <= start:
+                distance = max(distance, far - start)
+
+        if self.collision_map is not None:
+            distance = self.sweep_tiles(start, end, side, side + breadth, distance, axis)
+
+        return distance
+
+    def sweep_tiles(self, start, end, side, side_end, distance, axis):
+        """
+        Find how far a rect can move along one axis before it reaches a blocking tile.  Tiles are checked a row or
+        column at a time, nearest first
+
+        :param: start, end, edges of the rect along the axis
+        :param: side, side_end, edges of the rect across the axis
+        :param: distance, pixels to move
+        :param: axis, 0 for x, 1 for y
+        :rtype: the distance the rect can move, no further than 'distance'
+        """
+        collision_map = self.collision_map
+        size = collision_map.tilewidth if axis == 0 else collision_map.tileheight
+        across_size = collision_map.tileheight if axis == 0 else collision_map.tilewidth
+        across = range(side // across_size, (side_end - 1) // across_size + 1)
+        is_blocked = collision_map.is_blocked
+
+        #the tiles the rect already overlaps are skipped
+        if distance > 0:
+            lines = range((end - 1) // size + 1, (end - 1 + int(math.ceil(distance))) // size + 1)
+        else:
+            lines = range(start // size - 1, (start + int(math.floor(distance))) // size - 1, -1)
+
+        for line in lines:
+            if any(is_blocked(line, tile) if axis == 0 else is_blocked(tile, line) for tile in across):
+                if distance > 0:
+                    return min(distance, line * size - end)
+                return max(distance, (line + 1) * size - start)
+
+        return distance
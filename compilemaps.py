@@ -0,0 +1,57 @@
+#! /usr/bin/python3.5
+
+"""
+MAP COMPILER FOR MY 2D GAME ENGINE
+Compiles .tmx maps and their npc .json files into binary map bundles (.tmxb) next to the maps.
+The overworld loads a map from its bundle while the bundle is newer than the map, tileset and npc files,
+and falls back to the .tmx file otherwise.
+
+usage: python3 compilemaps.py [map.tmx ...]
+       compiles every map in data/maps if no maps are given
+"""
+
+import glob
+import os.path
+import sys
+
+import pytmx
+
+import mapbundle
+import overworld
+
+
+def compile_maps(mapfiles):
+    """
+    Compile maps into bundles
+
+    :param: mapfiles, names of .tmx map files in the maps folder
+    :rtype: number of maps that could not be compiled
+    """
+    failed = 0
+
+    for mapfile in mapfiles:
+        filename = overworld.get_map(mapfile)
+        bundle_filename = mapbundle.get_bundle_name(filename)
+
+        try:
+            tmx_data = pytmx.TiledMap(filename)
+            mapbundle.compile_map(tmx_data, bundle_filename, overworld.get_npc_file(mapfile))
+        except Exception as error:
+            print('{}: not compiled ({})'.format(mapfile, error))
+            failed += 1
+            continue
+
+        print('{}: {} bytes -> {}'.format(mapfile, os.path.getsize(bundle_filename), bundle_filename))
+
+    return failed
+
+
+def main():
+    mapfiles = sys.argv[1:]
+    if not mapfiles:
+        mapfiles = sorted(os.path.basename(filename) for filename in glob.glob(overworld.get_map('*.tmx')))
+
+    sys.exit(1 if compile_maps(mapfiles) else 0)
+
+if __name__ == '__main__':
+    main()
@@ -1,53 +1,199 @@
+from collections import OrderedDict
+
 import pygame
 from pygame.locals import *
 
-pygame.font.init()
+import textrender
 
-BASICFONT = pygame.font.Font('freesansbold.ttf', 16)
+#the font is loaded when the first dialog box is opened
+FONT_NAME = 'freesansbold.ttf'
+FONT_SIZE = 16
 
 WHITE = (255, 255, 255)
 BLACK = (  0,   0,   0)
 GREY  = (143, 143, 143)
 
 OFFSET = 4 #pixels
+TEXT_MARGIN = 8 #pixels between the border and the text
+
+MAX_CACHED_BOXES = 32 #finished dialog box pages kept rendered
 
-class Sign(object):
+
+class BoxCache(object):
     """
-    SIGN
-    Window displayed when the player reads a sign in the overworld.  Contains the message
+    BOX CACHE
+    Least recently used cache of finished dialog box pages, keyed by their text and size.
+    Opening the same sign again reuses its surfaces instead of drawing the box and text again
+
+    -get(key) - a cached surface, or None
+    -store(key, surface) - keeps a surface, evicting the least recently used ones past 'max_boxes'
     """
-    def __init__(self, message, width=0, height=0):
-        self.message = message
+    def __init__(self, max_boxes=MAX_CACHED_BOXES):
+        self.max_boxes = max_boxes
+        self._boxes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def get(self, key):
+        surface = self._boxes.get(key)
+        if surface is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._boxes.move_to_end(key)
+        return surface
+
+    def store(self, key, surface):
+        self._boxes[key] = surface
+        self._boxes.move_to_end(key)
+        while len(self._boxes) > self.max_boxes:
+            self._boxes.popitem(last=False)
+
+    def clear(self):
+        self._boxes.clear()
+
+BOXES = BoxCache()
+
+
+def build_background(width, height):
+    """
+    :rtype: Surface of an empty dialog box: a grey window with a black border
+    """
+    box_surface = BOXES.get(('background', width, height))
+    if box_surface is None:
+        box_surface = pygame.Surface((width, height))
+        box_surface.fill(BLACK)
+        box_surface.fill(GREY, (OFFSET, OFFSET, width-2*OFFSET, height-2*OFFSET))
+        BOXES.store(('background', width, height), box_surface)
+    return box_surface
+
+
+class DialogBox(object):
+    """
+    DIALOG BOX
+    Window of text displayed at the bottom of the overworld.  Each message is word wrapped to the width of the box
+    and split into as many pages as it needs.  Pages are drawn with a glyph atlas and cached when finished.
+
+    -reveal_speed - characters per second typed out onto the page, or None to show whole pages at once
+    -update(dt) - types out the page
+    -advance() - shows the rest of the page if it is still being typed, or else the next page.
+     returns False when there is no next page
+    -dirty - True when the box changed since it was last drawn
+    """
+    def __init__(self, messages, width=0, height=0, reveal_speed=None, atlas=None):
+        if atlas is None:
+            atlas = textrender.get_atlas(FONT_NAME, FONT_SIZE, WHITE)
+
         self.width = width
         self.height = height
-        
-        
-        self.sign_surface = self.build()
-        self.sign_rect = self.sign_surface.get_rect()
-        
+        self.reveal_speed = reveal_speed
+        self.atlas = atlas
+
+        #wrap and page the messages.  every message starts on a new page
+        text_width = width - 2*(OFFSET+TEXT_MARGIN)
+        lines_per_page = (height - 2*(OFFSET+TEXT_MARGIN)) // atlas.line_height
+        self.pages = list()
+        for message in messages:
+            self.pages.extend(textrender.paginate(atlas.wrap(message, text_width), lines_per_page))
+
+        self.rect = pygame.Rect(0, 0, width, height)
+        self.show_page(0)
+
+    def show_page(self, page):
+        """
+        Start showing a page
+
+        :param: page, index of the page
+        """
+        self.page = page
+        self.dirty = True
+
+        #every character of the page, in the order they are typed out.  lines are centered like a rect of the
+        #rendered text, so a one line page is where the font's own rendering of it would be
+        lines = self.pages[page]
+        line_height = self.atlas.line_height
+        text_height = (len(lines) - 1)*line_height + self.atlas.size(lines[-1])[1] if lines else 0
+        top = self.height//2 - text_height//2
+        self.glyphs = list()
+        for number, line in enumerate(lines):
+            left = self.width//2 - self.atlas.width(line)//2
+            self.glyphs.extend(self.atlas.positions(line, (left, top + number*line_height)))
+
+        if self.reveal_speed is None:
+            self.reveal_all()
+        else:
+            self.reveal_time = 0.
+            self.revealed = 0
+            self.surface = build_background(self.width, self.height).copy()
+
+    def reveal_all(self):
+        """
+        Show the whole page
+        """
+        key = (self.pages[self.page], self.width, self.height, self.atlas)
+        page_surface = BOXES.get(key)
+        if page_surface is None:
+            page_surface = build_background(self.width, self.height).copy()
+            page_surface.blits(self.glyphs, doreturn=False)
+            BOXES.store(key, page_surface)
+
+        self.surface = page_surface
+        self.revealed = len(self.glyphs)
+        self.dirty = True
+
+    @property
+    def finished(self):
+        """
+        :rtype: True if the whole page is shown
+        """
+        return self.revealed >= len(self.glyphs)
+
+    def update(self, dt):
+        """
+        Type out more of the page
+
+        :param: dt, the length of time (in seconds) since last updated
+        """
+        if self.finished:
+            return
+
+        self.reveal_time += dt
+        revealed = min(int(self.reveal_time * self.reveal_speed), len(self.glyphs))
+        if revealed == len(self.glyphs):
+            self.reveal_all()
+        elif revealed > self.revealed:
+            #only the characters typed since the last update are drawn
+            self.surface.blits(self.glyphs[self.revealed:revealed], doreturn=False)
+            self.revealed = revealed
+            self.dirty = True
+
+    def advance(self):
+        """
+        Finish typing the page, or go to the next page
+
+        :return: False if the last page was already finished
+        """
+        if not self.finished:
+            self.reveal_all()
+        elif self.page + 1 < len(self.pages):
+            self.show_page(self.page + 1)
+        else:
+            return False
+        return True
+
     def draw(self, surface, position = (0,0)):
-        surface.blit(self.sign_surface, position)
-        
-    def build(self):
-        """
-        Builds the visual representation of the sign
-        
-        :rtype: sign_surface PyGame Surface
-        """
-        message_surface = BASICFONT.render(self.message, True, WHITE)
-        message_rect = message_surface.get_rect()
-        
-        sign_surface = pygame.Surface((self.width, self.height))
-        sign_surface.fill(BLACK)
-        
-        grey_rect = pygame.Surface((self.width-2*OFFSET, self.height-2*OFFSET))
-        grey_rect.fill(GREY)
-        
-        sign_surface.blit(grey_rect, (OFFSET, OFFSET))
-        
-        message_rect.center = (self.width//2, self.height//2)
-        
-        sign_surface.blit(message_surface, message_rect.topleft)
-        
-        return sign_surface
-        
\ No newline at end of file
+        self.dirty = False
+        return surface.blit(self.surface, position)
+
+
+class Sign(DialogBox):
+    """
+    SIGN
+    Window displayed when the player reads a sign in the overworld.  Contains the message
+    """
+    def __init__(self, message, width=0, height=0, reveal_speed=None):
+        self.message = message
+        DialogBox.__init__(self, [message], width, height, reveal_speed)
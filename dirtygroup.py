@@ -0,0 +1,205 @@
+import numpy
+import pygame
+from pyscroll.group import PyscrollGroup
+
+
+def merge_rects(rects):
+    """
+    Join rects that overlap, so no area is redrawn twice
+
+    :param: rects, list of rects
+    :rtype: list of non-overlapping pygame Rects covering the same area
+    """
+    merged = list()
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+
+    return merged
+
+
+class DirtyGroup(PyscrollGroup):
+    """
+    DIRTY GROUP
+    Pyscroll group that only redraws the parts of the screen that changed while the camera stands still.
+
+    -draw_dirty(surface, areas) - draws the map and sprites and returns the rects of the surface that were drawn over,
+     for pygame.display.update(rects).  The whole view is drawn when the camera moved or after invalidate().
+     Otherwise only the old and new rects of sprites that moved, changed image or entered/left the view are redrawn,
+     along with 'areas', screen rects the caller had drawn over (dialog boxes, etc)
+    -invalidate() - makes the next draw_dirty draw the whole view
+
+    The map is drawn in view pixels and zoomed to the screen.  A redrawn area is zoomed with the same nearest pixel
+    mapping as pygame.transform.scale, so it matches the rest of the screen exactly
+    """
+    def __init__(self, map_layer, *args, **kwargs):
+        PyscrollGroup.__init__(self, map_layer, *args, **kwargs)
+        self._drawn = dict() #{sprite: (image, rect in view pixels, layer)} as last drawn
+        self._drawn_view = None #(surface, size, view rect) of the last draw, None to draw everything
+
+    def invalidate(self):
+        self._drawn_view = None
+
+    def visible_sprites(self):
+        """
+        :rtype: dictionary of {sprite: (image, rect in view pixels, layer)} of the sprites in view, in drawing order
+        """
+        ox, oy = self._map_layer.get_center_offset()
+        view_rect = self._map_layer.view_rect
+        get_layer = self.get_layer_of_sprite
+
+        visible = dict()
+        for sprite in self.sprites():
+            if sprite.rect.colliderect(view_rect):
+                visible[sprite] = (sprite.image, sprite.rect.move(ox, oy), get_layer(sprite))
+
+        return visible
+
+    def can_draw_areas(self, surface):
+        """
+        :rtype: True if the map can be drawn onto the surface an area at a time
+        """
+        zoom_buffer = self._map_layer._zoom_buffer
+        if zoom_buffer is None:
+            return True
+
+        #zoomed areas are copied pixel for pixel, so the buffer and surface need the same pixel format
+        return (self._map_layer.scaling_function is pygame.transform.scale and
+                zoom_buffer.get_bitsize() == surface.get_bitsize() == 32 and
+                zoom_buffer.get_masks() == surface.get_masks())
+
+    def draw_dirty(self, surface, areas=()):
+        """
+        Draw the parts of the map and sprites that changed since the last draw
+
+        :param: surface, surface to draw to.  must be the same surface every frame
+        :param: areas, rects of the surface to redraw even if nothing in them changed
+        :rtype: list of the rects of the surface that were drawn over
+        """
+        map_layer = self._map_layer
+        view = (surface, surface.get_size(), tuple(map_layer.view_rect))
+        visible = self.visible_sprites()
+
+        full = view != self._drawn_view or not self.can_draw_areas(surface)
+        if not full:
+            #animated tiles change the map buffer
+            tile_queue = map_layer.data.process_animation_queue(map_layer._tile_view)
+            if tile_queue:
+                map_layer._tile_queue = tile_queue
+                map_layer._flush_tile_queue(map_layer._buffer)
+                full = True
+
+        self._drawn_view = view
+        drawn, self._drawn = self._drawn, visible
+
+        if full:
+            self.draw(surface)
+            return [surface.get_rect()]
+
+        #the old and new rects of every sprite that changed
+        dirty = list()
+        for sprite, last in drawn.items():
+            current = visible.get(sprite)
+            if current != last:
+                dirty.append(last[1])
+                if current is not None:
+                    dirty.append(current[1])
+        for sprite, current in visible.items():
+            if sprite not in drawn:
+                dirty.append(current[1])
+
+        dirty.extend(self.to_view(surface, area) for area in areas)
+
+        view_area = (surface if map_layer._zoom_buffer is None else map_layer._zoom_buffer).get_rect()
+        rects = list()
+        for rect in merge_rects(dirty):
+            rect = rect.clip(view_area)
+            if rect.width and rect.height:
+                rects.append(self.draw_area(surface, rect, visible))
+
+        return rects
+
+    def to_view(self, surface, area):
+        """
+        :param: surface, the surface drawn to
+        :param: area, rect of the surface
+        :rtype: rect of the view pixels zoomed onto the area
+        """
+        area = pygame.Rect(area)
+        zoom_buffer = self._map_layer._zoom_buffer
+        if zoom_buffer is None or not (area.width and area.height):
+            return area
+
+        view_width, view_height = zoom_buffer.get_size()
+        width, height = surface.get_size()
+        left = area.left * view_width // width
+        top = area.top * view_height // height
+        right = (area.right - 1) * view_width // width + 1
+        bottom = (area.bottom - 1) * view_height // height + 1
+
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def draw_area(self, surface, rect, visible):
+        """
+        Draw the map and sprites in one area of the view
+
+        :param: surface, the surface drawn to
+        :param: rect, the area in view pixels
+        :param: visible, the sprites in view, from visible_sprites()
+        :rtype: rect of the surface that was drawn over
+        """
+        map_layer = self._map_layer
+        zoom_buffer = map_layer._zoom_buffer
+        target = surface if zoom_buffer is None else zoom_buffer
+        offset = map_layer._x_offset, map_layer._y_offset
+
+        clip = target.get_clip()
+        target.set_clip(rect)
+
+        if not map_layer._anchored_view:
+            map_layer._clear_surface(target, rect)
+        target.blit(map_layer._buffer, (-offset[0], -offset[1]))
+
+        sprites = [(image, sprite_rect, layer) for image, sprite_rect, layer in visible.values()
+                   if sprite_rect.colliderect(rect)]
+        if sprites:
+            map_layer._draw_surfaces(target, offset, sprites)
+
+        target.set_clip(clip)
+
+        if zoom_buffer is None:
+            return rect
+        return self.zoom_area(zoom_buffer, surface, rect)
+
+    @staticmethod
+    def zoom_area(zoom_buffer, surface, rect):
+        """
+        Copy an area of the zoom buffer to the surface, zoomed like pygame.transform.scale zooms the whole buffer
+
+        :param: zoom_buffer, surface the map is drawn to in view pixels
+        :param: surface, the surface drawn to
+        :param: rect, the area in view pixels
+        :rtype: rect of the surface that was drawn over
+        """
+        view_width, view_height = zoom_buffer.get_size()
+        width, height = surface.get_size()
+
+        #every surface pixel whose nearest view pixel is in the area
+        left = -(-rect.left * width // view_width)
+        right = -(-rect.right * width // view_width)
+        top = -(-rect.top * height // view_height)
+        bottom = -(-rect.bottom * height // view_height)
+
+        columns = numpy.arange(left, right) * view_width // width
+        rows = numpy.arange(top, bottom) * view_height // height
+
+        view_pixels = pygame.surfarray.pixels2d(zoom_buffer)
+        pixels = pygame.surfarray.pixels2d(surface)
+        pixels[left:right, top:bottom] = view_pixels[columns[:, None], rows]
+        del view_pixels, pixels
+
+        return pygame.Rect(left, top, right - left, bottom - top)
@@ -8,10 +8,17 @@ Uses maps, npc info, and sprite sheets from the '/data' folder
 Requires Python 3+, PyGame, PyTMX, PyScroll
 """
 
+import atexit
+import sys
+import time
+STARTED = time.perf_counter()
+
 import pygame
 from pygame.locals import *
 
 import overworld
+import profiler
+import simulation
 
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
@@ -19,14 +26,32 @@ SCREEN_HEIGHT = 600
 STARTING_MAP = 'map1.tmx'
 
 def main():
+    #time the start up from before the imports.  'python3 example.py --startup' prints it after the first frame
+    STARTUP = profiler.StartupTrace(STARTED)
+    STARTUP.mark('imports')
+    print_startup = '--startup' in sys.argv
+    #'python3 example.py --record session.replay' records the play session for replay.py
+    record_file = sys.argv[sys.argv.index('--record') + 1] if '--record' in sys.argv[:-1] else None
+    #'python3 example.py --threaded-paths' searches for npc paths on a worker thread
+    threaded_paths = '--threaded-paths' in sys.argv
+    
     #initialize pygame create a display window, create the game clock
     pygame.init()
     DISPLAYSURF = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     GAMECLOCK = pygame.time.Clock()
+    STARTUP.mark('display')
     
-    #load the starting map as the first overworld
-    GAME = overworld.Overworld(STARTING_MAP, screensize=DISPLAYSURF.get_size())
+    #load the starting map as the first overworld.  the simulation updates it at a fixed timestep
+    #while the camera stands still, only the parts of the screen that changed are drawn and displayed
+    GAME = overworld.Overworld(STARTING_MAP, screensize=DISPLAYSURF.get_size(), dirty_rendering=True, startup=STARTUP,
+                               threaded_paths=threaded_paths)
+    SIMULATION = simulation.Simulation(GAME)
+    if record_file is not None:
+        import replay
+        SIMULATION.recorder = replay.Recorder(SIMULATION)
+        atexit.register(SIMULATION.recorder.save, record_file)
     dt = .01
+    caption_time = 0
     
     while True:      
         
@@ -36,22 +61,24 @@ def main():
                     
         #handle the events in the event queue
         for event in events:
-            GAME.handle_interaction(event)
+            SIMULATION.handle_event(event)
 
-        #handle movement based on the keys map1
-        GAME.handle_movement(keys)
-        
-        #update the map, draw it to a surface, and display it on the display window
-        GAME.update(dt)
-        GAME.draw(DISPLAYSURF)
-        pygame.display.flip()
+        #update the map with the keys held down, draw it to a surface, and display what changed on the display window
+        alpha = SIMULATION.advance(dt, keys)
+        pygame.display.update(GAME.draw(DISPLAYSURF, alpha))
+        if print_startup and STARTUP.finished:
+            print(STARTUP.report())
+            print_startup = False
         
         #tick the game clock
         dt = GAMECLOCK.tick()/1000.
         
-        #get the current FPS and set it as the caption
-        fps = GAMECLOCK.get_fps()
-        pygame.display.set_caption('Test: ' + str(fps))
+        #get the current FPS and set it as the caption, once a second
+        caption_time += dt
+        if caption_time >= 1:
+            caption_time = 0
+            fps = GAMECLOCK.get_fps()
+            pygame.display.set_caption('Test: ' + str(fps))
     
 if __name__ == '__main__':
     main()
@@ -0,0 +1,89 @@
+import os
+import os.path
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+import pygame
+from pytmx.util_pygame import handle_transformation, smart_convert
+
+DECODE_THREADS = os.cpu_count() or 1 #threads decoding images.  pygame lets go of the GIL while it decodes
+
+_executor = None
+
+
+def decode(filenames):
+    """
+    Start decoding images on the decode threads
+
+    :param: filenames, paths of the images
+    :rtype: dictionary of {normalized path: future of the decoded pygame Surface}
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DECODE_THREADS)
+
+    futures = dict()
+    for filename in filenames:
+        key = os.path.normpath(filename)
+        if key not in futures:
+            futures[key] = _executor.submit(pygame.image.load, filename)
+    return futures
+
+
+def map_images(filename):
+    """
+    Find the images a tmx map uses without parsing the whole map: its tileset images (from the map or external .tsx
+    tilesets), tile images and image layers
+
+    :param: filename, path to a .tmx map
+    :rtype: list of image paths
+    """
+    images = list()
+
+    def find_images(element, folder):
+        for image in element.iter('image'):
+            if image.get('source'):
+                images.append(os.path.join(folder, image.get('source')))
+
+    folder = os.path.dirname(filename)
+    try:
+        root = ElementTree.parse(filename).getroot()
+        find_images(root, folder)
+
+        for tileset in root.iter('tileset'):
+            if tileset.get('source'):
+                tileset_file = os.path.join(folder, tileset.get('source'))
+                find_images(ElementTree.parse(tileset_file).getroot(), os.path.dirname(tileset_file))
+    except (OSError, ElementTree.ParseError):
+        pass #pytmx reports broken maps when it parses them
+
+    return images
+
+
+class ImageLoader(object):
+    """
+    IMAGE LOADER
+    pytmx image loader that decodes all the images of a map at once on the decode threads.  Decoding starts when the
+    loader is made, so it runs while pytmx parses the map's layers.  Tiles are cut and converted the same way
+    pytmx.util_pygame does it
+
+    -images the map did not list ahead of time are decoded when pytmx asks for them
+    """
+    def __init__(self, filenames):
+        self.futures = decode(filenames)
+
+    def __call__(self, filename, colorkey, **kwargs):
+        future = self.futures.pop(os.path.normpath(filename), None)
+        image = pygame.image.load(filename) if future is None else future.result()
+
+        if colorkey:
+            colorkey = pygame.Color('#{0}'.format(colorkey))
+        pixelalpha = kwargs.get('pixelalpha', True)
+
+        def load_image(rect=None, flags=None):
+            tile = image.subsurface(rect) if rect else image.copy()
+            if flags:
+                tile = handle_transformation(tile, flags)
+            return smart_convert(tile, colorkey, pixelalpha)
+
+        return load_image
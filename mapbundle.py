@@ -0,0 +1,400 @@
+import json
+import mmap
+import os.path
+import struct
+from itertools import product
+from xml.etree import ElementTree
+
+import numpy
+import pygame
+import pytmx
+
+import imagedecoder
+import worldobjects
+
+BUNDLE_EXTENSION = '.tmxb'
+MAGIC = b'TMXB'
+VERSION = 2
+HEADER = struct.Struct('<4sIQ') #magic, version, length of the json header
+ALIGNMENT = 64 #bytes.  every array in a bundle starts on a multiple of this
+
+#world objects sorted into tables by object name, the same way populate_world uses them
+OBJECT_KINDS = ('blocker', 'portal', 'sign', 'item', 'npc', 'player')
+
+#bits of the tile flags in the image table
+FLIPPED_HORIZONTALLY = 1
+FLIPPED_VERTICALLY = 2
+FLIPPED_DIAGONALLY = 4
+
+
+def get_bundle_name(filename):
+    """
+    :param: filename, path to a .tmx map file
+    :rtype: path to the map's compiled bundle
+    """
+    return os.path.splitext(filename)[0] + BUNDLE_EXTENSION
+
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def external_tilesets(filename):
+    """
+    pytmx reads external tilesets into the map without keeping their file names, so they are looked up in the map
+
+    :param: filename, path to a .tmx map file
+    :rtype: list of paths to the .tsx tileset files the map uses
+    """
+    sources = list()
+    for tileset in ElementTree.parse(filename).getroot().iter('tileset'):
+        source = tileset.get('source')
+        if source is not None:
+            sources.append(os.path.join(os.path.dirname(filename), source))
+    return sources
+
+
+def classify_objects(tmx_data):
+    """
+    Sort the objects of a map into tables by their name
+
+    :param: tmx_data, pytmx TiledMap
+    :rtype: dictionary of {object name: (array of (x, y, width, height), list of object types)}
+    """
+    tables = {kind: (list(), list()) for kind in OBJECT_KINDS}
+
+    for world_object in tmx_data.objects:
+        try:
+            rects, values = tables[world_object.name]
+        except KeyError:
+            continue
+
+        rects.append((world_object.x, world_object.y, world_object.width, world_object.height))
+        values.append(worldobjects.intern(world_object.type))
+
+    return {kind: (numpy.array(rects, dtype=numpy.float64).reshape(len(rects), 4), values)
+            for kind, (rects, values) in tables.items()}
+
+
+def jsonable_properties(properties):
+    """
+    :param: properties, dictionary of Tiled properties
+    :rtype: the properties that can be stored as json
+    """
+    stored = dict()
+    for name, value in properties.items():
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        stored[name] = value
+    return stored
+
+
+def compile_map(tmx_data, filename, npc_filename=None):
+    """
+    Write a compiled bundle of a map: tile gid arrays, world object tables, tileset references and npc info
+
+    :param: tmx_data, pytmx TiledMap of the map.  no images have to be loaded
+    :param: filename, path to write the bundle to
+    :param: npc_filename, path to the map's npc .json file, if any
+    """
+    arrays = list()
+    sources = {tmx_data.filename: os.path.getmtime(tmx_data.filename)}
+    for source in external_tilesets(tmx_data.filename):
+        sources[source] = os.path.getmtime(source)
+
+    #layers.  tile layers keep pytmx's gids, so the images table below can be indexed by them
+    layers = list()
+    for layer in tmx_data.layers:
+        stored = {'name': layer.name,
+                  'visible': bool(layer.visible),
+                  'opacity': getattr(layer, 'opacity', 1.0),
+                  'properties': jsonable_properties(layer.properties)}
+        if isinstance(layer, pytmx.TiledTileLayer):
+            stored['data'] = 'layer{}'.format(len(layers))
+            arrays.append((stored['data'], numpy.array(layer.data, dtype=numpy.uint32).reshape(layer.height, layer.width)))
+        elif isinstance(layer, pytmx.TiledImageLayer):
+            raise ValueError('{}: image layers can not be compiled'.format(tmx_data.filename))
+        layers.append(stored)
+
+    #where every gid's image is found in the tilesets: (tileset, x, y, width, height, flags)
+    tilesets = list()
+    images = numpy.full((max(tmx_data.maxgid, 1), 6), -1, dtype=numpy.int32)
+    for index, tileset in enumerate(tmx_data.tilesets):
+        if tileset.source is None:
+            raise ValueError('{}: tilesets without a single image can not be compiled'.format(tmx_data.filename))
+
+        tilesets.append({'source': os.path.join(os.path.dirname(tmx_data.filename), tileset.source),
+                         'trans': getattr(tileset, 'trans', None)})
+
+        #the same walk over the tileset image that pytmx does when loading images
+        positions = product(range(tileset.margin, tileset.height + tileset.margin - tileset.tileheight + 1,
+                                  tileset.tileheight + tileset.spacing),
+                            range(tileset.margin, tileset.width + tileset.margin - tileset.tilewidth + 1,
+                                  tileset.tilewidth + tileset.spacing))
+        for real_gid, (y, x) in enumerate(positions, tileset.firstgid):
+            for gid, flags in tmx_data.map_gid(real_gid) or ():
+                images[gid] = (index, x, y, tileset.tilewidth, tileset.tileheight,
+                               (FLIPPED_HORIZONTALLY if flags.flipped_horizontally else 0) |
+                               (FLIPPED_VERTICALLY if flags.flipped_vertically else 0) |
+                               (FLIPPED_DIAGONALLY if flags.flipped_diagonally else 0))
+    arrays.append(('images', images))
+
+    #world object tables
+    objects = dict()
+    for kind, (rects, values) in classify_objects(tmx_data).items():
+        arrays.append(('objects.' + kind, rects))
+        objects[kind] = values
+
+    #npc info from the map's npc file
+    npc_data = None
+    if npc_filename is not None and os.path.exists(npc_filename):
+        with open(npc_filename) as npc_file:
+            npc_data = json.load(npc_file)
+        sources[npc_filename] = os.path.getmtime(npc_filename)
+
+    header = {'map': {'filename': tmx_data.filename,
+                      'width': tmx_data.width,
+                      'height': tmx_data.height,
+                      'tilewidth': tmx_data.tilewidth,
+                      'tileheight': tmx_data.tileheight,
+                      'properties': jsonable_properties(tmx_data.properties)},
+              'sources': sources,
+              'npc_file': npc_filename,
+              'layers': layers,
+              'tilesets': tilesets,
+              'tile_properties': {str(gid): jsonable_properties(properties)
+                                  for gid, properties in tmx_data.tile_properties.items()},
+              'objects': objects,
+              'npc_data': npc_data,
+              'arrays': dict()}
+
+    offset = 0
+    for name, array in arrays:
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = align(offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = align(HEADER.size + len(header_bytes))
+
+    with open(filename, 'wb') as bundle_file:
+        bundle_file.write(HEADER.pack(MAGIC, VERSION, len(header_bytes)))
+        bundle_file.write(header_bytes)
+        for name, array in arrays:
+            bundle_file.seek(data_start + header['arrays'][name]['offset'])
+            bundle_file.write(numpy.ascontiguousarray(array).tobytes())
+
+
+def read_bundle(filename):
+    """
+    Memory map a bundle.  Arrays are views of the mapped file, nothing is copied
+
+    :param: filename, path to a compiled bundle
+    :rtype: (header dictionary, dictionary of {array name: numpy array})
+    """
+    with open(filename, 'rb') as bundle_file:
+        mapped = mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, header_length = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{} is not a version {} map bundle'.format(filename, VERSION))
+
+    header = json.loads(mapped[HEADER.size:HEADER.size + header_length].decode('utf-8'))
+    data_start = align(HEADER.size + header_length)
+
+    arrays = dict()
+    for name, spec in header['arrays'].items():
+        count = int(numpy.prod(spec['shape']))
+        if count:
+            array = numpy.frombuffer(mapped, dtype=spec['dtype'], count=count, offset=data_start + spec['offset'])
+        else:
+            array = numpy.zeros(0, dtype=spec['dtype'])
+        arrays[name] = array.reshape(spec['shape'])
+
+    return header, arrays
+
+
+def is_current(header):
+    """
+    :param: header, header dictionary of a bundle
+    :rtype: True if none of the files the bundle was compiled from has changed since
+    """
+    for source, modified in header['sources'].items():
+        if not os.path.exists(source) or os.path.getmtime(source) > modified:
+            return False
+
+    #an npc file that was added after compiling
+    npc_file = header['npc_file']
+    return npc_file is None or header['npc_data'] is not None or not os.path.exists(npc_file)
+
+
+def transform_tile(tile, flags):
+    """
+    Flip and rotate a tile image the way pytmx does for flipped gids
+
+    :rtype: pygame Surface
+    """
+    if flags & FLIPPED_DIAGONALLY:
+        tile = pygame.transform.flip(pygame.transform.rotate(tile, 270), True, False)
+    if flags & (FLIPPED_HORIZONTALLY | FLIPPED_VERTICALLY):
+        tile = pygame.transform.flip(tile, bool(flags & FLIPPED_HORIZONTALLY), bool(flags & FLIPPED_VERTICALLY))
+    return tile
+
+
+class TileLayer(object):
+    """
+    TILE LAYER
+    A tile layer of a compiled map.  'data' is a (height, width) array of gids
+    """
+    def __init__(self, name, visible, opacity, properties, data=None):
+        self.name = name
+        self.visible = visible
+        self.opacity = opacity
+        self.properties = properties
+        self.data = data
+
+    def iter_data(self):
+        """
+        :rtype: iterator over (x, y, gid) of every tile in the layer
+        """
+        for y, row in enumerate(self.data.tolist()):
+            for x, gid in enumerate(row):
+                yield x, y, gid
+
+
+class ObjectLayer(object):
+    """
+    OBJECT LAYER
+    An object layer of a compiled map.  Only kept so layer numbers match the .tmx file, the objects are in 'world_objects'
+    """
+    def __init__(self, name, visible, opacity, properties):
+        self.name = name
+        self.visible = visible
+        self.opacity = opacity
+        self.properties = properties
+
+
+class CompiledMap(object):
+    """
+    COMPILED MAP
+    A map loaded from a compiled bundle.  Has the parts of a pytmx TiledMap that pyscroll and the overworld use.
+
+    -layers - TileLayers (with memory mapped gid arrays) and ObjectLayers, in the same order as the .tmx file
+    -images - tile image of every gid, cut from the tileset images
+    -world_objects - dictionary of {object name: (array of (x, y, width, height), list of object types)}
+    -npc_data - contents of the map's npc .json file when it was compiled, or None
+    """
+    def __init__(self, bundle_filename, header, arrays):
+        self.bundle_filename = bundle_filename
+        self.sources = header['sources']
+        self.npc_file = header['npc_file']
+        self.npc_data = header['npc_data']
+
+        info = header['map']
+        self.filename = info['filename']
+        self.width = info['width']
+        self.height = info['height']
+        self.tilewidth = info['tilewidth']
+        self.tileheight = info['tileheight']
+        self.properties = info['properties']
+
+        self.tile_properties = {int(gid): properties for gid, properties in header['tile_properties'].items()}
+
+        self.layers = list()
+        for layer in header['layers']:
+            if 'data' in layer:
+                self.layers.append(TileLayer(layer['name'], layer['visible'], layer['opacity'], layer['properties'],
+                                             arrays[layer['data']]))
+            else:
+                self.layers.append(ObjectLayer(layer['name'], layer['visible'], layer['opacity'], layer['properties']))
+
+        self.world_objects = {kind: (arrays['objects.' + kind], [worldobjects.intern(value) for value in values])
+                              for kind, values in header['objects'].items()}
+
+        self.tilesets = header['tilesets']
+        self.images = self.load_images(arrays['images'])
+
+    def load_images(self, table):
+        """
+        Load the tileset images and cut the tile images out of them.  Tiles are subsurfaces of their tileset,
+        flipped tiles are copies.  The tileset images are decoded in parallel
+
+        :param: table, array of (tileset, x, y, width, height, flags) of every gid
+        :rtype: list of tile images, indexed by gid
+        """
+        decoding = imagedecoder.decode(tileset['source'] for tileset in self.tilesets)
+
+        sheets = list()
+        for tileset in self.tilesets:
+            sheet = decoding[os.path.normpath(tileset['source'])].result()
+            try:
+                if tileset['trans']:
+                    sheet = sheet.convert()
+                    sheet.set_colorkey(pygame.Color('#{}'.format(tileset['trans'])))
+                else:
+                    sheet = sheet.convert_alpha()
+            except pygame.error:
+                pass
+            sheets.append(sheet)
+
+        images = [None] * len(table)
+        for gid, (tileset, x, y, width, height, flags) in enumerate(table.tolist()):
+            if tileset < 0:
+                continue
+            tile = sheets[tileset].subsurface((x, y, width, height))
+            images[gid] = transform_tile(tile, flags) if flags else tile
+
+        return images
+
+    @property
+    def visible_layers(self):
+        return (layer for layer in self.layers if layer.visible)
+
+    @property
+    def visible_tile_layers(self):
+        return [index for index, layer in enumerate(self.layers) if layer.visible and isinstance(layer, TileLayer)]
+
+    def get_layer_by_name(self, name):
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        raise ValueError('Layer "{}" not found.'.format(name))
+
+    def get_tile_image(self, x, y, layer):
+        """
+        :param: x, y, column and row of the tile
+        :param: layer, layer number
+        :rtype: tile image, or None if the tile is empty
+        """
+        if x < 0 or y < 0:
+            raise ValueError('Tile coordinates must be non-negative, were ({}, {}), layer={}'.format(x, y, layer))
+
+        try:
+            gid = self.layers[layer].data[y, x]
+        except (IndexError, TypeError):
+            raise ValueError('Coords: ({}, {}) in layer {} are invalid'.format(x, y, layer))
+
+        return self.images[gid] if gid else None
+
+
+def load_bundle(filename):
+    """
+    Load a map from its compiled bundle, if there is one and it is up to date
+
+    :param: filename, path to a .tmx map file
+    :rtype: CompiledMap, or None if the map has to be loaded from the .tmx file
+    """
+    bundle_filename = get_bundle_name(filename)
+    if not os.path.exists(bundle_filename):
+        return None
+
+    try:
+        header, arrays = read_bundle(bundle_filename)
+    except (ValueError, OSError):
+        return None
+
+    if not is_current(header):
+        return None
+
+    return CompiledMap(bundle_filename, header, arrays)
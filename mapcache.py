@@ -0,0 +1,119 @@
+from collections import OrderedDict
+
+MAX_CACHED_MAPS = 4 #maps kept built after the player leaves them
+MAX_CACHE_BYTES = 256 * 1024 * 1024 #estimated memory the cached maps may use
+
+
+def surface_size(surface):
+    """
+    :rtype: number of bytes of pixel data of a pygame Surface (0 for None)
+    """
+    if surface is None:
+        return 0
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+class MapContext(object):
+    """
+    MAP CONTEXT
+    Everything built for a map: tmx data, renderer, pyscroll group, world objects and their indexes, npcs.
+
+    -'state' is a dictionary of {overworld attribute name: value}, so switching back to the map is just
+     putting the attributes back
+    -'size' is an estimate (in bytes) of the memory the map holds, counting its tile images and render buffers
+    """
+    def __init__(self, filename, state):
+        self.filename = filename
+        self.state = state
+        self.size = self.estimate_size()
+
+    def estimate_size(self):
+        """
+        :rtype: estimated bytes of pixel data held by the map
+        """
+        size = 0
+
+        tmx_data = self.state.get('tmx_data')
+        if tmx_data is not None:
+            size += sum(surface_size(image) for image in tmx_data.images)
+
+        map_layer = self.state.get('map_layer')
+        if map_layer is not None:
+            size += surface_size(getattr(map_layer, '_buffer', None))
+            size += surface_size(getattr(map_layer, '_zoom_buffer', None))
+
+        return size
+
+
+class MapCache(object):
+    """
+    MAP CACHE
+    Least recently used cache of built maps, so travelling back and forth between maps does not rebuild them.
+
+    -store(context) - keeps a map that is being left.  The least recently stored maps are evicted when more than
+     'max_maps' are kept or their estimated size is more than 'max_bytes'
+    -take(filename) - removes and returns a cached map, or None if it is not cached
+    -hits/misses/evictions count cache activity, stats() reports them with the memory in use
+    """
+    def __init__(self, max_maps=MAX_CACHED_MAPS, max_bytes=MAX_CACHE_BYTES):
+        self.max_maps = max_maps
+        self.max_bytes = max_bytes
+        self._contexts = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, filename):
+        return filename in self._contexts
+
+    def __len__(self):
+        return len(self._contexts)
+
+    @property
+    def size(self):
+        """
+        :rtype: estimated bytes held by the cached maps
+        """
+        return sum(context.size for context in self._contexts.values())
+
+    def store(self, context):
+        """
+        Keep a built map
+
+        :param: context, MapContext
+        """
+        self._contexts[context.filename] = context
+        self._contexts.move_to_end(context.filename)
+
+        while self._contexts and (len(self._contexts) > self.max_maps or self.size > self.max_bytes):
+            self._contexts.popitem(last=False)
+            self.evictions += 1
+
+    def take(self, filename):
+        """
+        Get a built map out of the cache
+
+        :param: filename, path to the map's .tmx file
+        :rtype: MapContext, or None if the map is not cached
+        """
+        context = self._contexts.pop(filename, None)
+        if context is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return context
+
+    def clear(self):
+        self._contexts.clear()
+
+    def stats(self):
+        """
+        :rtype: dictionary of cache counters and memory use (in bytes)
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'maps': len(self._contexts),
+                'bytes': self.size}
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pytmx
+
+import pyscroll
+import pyscroll.data
+
+import imagedecoder
+import mapbundle
+
+MAX_PRELOADED_MAPS = 4 #maps kept loaded (or loading) ahead of time
+
+
+def load_map(filename, screensize, zoom):
+    """
+    Load a map, its tilesets and build its renderer.  The map's compiled bundle is used if it is up to date,
+    otherwise the tmx map is parsed.  Tileset images are decoded in parallel, while the map's layers are read
+
+    :param: filename, path to a .tmx map file
+    :param: screensize, size of the renderer (camera)
+    :param: zoom, zoom level of the renderer
+    :rtype: (pytmx TiledMap or mapbundle.CompiledMap, pyscroll BufferedRenderer)
+    """
+    tmx_data = mapbundle.load_bundle(filename)
+    if tmx_data is None:
+        tmx_data = pytmx.TiledMap(filename, image_loader=imagedecoder.ImageLoader(imagedecoder.map_images(filename)))
+    map_data = pyscroll.data.TiledMapData(tmx_data)
+
+    map_layer = pyscroll.BufferedRenderer(map_data, screensize)
+    map_layer.zoom = zoom
+
+    return tmx_data, map_layer
+
+
+class MapLoader(object):
+    """
+    MAP LOADER
+    Loads maps on a background thread before they are needed, so changing maps does not stall the game.
+
+    -preload(filename) - starts loading a map on the worker thread.  At most 'max_maps' maps are kept,
+     the least recently preloaded ones are dropped first
+    -load(filename) - takes a preloaded map, waiting for it if it is still loading.  Maps that were never
+     preloaded are loaded right away on the calling thread
+    -hits/misses count how many loads found their map preloaded
+    """
+    def __init__(self, screensize, zoom=1, max_maps=MAX_PRELOADED_MAPS):
+        self.screensize = screensize
+        self.zoom = zoom
+        self.max_maps = max_maps
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._maps = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, filename):
+        return filename in self._maps
+
+    def preload(self, filename):
+        """
+        Start loading a map in the background, if it is not already loaded or loading
+
+        :param: filename, path to a .tmx map file
+        """
+        if filename in self._maps:
+            self._maps.move_to_end(filename)
+            return
+
+        self._maps[filename] = self._executor.submit(load_map, filename, self.screensize, self.zoom)
+
+        while len(self._maps) > self.max_maps:
+            _, future = self._maps.popitem(last=False)
+            future.cancel()
+
+    def is_ready(self, filename):
+        """
+        :param: filename, path to a .tmx map file
+        :rtype: True if the map has finished loading in the background
+        """
+        future = self._maps.get(filename)
+        return future is not None and future.done()
+
+    def load(self, filename):
+        """
+        Get a loaded map.  The map is removed from the loader, every call returns a new renderer
+
+        :param: filename, path to a .tmx map file
+        :rtype: (pytmx TiledMap or mapbundle.CompiledMap, pyscroll BufferedRenderer)
+        """
+        future = self._maps.pop(filename, None)
+        if future is None or future.cancelled():
+            self.misses += 1
+            return load_map(filename, self.screensize, self.zoom)
+
+        self.hits += 1
+        return future.result()
+
+    def clear(self):
+        """
+        Drop every preloaded map
+        """
+        for future in self._maps.values():
+            future.cancel()
+        self._maps.clear()
+
+    def shutdown(self):
+        """
+        Drop every preloaded map and stop the worker thread
+        """
+        self.clear()
+        self._executor.shutdown(wait=False)
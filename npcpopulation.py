@@ -0,0 +1,754 @@
+from collections import deque
+
+import numpy
+
+import broadphase
+import character
+
+NPC_MOVE_SPEED = 100 #pixels per second
+
+#directions are stored as indexes into this tuple
+DIRECTIONS = (character.UP, character.DOWN, character.LEFT, character.RIGHT)
+DIRECTION_VECTORS = numpy.array([[0, -1], [0, 1], [-1, 0], [1, 0]], dtype=float)
+NOT_MOVING = -1
+CONTACT_RANGE = 2 #pixels between the feet of NPCs that count as touching
+ALIGNMENT = 2 #pixels an NPC on a flow field may be off the middle of its tile before it steps back onto it
+DETOUR_DELAY = .25 #seconds a solid NPC on a flow field walks into something before it tries another way
+PATIENCE = 1. #seconds a solid NPC walks into something before it walks around it or gives up
+
+#activity zones around the camera view.  active NPCs are fully simulated, animated and drawn.  dormant NPCs only
+#move, a few times a second.  frozen NPCs stand still until they come closer
+ACTIVE = 0
+DORMANT = 1
+FROZEN = 2
+ZONES = (ACTIVE, DORMANT, FROZEN)
+
+ACTIVE_MARGIN = 64 #pixels around the view in which NPCs are active
+DORMANT_MARGIN = 1024 #pixels around the view in which NPCs are dormant
+DORMANT_INTERVAL = .25 #seconds between moves of dormant NPCs
+FROZEN_INTERVAL = None #seconds between moves of frozen NPCs.  None never moves them
+ZONE_INTERVAL = .25 #seconds between sorting NPCs into zones while the view stands still
+
+#the per NPC arrays, kept in step when NPCs are added and removed
+ARRAYS = ('positions', 'old_positions', 'velocities', 'directions', 'moving', 'animation_times', 'frame_numbers',
+          'frame_counts', 'zones', 'moved_times', 'following', 'flows', 'feet_offsets',
+          'feet_sizes', 'blocked_times', 'detours', 'detour_cells')
+
+
+class NPCPopulation(object):
+    """
+    NPC POPULATION
+    Simulates every NPC of a map at once.  Positions, velocities, directions and animation clocks are kept in
+    NumPy arrays and integrated in batched steps, instead of calling each NPC sprite's update().
+
+    -NPCs are sorted into activity zones around the camera view.  Active NPCs (in view or within 'active_margin' of it)
+     are moved and animated every update and written back to their sprites.  Dormant NPCs (within 'dormant_margin')
+     are only moved, every 'dormant_interval' seconds.  Frozen NPCs (further away) are moved every 'frozen_interval'
+     seconds, or never if it is None.  The zones are sorted again when the view moves, or every ZONE_INTERVAL seconds
+    -attach(group) - keeps only the active NPCs in a sprite group, so drawing skips the rest
+    -resolver - a collisionresolver.CollisionResolver that stops walking NPCs at blockers, or None to let them
+     walk through everything
+    -solid - True stops active NPCs before they walk into each other or into the 'obstacles' rects given to update(),
+     e.g. the player's feet.  An NPC that would walk into another stands still for the update and tries again in
+     the next.  Feet that already overlap do not stop each other, so NPCs placed on top of each other can walk apart.
+     An NPC on a flow field that is still blocked after DETOUR_DELAY seconds turns to another tile nearer the goal,
+     if there is one, and one still blocked after PATIENCE seconds stops following the field and stands where it is,
+     so a crowd packs around its goal instead of walking on the spot
+    -reroute - function(npc, goal, obstruction) called for an NPC on a path that is still blocked after PATIENCE
+     seconds, with the (x, y) its feet walk to and the (x, y, width, height) of what it walks into, e.g. to ask for
+     a path around it.  None stops the NPC instead
+    -contacts() - (count, 2) array of the indexes of the pairs of active NPCs whose feet are within CONTACT_RANGE of
+     each other
+    -add(npcs) / remove(npcs) - NPCs can join and leave the population, e.g. as parts of a map are loaded
+    -update_zones(view) - sorts the NPCs into zones now, e.g. after the camera jumped
+    -walk(npc, points) - sends an NPC along a path, e.g. from pathfinding.Pathfinder.  It walks straight from point
+     to point, its feet centered on each, and stands still at the last one.  'paths' holds the points left for
+     every NPC, or None
+    -follow(npcs, field) - sends NPCs along a pathfinding.FlowField, e.g. a crowd heading for the same place.  Each
+     update they walk the way the field points on the tile under their feet, keeping to the middle of the tiles,
+     and stand still on the goal.  'flow_fields' holds the fields followed, by number
+    -near(area) - the active NPCs in an area.  'moves' counts the updates that moved an active NPC (and the NPCs
+     joining or leaving), so code watching the NPCs around the player can skip updates where none of them moved
+    -The NPC sprites are only used for drawing.  sync() writes back every sprite, for code that needs the rects of
+     NPCs that are not active
+
+    ARRAYS (one row per NPC, in the same order as 'npcs')
+    -----------------------------------------------------------------------------------------------------------------
+    -positions / old_positions - topleft of the sprite now and before the last step
+    -velocities - pixels per second
+    -directions - index of the direction the sprite is facing
+    -moving - index of the direction the NPC walks in, or NOT_MOVING
+    -animation_times - how far (in seconds) into its walking animation the NPC is
+    -frame_numbers - the walking animation frame currently shown
+    -zones - activity zone of the NPC
+    -moved_times - time of the population clock the NPC was last moved at
+    -following - True for the NPCs walking along a path
+    -flows - number of the flow field the NPC follows, or -1
+    -feet_offsets - the center of the NPC's feet, from its topleft
+    -feet_sizes - width and height of the NPC's feet
+    -blocked_times - seconds the NPC has been walking into something without moving
+    -detours / detour_cells - the direction an NPC on a flow field walks in instead of the field's, and the number
+     of the tile it does so on, or -1
+    -----------------------------------------------------------------------------------------------------------------
+    """
+    def __init__(self, npcs, active_margin=ACTIVE_MARGIN, dormant_margin=DORMANT_MARGIN,
+                 dormant_interval=DORMANT_INTERVAL, frozen_interval=FROZEN_INTERVAL, resolver=None,
+                 solid=True):
+        self.npcs = list()
+        self.paths = list()
+        self.flow_fields = dict()
+        self.arrays_for([])
+
+        #the biggest sprite, so sprites partly inside a zone count as inside it
+        self.margin = 0
+
+        #every NPC is frozen until the population knows where the camera is
+        self.active_margin = active_margin
+        self.dormant_margin = dormant_margin
+        self.intervals = {DORMANT: dormant_interval, FROZEN: frozen_interval}
+        self.members = {zone: numpy.flatnonzero(self.zones == zone) for zone in ZONES}
+        self.zone_times = {DORMANT: 0., FROZEN: 0.} #seconds since the zone was last moved
+        self.zoned_view = None
+        self.zone_age = 0.
+
+        #seconds simulated so far.  NPCs in slow zones are moved by the time since they were last moved
+        self.clock = 0.
+
+        self.group = None
+        self.resolver = resolver
+        self.moves = 0
+
+        self.solid = solid
+        self.broadphase = broadphase.Broadphase()
+        self.reroute = None
+
+        self.add(npcs)
+
+    def arrays_for(self, npcs):
+        """
+        Set the per NPC arrays to the state of some NPC sprites
+
+        :param: npcs, list of character.NPC
+        """
+        count = len(npcs)
+
+        self.positions = numpy.array([npc.position[:2] for npc in npcs], dtype=float).reshape(count, 2)
+        self.old_positions = self.positions.copy()
+        self.velocities = numpy.zeros((count, 2))
+        self.directions = numpy.array([DIRECTIONS.index(npc.direction) for npc in npcs], dtype=numpy.int8)
+        self.moving = numpy.array([self.moving_direction(npc) for npc in npcs], dtype=numpy.int8)
+        self.animation_times = numpy.zeros(count)
+        self.frame_numbers = numpy.zeros(count, dtype=numpy.int16)
+
+        #length (in frames) of each NPC's walking animation
+        self.frame_counts = numpy.array([len(npc.movement_directions[npc.direction]) for npc in npcs],
+                                        dtype=numpy.int16)
+
+        self.zones = numpy.full(count, FROZEN, dtype=numpy.int8)
+        self.moved_times = numpy.full(count, getattr(self, 'clock', 0.))
+        self.following = numpy.zeros(count, dtype=bool)
+        self.flows = numpy.full(count, -1, dtype=numpy.int16)
+        self.feet_offsets = numpy.array([(npc.rect.width / 2., npc.rect.height - npc.feet.height / 2.)
+                                         for npc in npcs], dtype=float).reshape(count, 2)
+        self.feet_sizes = numpy.array([npc.feet.size for npc in npcs], dtype=float).reshape(count, 2)
+        self.blocked_times = numpy.zeros(count)
+        self.detours = numpy.full(count, NOT_MOVING, dtype=numpy.int8)
+        self.detour_cells = numpy.full(count, -1, dtype=numpy.int64)
+
+    def add(self, npcs):
+        """
+        Add NPCs to the population.  They are frozen until the next update sorts them into zones
+
+        :param: npcs, list of character.NPC
+        """
+        npcs = list(npcs)
+        if not npcs:
+            return
+
+        old = {name: getattr(self, name) for name in ARRAYS}
+        self.arrays_for(npcs)
+        for name in ARRAYS:
+            setattr(self, name, numpy.concatenate((old[name], getattr(self, name))))
+
+        first = len(self.npcs)
+        self.npcs.extend(npcs)
+        self.paths.extend([None] * len(npcs))
+        self.margin = max([self.margin] + [max(npc.rect.size) for npc in npcs])
+        self.members = {zone: numpy.flatnonzero(self.zones == zone) for zone in ZONES}
+        self.zoned_view = None
+        self.moves += 1
+
+        self.sync(numpy.arange(first, len(self.npcs)))
+
+    def remove(self, npcs):
+        """
+        Remove NPCs from the population, and from the attached group
+
+        :param: npcs, list of character.NPC
+        """
+        removed = set(map(id, npcs))
+        keep = numpy.array([id(npc) not in removed for npc in self.npcs], dtype=bool)
+        if keep.all():
+            return
+
+        if self.group is not None:
+            self.group.remove([npc for npc, kept in zip(self.npcs, keep.tolist()) if not kept])
+
+        for name in ARRAYS:
+            setattr(self, name, getattr(self, name)[keep])
+        self.npcs = [npc for npc, kept in zip(self.npcs, keep.tolist()) if kept]
+        self.paths = [path for path, kept in zip(self.paths, keep.tolist()) if kept]
+        self.forget_flow_fields()
+        self.members = {zone: numpy.flatnonzero(self.zones == zone) for zone in ZONES}
+        self.moves += 1
+
+    def __len__(self):
+        return len(self.npcs)
+
+    @staticmethod
+    def moving_direction(npc):
+        """
+        :param: npc, character.NPC
+        :rtype: index of the direction the NPC walks in, or NOT_MOVING
+        """
+        for index, moving in enumerate((npc.moving_up, npc.moving_down, npc.moving_left, npc.moving_right)):
+            if moving:
+                return index
+        return NOT_MOVING
+
+    def attach(self, group):
+        """
+        Keep the active NPCs in a sprite group.  NPCs are added and removed as they enter and leave the active zone
+
+        :param: group, pygame sprite group the NPCs are drawn with
+        """
+        self.group = group
+        group.add([self.npcs[index] for index in self.members[ACTIVE].tolist()])
+
+    def update(self, dt, view=None, obstacles=()):
+        """
+        Move and animate the NPCs
+
+        :param: dt, the length of time (in seconds) since last updated
+        :param: view, pygame Rect of the visible part of the map.  None makes every NPC active
+        :param: obstacles, pygame Rects of the map that solid NPCs do not walk into
+        """
+        if not self.npcs:
+            return
+
+        #sort the NPCs into zones when the view moved, or once in a while as NPCs walk between zones
+        self.zone_age += dt
+        if view is None or view != self.zoned_view or self.zone_age >= ZONE_INTERVAL:
+            self.update_zones(view)
+
+        self.clock += dt
+
+        active = self.members[ACTIVE]
+        if (self.moving[active] >= 0).any():
+            self.moves += 1
+        self.step(active, dt, obstacles=obstacles)
+        self.moved_times[active] = self.clock
+        self.sync(active)
+
+        for zone, interval in self.intervals.items():
+            if interval is None:
+                continue
+
+            self.zone_times[zone] += dt
+            if self.zone_times[zone] >= interval:
+                self.catch_up(self.members[zone])
+                self.zone_times[zone] = 0.
+
+    def catch_up(self, indexes):
+        """
+        Move NPCs of slow zones by the time since they were last moved, without animating them
+
+        :param: indexes, array of the indexes of the NPCs to move
+        """
+        self.step(indexes, (self.clock - self.moved_times[indexes])[:, None], animate=False)
+        self.moved_times[indexes] = self.clock
+
+    def step(self, indexes, dt, animate=True, obstacles=()):
+        """
+        Move some of the NPCs
+
+        :param: indexes, array of the indexes of the NPCs to move
+        :param: dt, the length of time (in seconds) to move them for, or a column of times, one for each NPC
+        :param: animate, True to advance their animations.  NPCs that are not animated are not drawn either,
+                so their old position is not kept
+        :param: obstacles, pygame Rects the NPCs do not walk into, if animated and solid
+        """
+        if not len(indexes):
+            return
+
+        #NPCs on a path turn towards their next point
+        followers = indexes[self.following[indexes]]
+        if len(followers):
+            self.steer(followers)
+
+        #NPCs on a flow field turn the way it points
+        flowing = indexes[self.flows[indexes] >= 0]
+        if len(flowing):
+            aligning = self.flow(flowing)
+
+        walking = self.moving[indexes]
+        moving = walking >= 0
+
+        #walking NPCs move at a constant speed in their walking direction
+        velocities = numpy.zeros((len(indexes), 2))
+        velocities[moving] = DIRECTION_VECTORS[walking[moving]] * NPC_MOVE_SPEED
+        self.velocities[indexes] = velocities
+
+        positions = self.positions[indexes]
+        if animate:
+            self.old_positions[indexes] = positions
+        start = positions.copy()
+        positions += velocities * dt
+        if self.resolver is not None:
+            self.resolve(indexes[moving], start[moving], positions, numpy.flatnonzero(moving))
+        stopped = numpy.zeros(len(indexes), dtype=bool)
+        if animate and self.solid and moving.any():
+            stopped, obstructions = self.separate(indexes, start, positions, obstacles)
+            moving &= ~stopped
+            self.velocities[indexes[stopped]] = 0.
+        self.positions[indexes] = positions
+        if len(followers):
+            self.arrive(followers)
+        if len(flowing):
+            self.align(*aligning)
+        if not animate:
+            self.old_positions[indexes] = self.positions[indexes]
+            return
+
+        #NPCs that keep walking into something look for another way
+        self.blocked_times[indexes] = numpy.where(stopped, self.blocked_times[indexes] + dt, 0.)
+        if stopped.any():
+            self.give_way(indexes[stopped], obstructions[stopped], dt)
+
+        #advance the animation clocks of walking NPCs.  standing NPCs show the first frame
+        walking_indexes = indexes[moving]
+        frame_counts = self.frame_counts[walking_indexes]
+        cycles = frame_counts * (character.IMAGE_DISPLAY_TIME / 1000.)
+        animation_times = (self.animation_times[walking_indexes] + dt) % cycles
+        self.animation_times[walking_indexes] = animation_times
+        self.frame_numbers[indexes] = 0
+        self.frame_numbers[walking_indexes] = ((animation_times * 1000 // character.IMAGE_DISPLAY_TIME).astype(numpy.int16)
+                                               % frame_counts)
+
+    def resolve(self, indexes, start, positions, rows):
+        """
+        Stop walking NPCs at the blockers in their way
+
+        :param: indexes, the indexes of the walking NPCs
+        :param: start, their positions before the step
+        :param: positions, array of positions after the step, corrected in place
+        :param: rows, the rows of 'positions' that belong to the walking NPCs
+        """
+        move = self.resolver.move
+        for index, (x, y), row in zip(indexes.tolist(), start.tolist(), rows.tolist()):
+            new_x, new_y = positions[row]
+            npc = self.npcs[index]
+
+            rect = npc.rect.copy()
+            rect.topleft = (x, y)
+            feet = npc.feet.copy()
+            feet.midbottom = rect.midbottom
+            positions[row] = move(feet, (x, y), new_x - x, new_y - y)
+
+    def feet_rects(self, indexes, positions):
+        """
+        :param: indexes, array of the indexes of some NPCs
+        :param: positions, array of their topleft positions
+        :rtype: array of the (x, y, width, height) rects of their feet
+        """
+        sizes = self.feet_sizes[indexes]
+        return numpy.column_stack((positions + self.feet_offsets[indexes] - sizes / 2., sizes))
+
+    def separate(self, indexes, start, positions, obstacles):
+        """
+        Stop NPCs whose feet would come to overlap the feet of another NPC or an obstacle they did not overlap
+        before.  Stopping an NPC can leave it in the way of one that walked into its old place, so the stops spread
+        through the pairs of NPCs that could meet until no NPC walks into anything
+
+        :param: indexes, array of the indexes of the NPCs moved
+        :param: start, their positions before the step
+        :param: positions, array of their positions after the step, corrected in place
+        :param: obstacles, pygame Rects the NPCs do not walk into
+        :rtype: (boolean array, True for the NPCs that were stopped, array of the (x, y, width, height) of the feet
+                or obstacle each stopped NPC walked into)
+        """
+        count = len(indexes)
+        solid = numpy.array([tuple(obstacle) for obstacle in obstacles], dtype=float).reshape(-1, 4)
+        before = numpy.concatenate((self.feet_rects(indexes, start), solid))
+        after = numpy.concatenate((self.feet_rects(indexes, positions), solid))
+        moved = numpy.zeros(len(after), dtype=bool)
+        moved[:count] = (positions != start).any(axis=1)
+        stopped = numpy.zeros(count, dtype=bool)
+        partners = numpy.zeros(count, dtype=numpy.int64)
+
+        #every NPC ends up either where it was or where it walked to, so only the feet whose swept rects overlap
+        #can meet.  pairs that overlapped before never count
+        corners = numpy.minimum(before[:, :2], after[:, :2])
+        far_corners = numpy.maximum(before[:, :2] + before[:, 2:], after[:, :2] + after[:, 2:])
+        first, second = self.broadphase.pairs(numpy.concatenate((corners, far_corners - corners), axis=1))
+        keep = (moved[first] | moved[second]) & ~broadphase.overlapping(before[first], before[second])
+        first, second = first[keep], second[keep]
+
+        #NPCs that walk into feet that stay put stop.  of two NPCs that walk into each other, the one walking into
+        #the other's old place stops, or the second one if neither does, so NPCs crossing paths do not both wait
+        entered = broadphase.overlapping(after[first], after[second])
+        a, b = first[entered], second[entered]
+        a_stops = moved[a] & (~moved[b] | broadphase.overlapping(after[a], before[b]))
+        b_stops = moved[b] & (~moved[a] | broadphase.overlapping(after[b], before[a]))
+        b_stops |= moved[a] & moved[b] & ~a_stops & ~b_stops
+        movers = numpy.concatenate((a[a_stops], b[b_stops]))
+        others = numpy.concatenate((b[a_stops], a[b_stops]))
+        if not len(movers):
+            return stopped, before[partners]
+        partners[movers] = others
+
+        #an NPC that walks into the old place of another one stops when that one stops
+        both = moved[first] & moved[second]
+        first_into = both & broadphase.overlapping(after[first], before[second])
+        second_into = both & broadphase.overlapping(before[first], after[second])
+        sources = numpy.concatenate((second[first_into], first[second_into]))
+        targets = numpy.concatenate((first[first_into], second[second_into]))
+        order = numpy.argsort(sources, kind='stable')
+        bounds = numpy.searchsorted(sources[order], numpy.arange(count + 1)).tolist()
+        targets = targets[order].tolist()
+
+        #the stops spread along those pairs only, so this walks each one once
+        stopped[movers] = True
+        spreading = numpy.unique(movers).tolist()
+        while spreading:
+            index = spreading.pop()
+            for target in targets[bounds[index]:bounds[index + 1]]:
+                if not stopped[target]:
+                    stopped[target] = True
+                    partners[target] = index
+                    spreading.append(target)
+
+        positions[stopped] = start[stopped]
+        return stopped, before[partners]
+
+    def give_way(self, blocked, obstructions, dt):
+        """
+        Find another way for NPCs that walked into something for too long.  NPCs on a path ask 'reroute' for a way
+        around what is in their way after PATIENCE seconds, or stop.  NPCs on a flow field turn to another tile
+        nearer the goal after DETOUR_DELAY seconds, and stop following the field after PATIENCE seconds
+
+        :param: blocked, array of the indexes of the NPCs stopped by separate()
+        :param: obstructions, array of the (x, y, width, height) of what each one walked into
+        :param: dt, the length of time (in seconds) they were stopped for
+        """
+        times = self.blocked_times[blocked]
+        impatient = times >= PATIENCE
+
+        rerouting = self.following[blocked] & impatient
+        for index, obstruction in zip(blocked[rerouting].tolist(), obstructions[rerouting].tolist()):
+            self.blocked_times[index] = 0.
+            if self.reroute is None:
+                self.stop(index)
+                continue
+            x, y = self.paths[index][-1]
+            offset_x, offset_y = self.feet_offsets[index].tolist()
+            self.reroute(self.npcs[index], (x + offset_x, y + offset_y), tuple(obstruction))
+
+        flowing = self.flows[blocked] >= 0
+        turning = blocked[flowing & (times >= DETOUR_DELAY) & (times - dt < DETOUR_DELAY)]
+        flows = self.flows[turning]
+        feet = self.positions[turning] + self.feet_offsets[turning]
+        for number, field in self.flow_fields.items():
+            on_field = flows == number
+            if on_field.any():
+                directions, _, cells = field.sample(feet[on_field])
+                detours = field.detours(numpy.maximum(cells, 0), directions)
+                detours[cells < 0] = NOT_MOVING
+                self.detours[turning[on_field]] = detours
+                self.detour_cells[turning[on_field]] = numpy.where(detours >= 0, cells, -1)
+
+        settling = blocked[flowing & impatient]
+        if len(settling):
+            for index in settling.tolist():
+                self.stop(index)
+                self.flows[index] = -1
+            self.forget_flow_fields()
+
+    def contacts(self):
+        """
+        :rtype: (count, 2) array of the indexes of the pairs of active NPCs whose feet are within CONTACT_RANGE of
+                each other
+        """
+        active = self.members[ACTIVE]
+        first, second = self.broadphase.pairs(self.feet_rects(active, self.positions[active]), CONTACT_RANGE)
+        return numpy.column_stack((active[first], active[second]))
+
+    def walk(self, npc, points):
+        """
+        Send an NPC along a path
+
+        :param: npc, character.NPC of the population
+        :param: points, (x, y) positions in pixels to walk the NPC's feet to, in order.  None or no points stops it
+        :rtype: False if the NPC is not in the population (any more)
+        """
+        index = self.index_of(npc)
+        if index is None:
+            return False
+
+        self.flows[index] = -1
+        if not points:
+            self.stop(index)
+            return True
+
+        #the sprite position that puts the NPC's feet on each point
+        width, height = npc.rect.size
+        offset_y = height - npc.feet.height / 2.
+        self.paths[index] = deque((x - width / 2., y - offset_y) for x, y in points)
+        self.following[index] = True
+        return True
+
+    def follow(self, npcs, field):
+        """
+        Send NPCs along a flow field, instead of any path they were walking
+
+        :param: npcs, list of character.NPC of the population
+        :param: field, pathfinding.FlowField, or None to stop the NPCs where they are
+        """
+        number = -1
+        if field is not None:
+            numbers = [known for known, flow_field in self.flow_fields.items() if flow_field is field]
+            number = numbers[0] if numbers else max(self.flow_fields, default=-1) + 1
+            self.flow_fields[number] = field
+
+        indexes = {id(npc): index for index, npc in enumerate(self.npcs)}
+        for npc in npcs:
+            index = indexes.get(id(npc))
+            if index is not None:
+                self.stop(index)
+                self.flows[index] = number
+        self.forget_flow_fields()
+
+    def forget_flow_fields(self):
+        followed = set(self.flows.tolist())
+        self.flow_fields = {number: field for number, field in self.flow_fields.items() if number in followed}
+
+    def index_of(self, npc):
+        """
+        :rtype: the index of an NPC in the arrays, or None if it is not in the population
+        """
+        for index, member in enumerate(self.npcs):
+            if member is npc:
+                return index
+        return None
+
+    def feet(self, npc):
+        """
+        :rtype: (x, y) center of an NPC's feet, where the population last moved it.  raises ValueError if the NPC
+                is not in the population, e.g. after its chunk was dropped
+        """
+        index = self.index_of(npc)
+        if index is None:
+            raise ValueError('{} is not in the npc population'.format(npc._name))
+        x, y = self.positions[index].tolist()
+        width, height = npc.rect.size
+        return x + width / 2., y + height - npc.feet.height / 2.
+
+    def stop(self, index):
+        self.paths[index] = None
+        self.following[index] = False
+        self.moving[index] = NOT_MOVING
+        self.blocked_times[index] = 0.
+        self.detour_cells[index] = -1
+
+    def steer(self, followers):
+        """
+        Turn NPCs on a path towards their next point, along the axis they are furthest from it on
+
+        :param: followers, array of the indexes of NPCs on a path
+        """
+        for index in followers.tolist():
+            x, y = self.positions[index].tolist()
+            target_x, target_y = self.paths[index][0]
+            if abs(target_x - x) >= abs(target_y - y):
+                direction = DIRECTIONS.index(character.RIGHT if target_x > x else character.LEFT)
+            else:
+                direction = DIRECTIONS.index(character.DOWN if target_y > y else character.UP)
+
+            if direction != self.directions[index]:
+                npc = self.npcs[index]
+                self.directions[index] = direction
+                self.frame_counts[index] = len(npc.movement_directions[DIRECTIONS[direction]])
+            self.moving[index] = direction
+
+    def arrive(self, followers):
+        """
+        Stop NPCs on a path where they reached or passed their next point along the axis they walked on, and move on
+        to the point after it once they are on it
+
+        :param: followers, array of the indexes of NPCs on a path
+        """
+        for index in followers.tolist():
+            path = self.paths[index]
+            x, y = self.positions[index].tolist()
+            target_x, target_y = path[0]
+            direction = DIRECTIONS[self.moving[index]]
+
+            if direction == character.RIGHT and x >= target_x or direction == character.LEFT and x <= target_x:
+                x = target_x
+            elif direction == character.DOWN and y >= target_y or direction == character.UP and y <= target_y:
+                y = target_y
+            self.positions[index] = (x, y)
+
+            if x == target_x and y == target_y:
+                path.popleft()
+                if not path:
+                    self.stop(index)
+
+    def flow(self, flowing):
+        """
+        Turn NPCs on a flow field the way it points on the tile under their feet.  An NPC off the middle of its tile
+        across the way it should walk first steps back onto the middle, so it does not catch on corners
+
+        :param: flowing, array of the indexes of NPCs on a flow field
+        :rtype: (indexes of the NPCs stepping onto the middle, the axis they step along, the position along it that
+                puts them on the middle, their position along it now), for align()
+        """
+        feet = self.positions[flowing] + self.feet_offsets[flowing]
+        directions = numpy.full(len(flowing), NOT_MOVING, dtype=numpy.int8)
+        centers = numpy.zeros((len(flowing), 2))
+        cells = numpy.full(len(flowing), -1, dtype=numpy.int64)
+        flows = self.flows[flowing]
+        for number, field in self.flow_fields.items():
+            on_field = flows == number
+            directions[on_field], centers[on_field], cells[on_field] = field.sample(feet[on_field])
+
+        #NPCs that turned off the field's way keep to their detour until they leave the tile they turned on
+        detour_cells = self.detour_cells[flowing]
+        detouring = (detour_cells >= 0) & (detour_cells == cells)
+        directions[detouring] = self.detours[flowing[detouring]]
+        self.detour_cells[flowing[~detouring]] = -1
+
+        #walking left or right needs the feet on the middle of the tile's height, up or down on the middle of its width
+        axes = numpy.where(directions >= 2, 1, 0)
+        rows = numpy.arange(len(flowing))
+        offsets = centers[rows, axes] - feet[rows, axes]
+        off = (directions >= 0) & (numpy.abs(offsets) > ALIGNMENT)
+        directions[off] = numpy.where(offsets[off] > 0, 1, 0) + numpy.where(axes[off] == 1, 0, 2)
+
+        walking = directions >= 0
+        turned = flowing[walking & (directions != self.directions[flowing])]
+        self.moving[flowing] = directions
+        self.directions[flowing[walking]] = directions[walking]
+        for index in turned.tolist():
+            self.frame_counts[index] = len(self.npcs[index].movement_directions[DIRECTIONS[self.directions[index]]])
+
+        aligning, axes = flowing[off], axes[off]
+        targets = centers[off, axes] - self.feet_offsets[aligning, axes]
+        return aligning, axes, targets, self.positions[aligning, axes]
+
+    def align(self, aligning, axes, targets, before):
+        """
+        Stop NPCs stepping onto the middle of their tile where they reached or passed it
+        """
+        now = self.positions[aligning, axes]
+        passed = (targets - before) * (targets - now) <= 0
+        self.positions[aligning[passed], axes[passed]] = targets[passed]
+
+    def near(self, area):
+        """
+        :param: area, pygame Rect of the map
+        :rtype: list of the active NPCs whose sprites collide with the area
+        """
+        active = self.members[ACTIVE]
+        x = self.positions[active, 0]
+        y = self.positions[active, 1]
+        margin = self.margin
+
+        close = active[(x > area.left - margin) & (x < area.right) & (y > area.top - margin) & (y < area.bottom)]
+        return [npc for npc in (self.npcs[index] for index in close.tolist()) if area.colliderect(npc.rect)]
+
+    def inside(self, area):
+        """
+        :param: area, pygame Rect of the map
+        :rtype: boolean array, True for the NPCs whose sprite is (at least partly) inside the area
+        """
+        x = self.positions[:, 0]
+        y = self.positions[:, 1]
+        margin = self.margin
+
+        return (x > area.left - margin) & (x < area.right) & (y > area.top - margin) & (y < area.bottom)
+
+    def update_zones(self, view):
+        """
+        Sort the NPCs into activity zones around a view
+
+        :param: view, pygame Rect of the visible part of the map.  None makes every NPC active
+        """
+        if view is None:
+            zones = numpy.full(len(self.npcs), ACTIVE, dtype=numpy.int8)
+        else:
+            zones = numpy.full(len(self.npcs), FROZEN, dtype=numpy.int8)
+            zones[self.inside(view.inflate(2*self.dormant_margin, 2*self.dormant_margin))] = DORMANT
+            zones[self.inside(view.inflate(2*self.active_margin, 2*self.active_margin))] = ACTIVE
+
+        self.zoned_view = None if view is None else view.copy()
+        self.zone_age = 0.
+
+        changed = zones != self.zones
+        if not changed.any():
+            return
+
+        #NPCs leaving a slow zone first catch up on the time since they last moved.  frozen time is lost
+        for zone, interval in self.intervals.items():
+            leaving = numpy.flatnonzero(changed & (self.zones == zone))
+            if interval is None:
+                self.moved_times[leaving] = self.clock
+            else:
+                self.catch_up(leaving)
+
+        entering = numpy.flatnonzero(changed & (zones == ACTIVE))
+        leaving = numpy.flatnonzero(changed & (self.zones == ACTIVE))
+
+        self.zones = zones
+        self.members = {zone: numpy.flatnonzero(zones == zone) for zone in ZONES}
+        self.moves += 1
+
+        self.sync(entering)
+        if self.group is not None:
+            self.group.remove([self.npcs[index] for index in leaving.tolist()])
+            self.group.add([self.npcs[index] for index in entering.tolist()])
+
+    def sync(self, indexes=None):
+        """
+        Write the simulated state back to the NPC sprites
+
+        :param: indexes, the NPCs to write back.  defaults to all of them
+        """
+        if indexes is None:
+            indexes = range(len(self.npcs))
+        else:
+            indexes = indexes.tolist()
+
+        positions = self.positions
+        old_positions = self.old_positions
+        velocities = self.velocities
+        moving = self.moving
+        for index in indexes:
+            npc = self.npcs[index]
+            direction = DIRECTIONS[self.directions[index]]
+            frame_number = int(self.frame_numbers[index])
+
+            npc._position = positions[index].tolist()
+            npc._old_position = old_positions[index].tolist()
+            npc.velocity = velocities[index].tolist()
+            npc.direction = direction
+            npc.paused = moving[index] == NOT_MOVING
+            npc.animation_time = float(self.animation_times[index])
+
+            npc.rect.topleft = npc._position
+            npc.feet.midbottom = npc.rect.midbottom
+
+            if frame_number != npc.frame_number or direction != npc.frame_direction:
+                npc.frame_number = frame_number
+                npc.frame_direction = direction
+                npc.image = npc.movement_directions[direction][frame_number]
@@ -0,0 +1,149 @@
+import json
+import os.path
+from collections import ChainMap
+
+import pygame
+
+import character
+
+CATALOG_FILE = os.path.join('data', 'npcs', 'npcs.json') #npcs shared by every map.  optional
+
+DIRECTIONS = (character.UP, character.DOWN, character.LEFT, character.RIGHT)
+
+
+def validate(npc_id, info, source, sheets=None):
+    """
+    Check an NPC definition and fill in its optional fields
+
+    :param: npc_id, id of the NPC
+    :param: info, the NPC's definition as read from the json file
+    :param: source, where the definition was read from, for error messages
+    :param: sheets, set of sprite sheets already found to exist, shared by the definitions of a file
+    :rtype: dictionary with 'name', 'image_src', 'direction', 'moving_direction' and 'lines'
+    """
+    def error(message):
+        return ValueError('{}: npc {!r} {}'.format(source, npc_id, message))
+
+    if not isinstance(info, dict):
+        raise error('must be a json object')
+
+    for field in ('name', 'image_src'):
+        if not isinstance(info.get(field), str):
+            raise error('needs a "{}" string'.format(field))
+    if sheets is None or info['image_src'] not in sheets:
+        if not os.path.exists(character.get_image_location(info['image_src'])):
+            raise error('sprite sheet "{}" does not exist'.format(info['image_src']))
+        if sheets is not None:
+            sheets.add(info['image_src'])
+
+    definition = dict(info)
+    definition.setdefault('direction', character.DOWN)
+    definition.setdefault('moving_direction', None)
+    definition.setdefault('lines', [])
+
+    if definition['direction'] not in DIRECTIONS:
+        raise error('has an unknown direction {!r}'.format(definition['direction']))
+    if definition['moving_direction'] not in DIRECTIONS + (None,):
+        raise error('has an unknown moving direction {!r}'.format(definition['moving_direction']))
+    if not (isinstance(definition['lines'], list) and all(isinstance(line, str) for line in definition['lines'])):
+        raise error('"lines" must be a list of strings')
+
+    return definition
+
+
+def build_npcs(definitions, rects, npc_ids, source=None):
+    """
+    Build the NPCs of a map in one pass.  NPCs with the same sprite sheet share its frames through the sprite atlas
+
+    :param: definitions, mapping of {npc id: definition}, from NPCStore.definitions
+    :param: rects, (x, y, width, height) of every NPC
+    :param: npc_ids, id of every NPC
+    :param: source, the map the NPCs are on, for error messages
+    :rtype: list of character.NPC
+    """
+    npcs = list()
+    for rect, npc_id in zip(rects, npc_ids):
+        try:
+            definition = definitions[npc_id]
+        except KeyError:
+            raise ValueError('{}: there is no npc {!r}'.format(source, npc_id))
+
+        npc = character.NPC(definition)
+        npc.position = pygame.Rect(rect)
+        npcs.append(npc)
+
+    return npcs
+
+
+class NPCStore(object):
+    """
+    NPC STORE
+    NPC definitions read from json files of {npc id: definition}.  Every file is parsed and validated once,
+    and only read again after it is modified.
+
+    -definitions(filename) - the definitions a map can use: its own npc file's, then the shared catalog's.
+     Looking up an id is a dictionary lookup in each, no matter how many NPCs the files hold
+    -load(filename) - the validated definitions of one file.  A missing file has no definitions
+    -a compiled map passes the definitions it was compiled with as 'data', they are validated once per bundle
+    """
+    def __init__(self, catalog=CATALOG_FILE):
+        self.catalog = catalog
+        self._files = dict() #{filename: (modification time or compiled data, definitions)}
+        self._views = dict() #{filename: (file definitions, catalog definitions, ChainMap)}
+
+        self.parses = 0
+
+    def load(self, filename, data=None):
+        """
+        :param: filename, path to a json file of NPC definitions
+        :param: data, the file's contents if they were already read (from a compiled map)
+        :rtype: dictionary of {npc id: definition}
+        """
+        if data is None:
+            try:
+                stamp = os.path.getmtime(filename)
+            except OSError:
+                return dict()
+        else:
+            stamp = data
+
+        cached = self._files.get(filename)
+        if cached is not None and (cached[0] is stamp or (data is None and cached[0] == stamp)):
+            return cached[1]
+
+        if data is None:
+            with open(filename) as npc_file:
+                try:
+                    data = json.load(npc_file)
+                except ValueError as error:
+                    raise ValueError('{}: {}'.format(filename, error))
+        if not isinstance(data, dict):
+            raise ValueError('{}: must be a json object of {{npc id: definition}}'.format(filename))
+        self.parses += 1
+
+        sheets = set()
+        definitions = {npc_id: validate(npc_id, info, filename, sheets) for npc_id, info in data.items()}
+        self._files[filename] = (stamp, definitions)
+        return definitions
+
+    def definitions(self, filename, data=None):
+        """
+        :param: filename, path to a map's json file of NPC definitions
+        :param: data, the file's contents if they were already read (from a compiled map)
+        :rtype: mapping of {npc id: definition}, the map's own definitions hiding the catalog's
+        """
+        own = self.load(filename, data)
+        shared = self.load(self.catalog)
+
+        view = self._views.get(filename)
+        if view is None or view[0] is not own or view[1] is not shared:
+            view = self._views[filename] = (own, shared, ChainMap(own, shared))
+        return view[2]
+
+    def clear(self):
+        self._files.clear()
+        self._views.clear()
+
+
+#the store shared by every map in the process
+STORE = NPCStore()
@@ -3,22 +3,43 @@ import os.path
 
 import pygame
 from pygame.locals import *
-from pytmx.util_pygame import load_pygame
-
-import pyscroll
-import pyscroll.data
-from pyscroll.group import PyscrollGroup
-
-import json
 
 import character
-import dialogboxes
+import collisionmap
+import collisionresolver
+import dirtygroup
+import mapcache
+import mapbundle
+import maploader
+import npcpopulation
+import npcstore
+import pathfinding
+import profiler
+import spatialhash
+import spritesheets
+import triggers
+import worldobjects
 
 #set up some constants
 RESOURCES_DIR = 'data'
 ZOOM_LEVEL = 1.5
 PLAYER_MOVE_SPEED = 100 #pixels per second
 RUN_MULTIPLIER = 2.0 #increases movement speed when holding left shift
+NPC_RANGE = 16 #pixels around the player in which npcs are near enough to talk to
+
+#world objects the player can touch.  when the player touches more than one, later types take priority
+INTERACTION_TYPES = ('sign', 'portal', 'item')
+
+#collision modes.  'objects' only uses blocker objects, 'tiles' also uses the map's collision layer and blocker tiles
+#a map can choose its own mode with a 'collision' map property
+COLLISION_OBJECTS = 'objects'
+COLLISION_TILES = 'tiles'
+
+#overworld attributes that belong to the current map.  kept together in the map cache when the player leaves a map
+MAP_STATE = ('tmx_data', 'map_layer', 'group',
+             'blockers', 'portals', 'signs', 'items', 'npcs', 'starting_player_position',
+             'blocker_index', 'portal_index', 'sign_index', 'item_index', 'collision_map', 'resolver', 'npc_population',
+             'world', 'triggers', 'pathfinder')
 
 
 # make loading maps a little easier
@@ -26,6 +47,11 @@ def get_map(filename):
     return os.path.join(RESOURCES_DIR, 'maps', filename)
 
 
+# the json file containing NPC info for a map
+def get_npc_file(mapfile):
+    return os.path.join(RESOURCES_DIR, 'npcs', str(mapfile)[:-4]+'_npcs.json')
+
+
 class Overworld(object):
     """
     THE OVERWORLD
@@ -39,21 +65,52 @@ class Overworld(object):
     -screensize - the size of the pygame window
     
     -map_layer - the portion of the map currently in the viewfinder
+    -map_loader - loads the maps behind the portals of the current map in the background
+    -map_cache - keeps recently left maps built, so returning to them is quick
     -playercharacter - sprite of the player's character.  contains 'feet' rect used to test for collisions with the world
     -group - pyscroll group containing the map_layer and playercharacter
     
     -moving_up/down/left/right - flags to indicate whether the player is currently moving up/down/left/right
     
     -blockers - list of all rect objects that are blockers to prevent the player from moving into prohibitted areas (walls, trees, etc)
-    -portals - list of all rect objects that are portals.  collison with a portal results in a new map being loaded and initialized
-    -items - list of all rect objects that are items.  items can be picked up and added to the playercharacter's inventory
+    -portals - list of all portals (worldobjects.Portal).  collison with a portal results in a new map being loaded and initialized
+    -items - list of all items (worldobjects.Item).  items can be picked up and added to the playercharacter's inventory
     -npcs - list of all npc characters.  can be interacted with, resulting in conversations
-    -signs - list of all sign objects. can be interacted with, resulting in message being displayed
+    -npc_population - simulates the movement and animation of all npcs at once.  only npcs near the camera are
+     animated and kept in the group to be drawn, npcs further away are updated less often or not at all
+    -signs - list of all signs (worldobjects.Sign). can be interacted with, resulting in message being displayed
+    
+    -blocker_index/portal_index/sign_index/item_index - spatial hashes of the world objects, used for collision checks
+    -collision_map - bit-packed grid of blocking tiles, or None if the map uses the 'objects' collision mode
+    -resolver - moves the player and npcs only as far as they can go without walking into blockers or blocking tiles.
+     blocked sprites slide along walls, and fast sprites can not pass through thin blockers
+    -triggers - calls back when the player comes into or leaves a sign, portal or item, or comes near an npc.
+     the player is only tested against them when it moves, or when the npcs around it move
+    -collision_type/current_interaction - the kind of the world object the player touches and the object, or None
+    -nearby_npcs - the npcs within NPC_RANGE of the player
+    -touching_npcs - the npcs whose feet touch the player's.  the player and npcs stop short of walking into each
+     other, and the player slides along npcs like along walls.  npc_population.contacts() finds the npcs touching
+     each other
+    -pathfinder - finds paths for npcs around the map's blockers and blocking tiles, a few every update.
+     None until an npc is first sent somewhere with walk_npc_to() or send_npcs_to().  crowds sent to one place
+     share a flow field.  call its add_blocker/remove_blocker when blockers come and go, to keep paths and
+     fields up to date
+    -threaded_paths - searches for paths run on a worker thread instead of a slice of every update
+    -chunk_size - maps are split into chunks this many tiles wide, and only the world objects of the chunks around
+     the player are kept loaded.  None loads the whole map.  a map can choose its own size with a 'chunk_size' map property
+    -world - streams the chunks of the current map, or None if the whole map is loaded.  the world object lists
+     and indexes above only hold the objects of the loaded chunks
+    
+    -profiler - times the phases of update and draw.  off unless the overworld is created with profile=True or F3 is pressed
+    -dirty_rendering - while the camera stands still, draw only redraws what changed and returns the changed rects
+    -startup - times the loading phases up to the first frame drawn.  NPC sprite sheets are loaded in the background,
+     NPCs are invisible until theirs is ready
     ------------------------------------------------------------------------------------------------------------------------------------
     
     METHODS
     ------------------------------------------------------------------------------------------------------------------------------------
-    -draw(surface) - draws the portion of the map currently in view and sprites to a pygame surface
+    -draw(surface, alpha) - draws the portion of the map currently in view and sprites to a pygame surface.
+     returns the rects of the surface that were drawn over
     -update(dt) - updates the position of sprites and map since last called.  called every frame
     -handle_input(keyboard) - responds to keyboard input from the user.  Takes a bitmap of current keystates
     -load_new_map(mapfile) - loads and intitializes a new tmx map into the viewport
@@ -62,11 +119,31 @@ class Overworld(object):
     
     """
         
-    def __init__(self, mapfile, screensize=(800, 800)):
+    def __init__(self, mapfile, screensize=(800, 800), collision_mode=COLLISION_OBJECTS,
+                 cached_maps=mapcache.MAX_CACHED_MAPS, map_cache_bytes=mapcache.MAX_CACHE_BYTES, profile=False,
+                 dirty_rendering=False, chunk_size=None, startup=None, threaded_paths=False):
         self.mapfile = mapfile
         self.filename = get_map(self.mapfile)
-        self.tmx_data = load_pygame(self.filename)
         self.screensize = screensize
+        self.collision_mode = collision_mode
+        self.chunk_size = chunk_size
+        self.threaded_paths = threaded_paths
+        
+        #frame timings.  profiling costs a call to an empty function per phase while it is off
+        self.profiler = profiler.FrameProfiler(profile)
+        self.startup = startup if startup is not None else profiler.StartupTrace()
+        
+        #screen areas last drawn over the map by the overworld, redrawn when they change in dirty rendering
+        self.dirty_rendering = dirty_rendering
+        self.drawn_dialog = None
+        self.dialog_rect = None
+        self.overlay_rect = None
+        
+        #load the map and create its renderer (camera)
+        self.map_loader = maploader.MapLoader(self.screensize, ZOOM_LEVEL)
+        self.map_cache = mapcache.MapCache(cached_maps, map_cache_bytes)
+        self.tmx_data, self.map_layer = self.map_loader.load(self.filename)
+        self.startup.mark('map')
                 
         #lists to hold world objects 
         self.blockers = list()
@@ -76,15 +153,24 @@ class Overworld(object):
         self.npcs = list()
         self.starting_player_position = None
         
+        #spatial indexes of the world objects.  built by populate_world
+        self.blocker_index = None
+        self.portal_index = None
+        self.sign_index = None
+        self.item_index = None
+        self.collision_map = None
+        self.resolver = None
+        self.triggers = None
+        self.pathfinder = None
+        self.npc_population = None
+        self.world = None
+        
         #populate the world object lists
         self.populate_world()
+        self.startup.mark('world objects')
         
-        #create new data source for pyscroll
-        map_data = pyscroll.data.TiledMapData(self.tmx_data)
-        
-        #create new renderer (camera)
-        self.map_layer = pyscroll.BufferedRenderer(map_data, self.screensize)
-        self.map_layer.zoom = ZOOM_LEVEL
+        #start loading the maps the portals lead to
+        self.preload_destinations()
         
         #find the player layer on the map
         default = 0
@@ -95,7 +181,7 @@ class Overworld(object):
                 break
                 
         #create a pyscroll group.  Set default layer to layer where character will be
-        self.group = PyscrollGroup(map_layer=self.map_layer, default_layer=default)
+        self.group = dirtygroup.DirtyGroup(map_layer=self.map_layer, default_layer=default)
         
         #create the player to place in the world
         self.playercharacter = character.Character()
@@ -105,9 +191,13 @@ class Overworld(object):
         
         #add the player to the pyscroll group
         self.group.add(self.playercharacter)
+        self.startup.mark('player')
         
-        for npc in self.npcs:
-            self.group.add(npc)
+        #only the npcs near the camera are kept in the group and fully simulated
+        self.npc_population.attach(self.group)
+        self.group.center(self.starting_player_position)
+        self.npc_population.update_zones(self.map_layer.view_rect)
+        self.startup.mark('npcs')
         
         #flags to control the movement of the player character
         self.moving_up = self.moving_down = self.moving_left = self.moving_right = False
@@ -115,26 +205,79 @@ class Overworld(object):
         #interaction info
         self.collision_type = None
         self.current_interaction = None
+        self.nearby_npcs = list()
+        self.touching_npcs = list()
         self.is_interacting = False
         
         self.dialog_box = None
                 
         
-    def draw(self, surface):
+    def draw(self, surface, alpha=1.0):
         """
         Draws the current view to the screensize
         
         :param: surface, the main display surface of the game
+        :param: alpha, how far (0 to 1) the frame is between the last two updates.  sprites and the map are drawn
+                between their old and new positions, so a fixed timestep simulation still scrolls smoothly
+        :return: list of the rects of the surface that were drawn over, for pygame.display.update
         """
-        #center the map/screen on the player
-        self.group.center(self.playercharacter.rect.center)
+        self.profiler.start()
         
-        #draw the map and all sprites
-        self.group.draw(surface)
+        #show the sprite sheets that finished loading in the background
+        if spritesheets.ATLAS.finish_loading():
+            self.group.invalidate()
         
-        #draw dialog boxes, if any
-        if self.is_interacting:
-            self.dialog_box.draw(surface, (0, self.screensize[1]-self.dialog_box.height))
+        #place the sprites between their last two positions
+        interpolated = alpha < 1.0
+        if interpolated:
+            for sprite in self.group.sprites():
+                old_x, old_y = sprite._old_position[:2]
+                x, y = sprite._position[:2]
+                sprite.rect.topleft = (old_x + (x - old_x)*alpha, old_y + (y - old_y)*alpha)
+            self.profiler.lap('interpolation')
+        
+        #center the map/screen on the player
+        self.group.center(self.playercharacter.rect.center)
+        self.profiler.lap('camera')
+        
+        #draw the map and all sprites.  dirty rendering also redraws the map under dialog boxes and overlays that changed
+        dialog_box = self.dialog_box if self.is_interacting else None
+        if self.dirty_rendering:
+            areas = list()
+            if dialog_box is not self.drawn_dialog and self.dialog_rect is not None:
+                areas.append(self.dialog_rect)
+            if self.overlay_rect is not None:
+                areas.append(self.overlay_rect)
+            rects = self.group.draw_dirty(surface, areas)
+        else:
+            self.group.draw(surface)
+            rects = [surface.get_rect()]
+        self.profiler.lap('map and sprites')
+        
+        #put the sprites back where the simulation has them
+        if interpolated:
+            for sprite in self.group.sprites():
+                sprite.rect.topleft = sprite._position[:2]
+            self.profiler.lap('interpolation')
+        
+        #draw dialog boxes, if any.  a dialog box that did not change is only drawn again if the map was drawn over it
+        self.dialog_rect = None
+        if dialog_box is not None:
+            self.dialog_rect = dialog_box.rect.move(0, self.screensize[1]-dialog_box.height)
+            if dialog_box is not self.drawn_dialog or dialog_box.dirty or self.dialog_rect.collidelist(rects) != -1:
+                rects.append(dialog_box.draw(surface, self.dialog_rect.topleft))
+        self.drawn_dialog = dialog_box
+        self.profiler.lap('dialog')
+        
+        #show the frame timings over the game
+        self.overlay_rect = None
+        if self.profiler.enabled:
+            self.overlay_rect = self.profiler.draw_overlay(surface)
+            rects.append(self.overlay_rect)
+        self.profiler.end_frame()
+        self.startup.finish('first frame')
+        
+        return rects
    
     #update the position of the sprites, map, etc
     def update(self, dt):
@@ -143,28 +286,53 @@ class Overworld(object):
         
         :param: dt, the length of time (in seconds) since last updated
         """
+        self.profiler.start()
+        
         #start or stop the animation of the player character
         if (self.moving_up or self.moving_down or self.moving_left or self.moving_right):
             self.playercharacter.paused = False
-            self.playercharacter.move_conductor.play()
         else:
             self.playercharacter.paused = True
-            self.playercharacter.move_conductor.pause()
-        
-        #use pyscroll to update the position of sprites
-        self.group.update(dt)
         
-        #check if colliding with any world objects
-        self.collision_type = self.get_collision_type()
+        #update the position of the player and simulate the npcs.  only npcs near the screen are animated
+        self.playercharacter.update(dt)
+        self.profiler.lap('player')
+        
+        #hand the npcs the paths found since the last update
+        if self.pathfinder is not None:
+            self.pathfinder.update()
+            self.profiler.lap('paths')
+        #npcs keep out of the way the player just moved along
+        player = self.playercharacter
+        player_feet = self.feet_at(player, player._old_position).union(player.feet)
+        self.npc_population.update(dt, self.map_layer.view_rect, [player_feet])
+        self.profiler.lap('npcs')
+        
+        #load the chunks of the map around the player and drop far away ones
+        if self.world is not None:
+            if self.world.update(self.playercharacter.rect.center):
+                self.preload_destinations()
+                self.triggers.refresh()
+            self.profiler.lap('chunks')
+        
+        #check what world objects the player came into or left.  sets collision_type and current_interaction
+        self.triggers.update(self.playercharacter.rect)
+        self.profiler.lap('interactions')
         
         if self.collision_type == None:
             self.is_interacting = False
         elif self.collision_type == 'portal':
-            self.load_new_map(self.current_interaction['destination'])
+            self.load_new_map(self.current_interaction.destination)
+            self.profiler.lap('map change')
+            
+        #type out the open dialog box
+        if self.is_interacting:
+            self.dialog_box.update(dt)
             
             
-        if self.playercharacter.feet.collidelist(self.blockers) > -1:
-            self.playercharacter.move_back(dt)
+        #keep the player out of blockers and npcs, sliding along them
+        self.move_player()
+        self.profiler.lap('collisions')
             
     
     def handle_movement(self, keyboard):
@@ -227,41 +395,63 @@ class Overworld(object):
                 sys.exit()
             elif event.key == K_SPACE:
                 self.interact()
+            elif event.key == K_F3:
+                self.profiler.toggle()
 
     def load_new_map(self, mapfile):
         """
-        Loads a new mapfile.  Resets all overworld attributes
+        Loads a new mapfile.  Resets all overworld attributes.
+        The map being left is kept in the map cache, and maps still in the cache are not rebuilt
         
         :param: mapfile, a .tmx map file
         """
-        #get the new map file and tmx data
+        #keep the map being left
+        self.group.remove(self.playercharacter)
+        self.map_cache.store(mapcache.MapContext(self.filename, {name: getattr(self, name) for name in MAP_STATE}))
+        
         self.mapfile = mapfile
         self.filename = get_map(self.mapfile)
-        self.tmx_data = load_pygame(self.filename)
-        map_data = pyscroll.data.TiledMapData(self.tmx_data)
-
-        #clear the old world objects and populate the new ones
-        self.blockers[:] = []
-        self.portals[:] = []
-        self.signs[:] = []
-        self.items[:] = []
-        self.portals[:] = []
-        self.populate_world()
         
-        #create new renderer (camera)
-        self.map_layer = pyscroll.BufferedRenderer(map_data, self.screensize)
-        self.map_layer.zoom = ZOOM_LEVEL
+        context = self.map_cache.take(self.filename)
+        if context is not None:
+            #the map is still built, just switch back to it
+            for name, value in context.state.items():
+                setattr(self, name, value)
+        else:
+            #get the new tmx data and renderer (camera).  usually already loaded in the background
+            self.tmx_data, self.map_layer = self.map_loader.load(self.filename)
+    
+            #populate the new world objects.  the old lists now belong to the cached map
+            self.blockers = list()
+            self.portals = list()
+            self.signs = list()
+            self.items = list()
+            self.npcs = list()
+            self.populate_world()
+            
+            #find the 'Player' layer on the map. if not found, playercharacter will be drawn on top of everything
+            default = 0
+            for layer in self.tmx_data.layers:
+                if not layer.name == 'Player':
+                    default += 1
+                elif layer.name == 'Player':
+                    break
+            
+            #create a pyscroll group.  Set default layer to layer where character will be
+            self.group = dirtygroup.DirtyGroup(map_layer=self.map_layer, default_layer=default)
+            
+            #npcs are added to the group as they come near the camera
+            self.npc_population.attach(self.group)
         
-        #find the 'Player' layer on the map. if not found, playercharacter will be drawn on top of everything
-        default = 0
-        for layer in self.tmx_data.layers:
-            if not layer.name == 'Player':
-                default += 1
-            elif layer.name == 'Player':
-                break
+        #the screen still shows the old map
+        self.group.invalidate()
         
-        #create a pyscroll group.  Set default layer to layer where character will be
-        self.group = PyscrollGroup(map_layer=self.map_layer, default_layer=default)
+        #sort the npcs into activity zones around where the player arrives
+        self.group.center(self.starting_player_position)
+        self.npc_population.update_zones(self.map_layer.view_rect)
+        
+        #start loading the maps the portals lead to
+        self.preload_destinations()
         
         #position the player in the center of the map ///// will be changed
         self.playercharacter.position = self.starting_player_position
@@ -269,16 +459,15 @@ class Overworld(object):
         #add the player to the pyscroll group
         self.group.add(self.playercharacter)
         
-        #add npcs
-        for npc in self.npcs:
-            self.group.add(npc)
-        
         #reset the movement flags
         self.moving_up = self.moving_down = self.moving_left = self.moving_right = False
         
-        #interaction info
+        #interaction info.  the player arrives in the map without touching anything yet
+        self.triggers.reset()
         self.collision_type = None
         self.current_interaction = None
+        self.nearby_npcs = list()
+        self.touching_npcs = list()
         self.is_interacting = False
         
         self.dialog_box = None
@@ -289,49 +478,234 @@ class Overworld(object):
         Parse the mapfile and populate the world objects dictionairies
         """
         
-        #load the json file containing NPC info for the current map if there is any
-        try:
-            npc_json_file_name = str(self.mapfile)[:-4]+'_npcs.json'
-            npc_json_file_location = os.path.join(RESOURCES_DIR, 'npcs', npc_json_file_name)
-            npc_json_file = open(npc_json_file_location)
-            npc_json_data = json.load(npc_json_file)
-        except:
-            pass
-        
-        for object in self.tmx_data.objects:
-            properties = object.__dict__
-            position = pygame.Rect(object.x, object.y, object.width, object.height)
+        #maps compiled into bundles have their objects sorted and their NPC info included
+        if isinstance(self.tmx_data, mapbundle.CompiledMap):
+            world_objects = self.tmx_data.world_objects
+            npc_data = self.tmx_data.npc_data
+        else:
+            world_objects = mapbundle.classify_objects(self.tmx_data)
+            npc_data = None
+        
+        #the NPC info of the map's json file (if there is any) and the shared catalog.  files are only parsed
+        #again after they change
+        npc_definitions = npcstore.STORE.definitions(get_npc_file(self.mapfile), npc_data)
+        
+        rects, _ = world_objects['player']
+        for position in rects.tolist():
+            self.starting_player_position = pygame.Rect(position).center
+        
+        #large maps only load the world objects around the player
+        chunk_size = int(self.tmx_data.properties.get('chunk_size', self.chunk_size) or 0)
+        if chunk_size:
+            self.populate_chunks(world_objects, npc_definitions, chunk_size)
+            return
+        self.world = None
+        
+        #populate the blockers list.  blockers are stored as rects
+        rects, _ = world_objects['blocker']
+        for position in rects.tolist():
+            self.blockers.append(worldobjects.make_world_object('blocker', position, None))
             
-            #populate the blockers list.  blockers are stored as rects
-            if properties['name'] == 'blocker':
-                self.blockers.append(position)
-                
-            #populate the portals list with portals. portals are stored as dictionaries {position:rect, destination:string}
-            elif properties['name'] == 'portal':            
-                destination = properties['type']
-                self.portals.append({'position':position,
-                                     'destination':destination})
-                
-            #populate the signs list with signs.  signs are stored as dictionaries {position:rect, message:string}
-            elif properties['name'] == 'sign':
-                message = properties['type']
-                self.signs.append({'position':position,
-                                    'message':message})
-                
-            #populate the items list with items.  items are stored as dictionaries {position:rect, name:string}
-            elif properties['name'] == 'item':
-                name = properties['type']
-                self.items.append({'position':position,
-                                   'name':name})
-                
-            #populate the npcs list with npcs.  npcs are stored as dictionaries {position:rect, name:string}
-            elif properties['name'] == 'npc':
-                new_npc = character.NPC(npc_json_data[properties['type']])
-                new_npc.position = position
-                self.npcs.append(new_npc)
+        #populate the portals, signs and items lists. they are stored as worldobjects.Portal/Sign/Item,
+        #with a position rect and their destination, message or name
+        for kind, objects in (('portal', self.portals), ('sign', self.signs), ('item', self.items)):
+            rects, values = world_objects[kind]
+            for position, value in zip(rects.tolist(), values):
+                objects.append(worldobjects.make_world_object(kind, position, value))
+            
+        #populate the npcs list with npcs
+        rects, npc_ids = world_objects['npc']
+        self.npcs.extend(npcstore.build_npcs(npc_definitions, rects.tolist(), npc_ids, self.mapfile))
+        
+        #index the world objects so collision checks only look at nearby objects
+        self.build_indexes()
+        
+        #simulate all the npcs together
+        self.npc_population = npcpopulation.NPCPopulation(self.npcs, resolver=self.resolver)
+        self.npc_population.reroute = self.walk_npc_to
+        
+    def populate_chunks(self, world_objects, npc_definitions, chunk_size):
+        """
+        Split the map into chunks and load the ones around the player's starting position.  The world object lists,
+        indexes and npc population are the chunked world's, which keeps them up to date as chunks are loaded
+        
+        :param: world_objects, the map's objects from mapbundle.classify_objects
+        :param: npc_definitions, NPC info of the map, from npcstore
+        :param: chunk_size, tiles on a side of a chunk
+        """
+        import chunkedworld
+        
+        collision_tiles = self.tmx_data.properties.get('collision', self.collision_mode) == COLLISION_TILES
+        self.world = chunkedworld.ChunkedWorld(self.tmx_data, world_objects, npc_definitions, chunk_size, collision_tiles)
+        
+        for name in ('blockers', 'portals', 'signs', 'items', 'npcs', 'blocker_index', 'portal_index', 'sign_index',
+                     'item_index', 'collision_map', 'npc_population'):
+            setattr(self, name, getattr(self.world, name))
+        self.resolver = collisionresolver.CollisionResolver(self.blocker_index, self.collision_map)
+        self.npc_population.resolver = self.resolver
+        self.npc_population.reroute = self.walk_npc_to
+        self.build_triggers()
+        
+        self.world.update(self.starting_player_position or (0, 0))
+        
+    def build_indexes(self):
+        """
+        Build the spatial indexes of the world objects lists.  The grid cells are the size of the map tiles
+        """
+        cell_size = max(self.tmx_data.tilewidth, self.tmx_data.tileheight)
+        
+        self.blocker_index = spatialhash.SpatialHash(cell_size)
+        for blocker in self.blockers:
+            self.blocker_index.add(blocker)
+        
+        self.portal_index = spatialhash.SpatialHash(cell_size)
+        for portal in self.portals:
+            self.portal_index.add(portal.position, portal)
+        
+        self.sign_index = spatialhash.SpatialHash(cell_size)
+        for sign in self.signs:
+            self.sign_index.add(sign.position, sign)
+        
+        self.item_index = spatialhash.SpatialHash(cell_size)
+        for item in self.items:
+            self.item_index.add(item.position, item)
+        
+        #build the grid of blocking tiles if the map uses them
+        if self.tmx_data.properties.get('collision', self.collision_mode) == COLLISION_TILES:
+            self.collision_map = collisionmap.CollisionMap.from_tmx(self.tmx_data)
+        else:
+            self.collision_map = None
+        
+        self.resolver = collisionresolver.CollisionResolver(self.blocker_index, self.collision_map)
+        self.build_triggers()
+        
+    def build_triggers(self):
+        """
+        Register the world objects and npcs the player can come into with a new trigger system
+        """
+        self.triggers = triggers.TriggerSystem(max(self.tmx_data.tilewidth, self.tmx_data.tileheight) * 2)
+        for object_type, index in (('sign', self.sign_index),
+                                   ('portal', self.portal_index),
+                                   ('item', self.item_index)):
+            self.triggers.add_volumes(object_type, index, on_enter=self.touch, on_exit=self.touch)
+        self.triggers.add_finder('npc', self.find_npcs, self.npc_moves, on_enter=self.meet_npc, on_exit=self.leave_npc)
+        
+    def touch(self, object_type, world_object):
+        """
+        Called when the player comes into or leaves a sign, portal or item.
+        Sets collision_type and current_interaction to the object the player touches with the highest priority
+        """
+        collision_type = None
+        for touched, touched_type in self.triggers.inside.items():
+            if touched_type not in INTERACTION_TYPES:
+                continue
+            if collision_type is None or INTERACTION_TYPES.index(touched_type) > INTERACTION_TYPES.index(collision_type):
+                self.current_interaction = touched
+                collision_type = touched_type
                 
-            elif properties['name'] == 'player':
-                self.starting_player_position = position.center
+        self.collision_type = collision_type
+        
+    def find_npcs(self, rect):
+        """
+        :rtype: list of the npcs within NPC_RANGE of a rect
+        """
+        return self.npc_population.near(rect.inflate(2*NPC_RANGE, 2*NPC_RANGE))
+        
+    def npc_moves(self):
+        return self.npc_population.moves
+        
+    def meet_npc(self, object_type, npc):
+        self.nearby_npcs.append(npc)
+        
+    def leave_npc(self, object_type, npc):
+        self.nearby_npcs.remove(npc)
+        
+    @staticmethod
+    def feet_at(sprite, position):
+        """
+        :param: sprite, character.Character or character.NPC
+        :param: position, (x, y) topleft of the sprite
+        :rtype: pygame Rect of the sprite's feet if it stood at the position
+        """
+        rect = sprite.rect.copy()
+        rect.topleft = position[:2]
+        feet = sprite.feet.copy()
+        feet.midbottom = rect.midbottom
+        return feet
+        
+    def move_player(self):
+        """
+        Move the player only as far as it can go without walking into blockers, blocking tiles or npcs.  the feet
+        of the npcs around it block it like blockers do, so it slides along them, and npcs the player already
+        touched do not stop it, so it can always walk away from them
+        """
+        player = self.playercharacter
+        old_feet = self.feet_at(player, player._old_position)
+        
+        #the few npcs anywhere near the player's move
+        reach = 2 * npcpopulation.CONTACT_RANGE
+        npcs = self.npc_population.near(old_feet.union(player.feet).inflate(reach, reach))
+        self.resolver.move_sprite(player, [npc.feet for npc in npcs])
+        
+        contact = player.feet.inflate(reach, reach)
+        self.touching_npcs = [npc for npc in npcs if contact.colliderect(npc.feet)]
+        
+    def get_pathfinder(self):
+        """
+        :rtype: the pathfinder of the current map.  its navigation grid is built from the whole map the first time
+                it is asked for, also on maps that are loaded in chunks
+        """
+        if self.pathfinder is None:
+            if self.world is not None:
+                blocker_rects = self.world.tables['blocker'].rects
+                collision_tiles = self.world.collision_layers
+            else:
+                blocker_rects = [tuple(blocker) for blocker in self.blockers]
+                collision_tiles = collisionmap.collision_layers(self.tmx_data) if self.collision_map is not None else None
+            
+            grid = pathfinding.NavigationGrid.from_map(self.tmx_data, blocker_rects, collision_tiles)
+            self.pathfinder = pathfinding.Pathfinder(grid, threaded=self.threaded_paths)
+            
+        return self.pathfinder
+        
+    def walk_npc_to(self, npc, position, avoid=None):
+        """
+        Send an npc walking to a position, around blockers.  The npc starts walking once its path is found,
+        and does not move if there is no path.  The population calls this again for an npc that is stuck behind
+        another npc or the player, to walk around them, and the npc stops where it is if there is no way around
+        
+        :param: npc, character.NPC on the current map
+        :param: position, (x, y) in map pixels for the npc's feet to walk to
+        :param: avoid, (x, y, width, height) in map pixels of something in the way for the path to go around, or None
+        :rtype: pathfinding.PathRequest.  raises ValueError if the npc is not on the map (any more), e.g. after the
+                chunk it stood in was dropped
+        """
+        population = self.npc_population
+        return self.get_pathfinder().request(population.feet(npc), position, lambda path: population.walk(npc, path),
+                                             avoid)
+
+    def send_npcs_to(self, npcs, position):
+        """
+        Send many npcs walking to the same position, around blockers, e.g. a crowd following the player.  They all
+        read their way from one flow field, which is cached for the next npcs sent there.  Npcs that can not reach
+        the position stand still
+        
+        :param: npcs, list of character.NPC on the current map
+        :param: position, (x, y) in map pixels for the npcs' feet to walk to
+        :rtype: pathfinding.FlowField
+        """
+        field = self.get_pathfinder().flow_field(position)
+        self.npc_population.follow(npcs, field)
+        return field
+        
+    def preload_destinations(self):
+        """
+        Start loading the maps behind the current map's portals in the background, unless they are still cached
+        """
+        for portal in self.portals:
+            filename = get_map(portal.destination)
+            if filename not in self.map_cache:
+                self.map_loader.preload(filename)
                 
     def interact(self):
         """
@@ -340,40 +714,15 @@ class Overworld(object):
         Sets interaction flags
         """
         
+        #dialog boxes load their font the first time one is opened
+        import dialogboxes
+        
         if self.collision_type == 'sign':
             if self.is_interacting == False:
                 self.is_interacting = True
-                self.dialog_box = dialogboxes.Sign(self.current_interaction['message'], width=self.screensize[0], height=self.screensize[1]//4) 
-            else:
+                self.dialog_box = dialogboxes.Sign(self.current_interaction.message, width=self.screensize[0], height=self.screensize[1]//4) 
+            elif not self.dialog_box.advance():
+                #long messages take more than one page.  the sign closes after the last one
                 self.is_interacting = False
-                
-    def get_collision_type(self):
-        """
-        Check what interactable object the playercharacter is currently colliding with, if any.
-        
-        :return: collison_type, or None if not colliding with an interactable object
-        """
-        collision_type = None
-        
-        for sign in self.signs:
-            if self.playercharacter.rect.colliderect(sign['position']):
-                self.current_interaction = sign
-                collision_type = 'sign'
-                break
-
-        for portal in self.portals:
-            if self.playercharacter.rect.colliderect(portal['position']):
-                self.current_interaction = portal
-                collision_type = 'portal'
-                break
-
-        for item in self.items:
-            if self.playercharacter.rect.colliderect(item['position']):
-                self.current_interaction = item
-                collision_type = 'item'
-                break
-
-                    
-        return collision_type
         
         
\ No newline at end of file
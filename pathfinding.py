@@ -0,0 +1,718 @@
+import heapq
+import mmap
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+import collisionmap
+
+PATH_BUDGET = .002 #seconds of path searching per update
+SEARCH_SLICE = 128 #cells a search expands between checks of the time budget
+MAX_CACHED_PATHS = 1024
+MAX_CACHED_FIELDS = 16
+
+UNREACHED = 2**31 - 1 #cost of the cells a search has not reached
+
+
+def int_buffer(size):
+    """
+    :rtype: memoryview of 'size' zeroed ints.  the memory is mapped from the system, which only hands out (and zeroes)
+            the pages that are used, so a short search does not pay for the size of the map
+    """
+    return memoryview(mmap.mmap(-1, 4 * size)).cast('i')
+
+
+class SearchBuffer(object):
+    """
+    The cost to reach every tile of a grid and the tile it was reached from, for one search at a time.  'stamps' marks
+    the entries the current search wrote, so the next search reuses the buffer without clearing it
+    """
+    def __init__(self, size):
+        self.stamps = int_buffer(size)
+        self.costs = int_buffer(size)
+        self.came_from = int_buffer(size)
+        self.stamp = 0
+
+
+class NavigationGrid(object):
+    """
+    NAVIGATION GRID
+    The tiles of a map that can be walked through.  A tile is blocked if any blocker object overlaps it, or if it
+    is a blocking tile.  Tiles outside of the map are blocked.
+
+    -cell_at(position) - the (column, row) of the tile a position (in pixels) is in
+    -center(cell) - the center of a tile in pixels
+    -is_open(cell) - whether a tile can be walked through
+    -cells_in(rect) - the (column, row) of the tiles of the map a rect (in pixels) overlaps
+    -add_blocker(rect) / remove_blocker(rect) - a blocker object was placed or taken away.  'counts' holds the number
+     of blockers (and blocking tiles) on every tile, so a tile only opens when the last one is gone.  'cells' is
+     replaced rather than changed, so a search keeps the tiles it started with
+    """
+    def __init__(self, counts, tilewidth, tileheight):
+        self.counts = counts
+        self.blocked = counts > 0
+        self.height, self.width = counts.shape
+        self.tilewidth = tilewidth
+        self.tileheight = tileheight
+
+        #one byte per tile, row by row.  searches index it with the tile's number (row * width + column).
+        #'open' is the same, flattened the other way round for flow fields
+        self.cells = self.blocked.astype(numpy.uint8).tobytes()
+        self.open = ~self.blocked.ravel()
+
+        #search buffers not in use.  a search borrows one while it runs
+        self.buffers = list()
+
+    @classmethod
+    def from_map(cls, tmx_data, blocker_rects, collision_tiles=None):
+        """
+        :param: tmx_data, pytmx TiledMap or mapbundle.CompiledMap
+        :param: blocker_rects, (x, y, width, height) of every blocker object of the map
+        :param: collision_tiles, the map's blocking tiles from collisionmap.collision_layers(), or None if the map
+                only uses blocker objects
+        :rtype: NavigationGrid
+        """
+        width, height = tmx_data.width, tmx_data.height
+        tilewidth, tileheight = tmx_data.tilewidth, tmx_data.tileheight
+
+        counts = numpy.zeros((height, width), dtype=numpy.int32)
+        if collision_tiles is not None:
+            counts += collisionmap.blocking_tiles(*collision_tiles, area=(0, 0, width, height))
+
+        #count the blockers on every tile at once: +1 at the corners where a blocker starts and -1 where it ends,
+        #summed along both axes
+        boxes = numpy.asarray(blocker_rects, dtype=numpy.float64).reshape(-1, 4).astype(numpy.int64)
+        boxes = boxes[(boxes[:, 2] > 0) & (boxes[:, 3] > 0)] #empty rects do not block, like pygame's
+        if len(boxes):
+            left = numpy.clip(boxes[:, 0] // tilewidth, 0, width)
+            top = numpy.clip(boxes[:, 1] // tileheight, 0, height)
+            right = numpy.clip(-(-(boxes[:, 0] + boxes[:, 2]) // tilewidth), left, width)
+            bottom = numpy.clip(-(-(boxes[:, 1] + boxes[:, 3]) // tileheight), top, height)
+
+            edges = numpy.zeros((height + 1, width + 1), dtype=numpy.int32)
+            numpy.add.at(edges, (top, left), 1)
+            numpy.add.at(edges, (top, right), -1)
+            numpy.add.at(edges, (bottom, left), -1)
+            numpy.add.at(edges, (bottom, right), 1)
+            counts += edges.cumsum(axis=0).cumsum(axis=1)[:height, :width]
+
+        return cls(counts, tilewidth, tileheight)
+
+    def cell_at(self, position):
+        return int(position[0] // self.tilewidth), int(position[1] // self.tileheight)
+
+    def center(self, cell):
+        return (cell[0] + .5) * self.tilewidth, (cell[1] + .5) * self.tileheight
+
+    def is_open(self, cell):
+        x, y = cell
+        return 0 <= x < self.width and 0 <= y < self.height and not self.blocked[y, x]
+
+    def area(self, rect):
+        """
+        :param: rect, (x, y, width, height) in pixels
+        :rtype: (left, top, right, bottom) columns and rows of the tiles the rect overlaps, clipped to the map
+        """
+        x, y, width, height = [int(value) for value in rect]
+        left = min(max(x // self.tilewidth, 0), self.width)
+        top = min(max(y // self.tileheight, 0), self.height)
+        if width <= 0 or height <= 0:
+            return left, top, left, top
+
+        right = min(max(-(-(x + width) // self.tilewidth), left), self.width)
+        bottom = min(max(-(-(y + height) // self.tileheight), top), self.height)
+        return left, top, right, bottom
+
+    def cells_in(self, rect):
+        left, top, right, bottom = self.area(rect)
+        return [(column, row) for row in range(top, bottom) for column in range(left, right)]
+
+    def borrow_buffer(self):
+        """
+        :rtype: SearchBuffer with a new stamp
+        """
+        buffer = self.buffers.pop() if self.buffers else SearchBuffer(self.width * self.height)
+        buffer.stamp += 1
+        if buffer.stamp == UNREACHED:
+            buffer.stamps = int_buffer(self.width * self.height)
+            buffer.stamp = 1
+        return buffer
+
+    def return_buffer(self, buffer):
+        self.buffers.append(buffer)
+
+    def add_blocker(self, rect):
+        """
+        :param: rect, (x, y, width, height) of a blocker object placed on the map
+        :rtype: array of the numbers of the tiles it blocked
+        """
+        return self.change_blocker(rect, 1)
+
+    def remove_blocker(self, rect):
+        """
+        :param: rect, (x, y, width, height) of a blocker object taken off the map
+        :rtype: array of the numbers of the tiles that opened
+        """
+        return self.change_blocker(rect, -1)
+
+    def change_blocker(self, rect, amount):
+        left, top, right, bottom = self.area(rect)
+        area = self.counts[top:bottom, left:right]
+        area += amount
+        blocked = area > 0
+        rows, columns = numpy.nonzero(blocked != self.blocked[top:bottom, left:right])
+        self.blocked[top:bottom, left:right] = blocked
+
+        changed = (rows + top) * self.width + columns + left
+        self.open[changed] = ~self.open[changed]
+        if len(changed):
+            #searches on the worker thread may still be reading the old cells
+            cells = bytearray(self.cells)
+            for cell in changed.tolist():
+                cells[cell] ^= 1
+            self.cells = bytes(cells)
+        return changed
+
+
+class PathSearch(object):
+    """
+    PATH SEARCH
+    A* search for the shortest path between two tiles of a navigation grid.  The search can be run a few cells
+    at a time, so a long search is spread over several updates.  Of the cells as promising as each other, the one
+    nearest the goal is expanded first, so open ground does not have to be searched in every direction.
+
+    -run(expansions) - expands up to 'expansions' cells (all of them if None).  returns True once the search is done
+    -path - tuple of the (column, row) of the tiles where the path starts, turns and ends, or None if the goal can not
+     be reached.  The start tile may be blocked, e.g. when an npc stands partly in a blocked tile
+    -avoid - (column, row) of open tiles the path does not go through, e.g. where another npc stands in the way
+    -cells - the grid's cells when the search was made.  the search does not see blockers changed after that
+    -stop() - gives up the search, e.g. to start it again after the blockers changed
+    """
+    def __init__(self, grid, start, goal, avoid=()):
+        self.grid = grid
+        self.start = start
+        self.goal = goal
+        self.avoid = avoid
+        self.cells = grid.cells
+        self.path = None
+        self.done = not (grid.is_open(goal) and 0 <= start[0] < grid.width and 0 <= start[1] < grid.height)
+
+        #open cells are kept in the heap as single ints of (estimate, distance to the goal, cell number), which
+        #sort the same as tuples of them.  ints are cheaper to compare and are not tracked by the garbage collector
+        self.node_bits = (grid.width * grid.height).bit_length()
+        self.distance_bits = (grid.width + grid.height).bit_length()
+
+        #the cost to reach every cell and the cell it was reached from, in a buffer borrowed from the grid while the
+        #search runs.  only the entries with the buffer's stamp belong to this search
+        self.open_list = None
+        self.buffer = None
+
+    def begin(self):
+        start = self.start[1] * self.grid.width + self.start[0]
+        distance = self.distance(self.start)
+
+        self.open_list = [((distance << self.distance_bits | distance) << self.node_bits) | start]
+        self.buffer = self.grid.borrow_buffer()
+        self.buffer.stamps[start] = self.buffer.stamp
+        self.buffer.costs[start] = 0
+        self.buffer.came_from[start] = -1
+
+        #avoided tiles look reached at a cost no way to them beats, so they are never entered
+        for column, row in self.avoid:
+            cell = row * self.grid.width + column
+            if cell != start and 0 <= column < self.grid.width and 0 <= row < self.grid.height:
+                self.buffer.stamps[cell] = self.buffer.stamp
+                self.buffer.costs[cell] = -1
+
+    def distance(self, cell):
+        return abs(cell[0] - self.goal[0]) + abs(cell[1] - self.goal[1])
+
+    def run(self, expansions=None):
+        """
+        :param: expansions, the most cells to expand, or None to finish the search
+        :rtype: True if the search is done
+        """
+        if self.done:
+            return True
+        if self.open_list is None:
+            self.begin()
+
+        width, cells = self.grid.width, self.cells
+        last_column, size = width - 1, len(cells)
+        goal_x, goal_y = self.goal
+        goal = goal_y * width + goal_x
+        open_list = self.open_list
+        stamps, costs, came_from, stamp = self.buffer.stamps, self.buffer.costs, self.buffer.came_from, self.buffer.stamp
+        heappush, heappop = heapq.heappush, heapq.heappop
+        node_bits, distance_bits = self.node_bits, self.distance_bits
+        node_mask, distance_mask = (1 << node_bits) - 1, (1 << distance_bits) - 1
+
+        expanded = 0
+        while open_list:
+            if expansions is not None and expanded == expansions:
+                return False
+            entry = heappop(open_list)
+            node = entry & node_mask
+            entry >>= node_bits
+            cost = (entry >> distance_bits) - (entry & distance_mask)
+            if cost > costs[node]:
+                continue
+            if node == goal:
+                self.path = self.build_path(node)
+                break
+            expanded += 1
+
+            #the tiles above, below, left and right.  npcs do not walk diagonally
+            x = node % width
+            cost += 1
+            for next_node in (node - width, node + width, node - 1 if x else -1, node + 1 if x < last_column else -1):
+                if not 0 <= next_node < size or cells[next_node]:
+                    continue
+                if stamps[next_node] != stamp or cost < costs[next_node]:
+                    stamps[next_node] = stamp
+                    costs[next_node] = cost
+                    came_from[next_node] = node
+                    remaining = abs(next_node % width - goal_x) + abs(next_node // width - goal_y)
+                    heappush(open_list, ((cost + remaining << distance_bits | remaining) << node_bits) | next_node)
+
+        self.done = True
+        self.open_list = None
+        self.grid.return_buffer(self.buffer)
+        self.buffer = None
+        return True
+
+    def stop(self):
+        self.done = True
+        self.open_list = None
+        if self.buffer is not None:
+            self.grid.return_buffer(self.buffer)
+            self.buffer = None
+
+    def build_path(self, node):
+        """
+        :param: node, the goal's cell number
+        :rtype: tuple of the cells where the path starts, turns and ends
+        """
+        width, came_from = self.grid.width, self.buffer.came_from
+        cells = [node]
+        while came_from[node] >= 0:
+            node = came_from[node]
+            cells.append(node)
+        cells.reverse()
+
+        #keep only the cells where the path changes direction
+        turns = [cells[0]]
+        for before, cell, after in zip(cells, cells[1:], cells[2:]):
+            if cell - before != after - cell:
+                turns.append(cell)
+        if len(cells) > 1:
+            turns.append(cells[-1])
+
+        return tuple((cell % width, cell // width) for cell in turns)
+
+
+class PathRequest(object):
+    """
+    A path asked for from a Pathfinder.  'path' is set and the callbacks are called with it when 'done'
+    """
+    def __init__(self, start, goal, avoid=()):
+        self.start = start
+        self.goal = goal
+        self.avoid = avoid
+        self.path = None
+        self.done = False
+        self.callbacks = list()
+        self.search = None
+        self.future = None
+
+    def finish(self, path):
+        self.path = path
+        self.done = True
+        for callback in self.callbacks:
+            callback(path)
+        self.callbacks = None
+
+
+class FlowField(object):
+    """
+    FLOW FIELD
+    The way to walk from every tile of a navigation grid to one goal tile, shared by any number of npcs going there.
+    The distance of every tile to the goal is spread out from the goal a ring of tiles at a time, with NumPy working
+    on the whole ring at once, and every tile points at its neighbour nearest the goal.
+
+    -directions - flat array of the direction to walk in on every tile (row * width + column): 0 up, 1 down, 2 left
+     and 3 right, the order of npcpopulation.DIRECTIONS.  -1 on the goal and on the tiles it can not be reached from.
+     Blocked tiles point out of themselves, so npcs that stand partly in one still find their way
+    -sample(positions) - the directions at an array of positions (in pixels), the centers of their tiles and the
+     tile numbers
+    -detours(cells, directions) - another direction towards the goal on some tiles, for npcs that can not walk the
+     way they were going
+    -distances - flat array of the number of steps from every tile to the goal, UNREACHED if there is no way
+    -update(changed) - repairs the field after tiles were blocked or opened.  Only the tiles whose way to the goal
+     led through the changed ones are spread out again
+    """
+    def __init__(self, grid, goal):
+        self.grid = grid
+        self.goal = goal
+        self.size = grid.width * grid.height
+        self.goal_cell = goal[1] * grid.width + goal[0]
+
+        self.distances = numpy.full(self.size, UNREACHED, dtype=numpy.int32)
+        self.directions = numpy.full(self.size, -1, dtype=numpy.int8)
+        if grid.is_open(goal):
+            self.distances[self.goal_cell] = 0
+            self.spread(numpy.array([self.goal_cell]))
+        self.point(numpy.arange(self.size))
+
+    def neighbours(self, cells):
+        """
+        :param: cells, array of tile numbers
+        :rtype: (array of the tiles above, below, left and right of them, array of the tile each one neighbours)
+        """
+        width = self.grid.width
+        columns = cells % width
+        found = numpy.concatenate((cells - width, cells + width, numpy.where(columns > 0, cells - 1, -1),
+                                   numpy.where(columns < width - 1, cells + 1, -1)))
+        sources = numpy.tile(cells, 4)
+        inside = (found >= 0) & (found < self.size)
+        return found[inside], sources[inside]
+
+    def spread(self, seeds):
+        """
+        Lower the distances of the open tiles that are nearer the goal through the seed tiles, one ring of tiles
+        at a time.  Seeds further from the goal join the ring when it reaches their distance
+
+        :param: seeds, array of the numbers of tiles whose distance is known
+        :rtype: array of the tiles whose distance was lowered
+        """
+        distances, open_cells = self.distances, self.grid.open
+        seeds = seeds[distances[seeds] < UNREACHED]
+        seeds = seeds[numpy.argsort(distances[seeds], kind='stable')]
+        levels = distances[seeds]
+
+        lowered = list()
+        start = 0
+        frontier = seeds[:0]
+        while True:
+            if not len(frontier):
+                if start == len(seeds):
+                    break
+                distance = int(levels[start])
+
+            #the seeds at this distance, unless a shorter way to them was found on the way
+            end = int(numpy.searchsorted(levels, distance, side='right'))
+            joining = seeds[start:end]
+            start = end
+            frontier = numpy.concatenate((frontier, joining[distances[joining] == distance]))
+
+            found, _ = self.neighbours(frontier)
+            found = found[open_cells[found]]
+            found = numpy.unique(found[distances[found] > distance + 1])
+            distances[found] = distance + 1
+            lowered.append(found)
+            frontier = found
+            distance += 1
+
+        return numpy.concatenate(lowered) if lowered else seeds[:0]
+
+    def cut_off(self, cells):
+        """
+        :param: cells, array of the numbers of tiles that were blocked
+        :rtype: array of the tiles and every tile whose shortest ways to the goal all led through them.  A tile that
+                is still one step from a tile nearer the goal keeps its distance
+        """
+        distances, open_cells = self.distances, self.grid.open
+        found = numpy.zeros(self.size, dtype=bool)
+        found[cells] = True
+        frontier = cells[distances[cells] < UNREACHED]
+        while len(frontier):
+            #the tiles one step further from the goal than the ones just cut off
+            neighbours, sources = self.neighbours(frontier)
+            after = neighbours[(distances[neighbours] == distances[sources] + 1) & ~found[neighbours]]
+            after = numpy.unique(after)
+
+            #are cut off too if none of their neighbours one step nearer the goal is left.  a tile kept here is
+            #looked at again if one of those is cut off later
+            neighbours, sources = self.neighbours(after)
+            kept = (distances[neighbours] == distances[sources] - 1) & open_cells[neighbours] & ~found[neighbours]
+            frontier = after[~numpy.isin(after, sources[kept])]
+            found[frontier] = True
+        return numpy.flatnonzero(found)
+
+    def point(self, cells):
+        """
+        Point tiles at their neighbour nearest the goal.  Of neighbours as near as each other, tiles on the black
+        squares of a checkerboard take the one above or below and the others the one left or right, so npcs
+        coming from far away walk in staircases spread over the ground instead of all along the goal's row
+
+        :param: cells, array of tile numbers
+        """
+        distances, width = self.distances, self.grid.width
+        columns = cells % width
+        across = (cells // width + columns) % 2 == 1
+        nearest = numpy.full(len(cells), UNREACHED, dtype=numpy.int32)
+        directions = numpy.full(len(cells), -1, dtype=numpy.int8)
+        steps = ((cells - width, cells >= width), (cells + width, cells < self.size - width),
+                 (cells - 1, columns > 0), (cells + 1, columns < width - 1))
+        for direction, (neighbours, inside) in enumerate(steps):
+            distance = numpy.full(len(cells), UNREACHED, dtype=numpy.int32)
+            distance[inside] = distances[neighbours[inside]]
+            nearer = (distance < nearest) | (distance == nearest) & (distance < UNREACHED) & across & (direction >= 2)
+            nearest[nearer] = distance[nearer]
+            directions[nearer] = direction
+
+        directions[nearest >= distances[cells]] = -1
+        self.directions[cells] = directions
+
+    def update(self, changed):
+        """
+        :param: changed, array of the numbers of the tiles that were blocked or opened, from
+                NavigationGrid.add_blocker or remove_blocker
+        """
+        if not len(changed):
+            return
+        distances, open_cells = self.distances, self.grid.open
+
+        #the tiles whose way to the goal went through a tile that was blocked are cut off, and so are the tiles
+        #that opened, until the distances spread back to them from their neighbours
+        closed = changed[~open_cells[changed]]
+        reset = numpy.concatenate((self.cut_off(closed), changed[open_cells[changed]]))
+        distances[reset] = UNREACHED
+
+        neighbours, _ = self.neighbours(reset)
+        seeds = neighbours[distances[neighbours] < UNREACHED]
+        if open_cells[self.goal_cell] and distances[self.goal_cell]:
+            distances[self.goal_cell] = 0
+            seeds = numpy.append(seeds, self.goal_cell)
+        lowered = self.spread(numpy.unique(seeds))
+
+        touched = numpy.concatenate((reset, lowered))
+        neighbours, _ = self.neighbours(touched)
+        self.point(numpy.unique(numpy.concatenate((touched, neighbours))))
+
+    def detours(self, cells, directions):
+        """
+        :param: cells, array of tile numbers
+        :param: directions, array of the direction not to take on each tile
+        :rtype: array of the direction to a neighbour nearer the goal than each tile other than 'directions', or -1
+                where there is none
+        """
+        distances, width = self.distances, self.grid.width
+        columns = cells % width
+        detours = numpy.full(len(cells), -1, dtype=numpy.int8)
+        steps = ((cells - width, cells >= width), (cells + width, cells < self.size - width),
+                 (cells - 1, columns > 0), (cells + 1, columns < width - 1))
+        for direction, (neighbours, inside) in enumerate(steps):
+            nearer = inside & (directions != direction) & (detours < 0)
+            nearer[nearer] = distances[neighbours[nearer]] < distances[cells[nearer]]
+            detours[nearer] = direction
+        return detours
+
+    def sample(self, positions):
+        """
+        :param: positions, array of (x, y) positions in pixels
+        :rtype: (array of the directions at the positions, -1 outside of the map, array of the centers of their
+                tiles in pixels, array of the tile numbers, -1 outside of the map)
+        """
+        grid = self.grid
+        columns = (positions[:, 0] // grid.tilewidth).astype(numpy.int64)
+        rows = (positions[:, 1] // grid.tileheight).astype(numpy.int64)
+        inside = (columns >= 0) & (columns < grid.width) & (rows >= 0) & (rows < grid.height)
+
+        cells = numpy.where(inside, rows * grid.width + columns, -1)
+        directions = numpy.full(len(positions), -1, dtype=numpy.int8)
+        directions[inside] = self.directions[cells[inside]]
+        centers = numpy.column_stack(((columns + .5) * grid.tilewidth, (rows + .5) * grid.tileheight))
+        return directions, centers, cells
+
+
+class Pathfinder(object):
+    """
+    PATHFINDER
+    Finds paths around the blockers of a map for any number of npcs, without spending more than 'budget' seconds
+    of an update on it.
+
+    -request(start, goal, callback) - asks for a path between two positions (in pixels).  Paths are cached by their
+     start and goal tile, so npcs walking between the same places share one search.  callback(path) is called with
+     the tuple of tile centers (in pixels) to walk through, or None if there is no path.  A path asked for with
+     an 'avoid' rect goes around the tiles it overlaps, e.g. to walk around an npc in the way, and is not cached
+    -update() - works on the searches asked for, oldest first, until the time budget is used up.  A search that
+     does not finish goes on in the next update.  With 'threaded' the searches run on a worker thread instead, and
+     update() only hands out the finished ones.  The worker still shares the interpreter lock with the game, so it
+     spreads the searches over time rather than running them alongside it.  Callbacks are always called from update(), or from request() when
+     the path is cached
+    -clear() - forgets the cached paths, after the grid changed
+    -flow_field(goal) - the FlowField to a position (in pixels), for many npcs going to the same place.  The last
+     'max_fields' fields are cached, and fields dropped from the cache are handed out again while anything still
+     uses them
+    -add_blocker(rect) / remove_blocker(rect) - a blocker object was placed or taken away.  The grid and every flow
+     field still in use are updated, and the cached paths forgotten.  Searches not finished yet are started again
+     on the changed grid
+    """
+    def __init__(self, grid, budget=PATH_BUDGET, threaded=False, max_cached=MAX_CACHED_PATHS,
+                 max_fields=MAX_CACHED_FIELDS):
+        self.grid = grid
+        self.budget = budget
+        self.threaded = threaded
+        self.max_cached = max_cached
+        self.max_fields = max_fields
+
+        self.cache = OrderedDict() #{(start tile, goal tile, ()): path}, least recently used first
+        self.pending = dict() #{(start tile, goal tile, avoided tiles): PathRequest}
+        self.queue = deque()
+        self.fields = OrderedDict() #{goal tile: FlowField}, least recently used first
+        self.live_fields = weakref.WeakValueDictionary() #{goal tile: FlowField} of every field not freed yet
+
+        self.searches = 0
+        self._executor = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def points(self, cells):
+        """
+        :rtype: tuple of the centers (in pixels) of tiles, or None if 'cells' is None
+        """
+        return None if cells is None else tuple(self.grid.center(cell) for cell in cells)
+
+    def request(self, start, goal, callback=None, avoid=None):
+        """
+        :param: start, goal, (x, y) positions in pixels
+        :param: callback, function called with the path once it is found
+        :param: avoid, (x, y, width, height) in pixels of a part of the map the path goes around, or None
+        :rtype: PathRequest
+        """
+        avoided = ()
+        if avoid is not None:
+            avoided = self.grid.cells_in(avoid)
+
+            #something on the start tile can not be avoided there, so the way out of the tile towards it is
+            column, row = self.grid.cell_at(start)
+            if (column, row) in avoided:
+                x, y, width, height = avoid
+                dx, dy = x + width / 2. - start[0], y + height / 2. - start[1]
+                if abs(dx) >= abs(dy):
+                    avoided.append((column + (1 if dx > 0 else -1), row))
+                else:
+                    avoided.append((column, row + (1 if dy > 0 else -1)))
+            avoided = tuple(avoided)
+        key = (self.grid.cell_at(start), self.grid.cell_at(goal), avoided)
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            request = PathRequest(*key)
+            if callback is not None:
+                request.callbacks.append(callback)
+            request.finish(self.cache[key])
+            return request
+
+        request = self.pending.get(key)
+        if request is None:
+            request = self.pending[key] = PathRequest(*key)
+            self.start_search(request)
+            self.queue.append(request)
+
+        if callback is not None:
+            request.callbacks.append(callback)
+        return request
+
+    def start_search(self, request):
+        request.search = PathSearch(self.grid, request.start, request.goal, request.avoid)
+        self.searches += 1
+        if self.threaded:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            request.future = self._executor.submit(request.search.run)
+
+    def update(self):
+        """
+        Work on the searches asked for, and call the callbacks of the ones that finished
+        """
+        if not self.queue:
+            return
+
+        if self.threaded:
+            while self.queue and self.queue[0].future.done():
+                request = self.queue.popleft()
+                if request.search.cells is not self.grid.cells:
+                    #it ran on the cells from before the blockers changed
+                    request.future.result()
+                    self.start_search(request)
+                    self.queue.append(request)
+                    continue
+                self.finish(request)
+            return
+
+        deadline = time.perf_counter() + self.budget
+        while self.queue:
+            request = self.queue[0]
+            if request.search.run(SEARCH_SLICE):
+                self.finish(self.queue.popleft())
+            if time.perf_counter() >= deadline:
+                break
+
+    def finish(self, request):
+        key = (request.start, request.goal, request.avoid)
+        del self.pending[key]
+
+        if request.future is not None:
+            request.future.result() #raises what the search raised on the worker thread
+        path = self.points(request.search.path)
+        request.search = None
+        if not request.avoid:
+            self.cache[key] = path
+            if len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+
+        request.finish(path)
+
+    def clear(self):
+        self.cache.clear()
+
+    def flow_field(self, goal):
+        """
+        :param: goal, (x, y) position in pixels
+        :rtype: FlowField
+        """
+        cell = self.grid.cell_at(goal)
+        field = self.fields.get(cell)
+        if field is not None:
+            self.fields.move_to_end(cell)
+            return field
+
+        field = self.live_fields.get(cell)
+        if field is None:
+            field = self.live_fields[cell] = FlowField(self.grid, cell)
+        self.fields[cell] = field
+        if len(self.fields) > self.max_fields:
+            self.fields.popitem(last=False)
+        return field
+
+    def add_blocker(self, rect):
+        self.blockers_changed(self.grid.add_blocker(rect))
+
+    def remove_blocker(self, rect):
+        self.blockers_changed(self.grid.remove_blocker(rect))
+
+    def blockers_changed(self, changed):
+        """
+        :param: changed, array of the numbers of the tiles that were blocked or opened
+        """
+        if not len(changed):
+            return
+        self.clear()
+        for field in list(self.live_fields.values()):
+            field.update(changed)
+
+        #searches still waiting for the worker thread are started again.  the one it is running is started again
+        #when it finishes
+        for request in self.queue:
+            if self.threaded:
+                if request.future.cancel():
+                    self.start_search(request)
+            else:
+                request.search.stop()
+                self.start_search(request)
@@ -0,0 +1,256 @@
+import csv
+import json
+import time
+from collections import OrderedDict
+
+import numpy
+import pygame
+
+import textrender
+
+HISTORY_FRAMES = 600 #frames of timings kept for the statistics
+PERCENTILES = (50, 95, 99)
+OVERLAY_REFRESH = 0.5 #seconds between redraws of the overlay text
+OVERLAY_COLOR = (255, 255, 0)
+OVERLAY_BACKGROUND = (0, 0, 0)
+
+
+def ignore(*args):
+    pass
+
+
+class StartupTrace(object):
+    """
+    STARTUP TRACE
+    Time from starting the game to its first frame, split into phases.
+
+    -mark(phase) - adds the time since the last mark (or the start) to a phase
+    -finish(phase) - marks the last phase.  Later marks are ignored, so code that runs every frame can mark cheaply
+    -total - seconds from the start to the last mark
+    -report() - the phases and total as lines of text
+    """
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.last = self.start
+        self.phases = OrderedDict()
+        self.finished = False
+
+    def mark(self, phase):
+        if self.finished:
+            return
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.) + now - self.last
+        self.last = now
+
+    def finish(self, phase):
+        self.mark(phase)
+        self.finished = True
+
+    @property
+    def total(self):
+        return self.last - self.start
+
+    def report(self):
+        """
+        :rtype: string with the time (in milliseconds) of each phase and the total
+        """
+        lines = ['{:<20}{:>9.1f} ms'.format(phase, seconds * 1000) for phase, seconds in self.phases.items()]
+        lines.append('{:<20}{:>9.1f} ms'.format('time to first frame', self.total * 1000))
+        return '\n'.join(lines)
+
+
+class FrameProfiler(object):
+    """
+    FRAME PROFILER
+    Times the phases of every frame and keeps the timings of the last 'history' frames in ring buffers.
+
+    -start() marks the beginning of timed work, lap(phase) adds the time since the last mark to a phase
+    -end_frame() closes the frame.  The frame time is the time since the previous end_frame()
+    -summary() gives the p50/p95/p99 (and mean/max) time of each phase and of the whole frame, in seconds
+    -draw_overlay(surface) shows the summary on screen, dump(filename) writes the timings as .csv or .json
+    -when disabled, start/lap/end_frame are a call to a function that does nothing
+    """
+    def __init__(self, enabled=False, history=HISTORY_FRAMES):
+        self.history = history
+        self.frame_times = numpy.zeros(history)
+        self.phases = OrderedDict()
+        self.frames = 0
+
+        self._current = dict()
+        self._last = 0.
+        self._frame_start = None
+
+        self._overlay = None
+        self._overlay_time = 0.
+
+        self.enable(enabled)
+
+    def enable(self, enabled=True):
+        """
+        Turn timing on or off
+
+        :param: enabled, True to time frames
+        """
+        self.enabled = enabled
+        if enabled:
+            self.start = self._start
+            self.lap = self._lap
+            self.end_frame = self._end_frame
+        else:
+            self.start = self.lap = self.end_frame = ignore
+            self._frame_start = None
+            self._current.clear()
+
+    def toggle(self):
+        self.enable(not self.enabled)
+
+    def reset(self):
+        """
+        Forget every recorded frame
+        """
+        self.frame_times[:] = 0
+        self.phases.clear()
+        self.frames = 0
+        self._frame_start = None
+        self._current.clear()
+
+    def _start(self):
+        self._last = time.perf_counter()
+
+    def _lap(self, phase):
+        now = time.perf_counter()
+        self._current[phase] = self._current.get(phase, 0.) + now - self._last
+        self._last = now
+
+    def _end_frame(self):
+        now = time.perf_counter()
+
+        #the first frame has no start to be timed from
+        if self._frame_start is None:
+            self._frame_start = now
+            self._current.clear()
+            return
+
+        slot = self.frames % self.history
+        self.frame_times[slot] = now - self._frame_start
+        for phase, times in self.phases.items():
+            times[slot] = self._current.pop(phase, 0.)
+        for phase, elapsed in self._current.items():
+            times = self.phases[phase] = numpy.zeros(self.history)
+            times[slot] = elapsed
+
+        self._current.clear()
+        self.frames += 1
+        self._frame_start = now
+
+    def samples(self, phase=None):
+        """
+        :param: phase, name of a phase, or None for the whole frame
+        :rtype: array of the recorded times (in seconds), oldest first
+        """
+        times = self.frame_times if phase is None else self.phases[phase]
+        if self.frames < self.history:
+            return times[:self.frames].copy()
+
+        slot = self.frames % self.history
+        return numpy.concatenate((times[slot:], times[:slot]))
+
+    def histogram(self, phase=None, bins=20):
+        """
+        :param: phase, name of a phase, or None for the whole frame
+        :param: bins, number of histogram bins
+        :rtype: (counts, bin edges in seconds), as from numpy.histogram
+        """
+        return numpy.histogram(self.samples(phase), bins=bins)
+
+    def summary(self):
+        """
+        :rtype: dictionary of {phase: {'p50', 'p95', 'p99', 'mean', 'max'}} in seconds.  'frame' is the whole frame
+        """
+        summary = OrderedDict()
+        if not self.frames:
+            return summary
+
+        for phase in [None] + list(self.phases):
+            times = self.samples(phase)
+            stats = OrderedDict(('p{}'.format(percentile), value)
+                                for percentile, value in zip(PERCENTILES, numpy.percentile(times, PERCENTILES)))
+            stats['mean'] = float(times.mean())
+            stats['max'] = float(times.max())
+            summary['frame' if phase is None else phase] = stats
+
+        return summary
+
+    def draw_overlay(self, surface, position=(4, 4)):
+        """
+        Draw the p50/p95/p99 times (in milliseconds) onto a surface.  The text is only rebuilt every OVERLAY_REFRESH seconds
+
+        :param: surface, pygame Surface to draw on
+        :param: position, topleft of the overlay
+        :rtype: rect of the surface drawn over
+        """
+        now = time.perf_counter()
+        if self._overlay is None or now - self._overlay_time >= OVERLAY_REFRESH:
+            self._overlay = self.build_overlay()
+            self._overlay_time = now
+
+        return surface.blit(self._overlay, position)
+
+    def build_overlay(self):
+        """
+        :rtype: pygame Surface with a line of p50/p95/p99 times for the frame and each phase
+        """
+        lines = ['{:<14}{:>7}{:>7}{:>7}'.format('ms', 'p50', 'p95', 'p99')]
+        for phase, stats in self.summary().items():
+            lines.append('{:<14}{:>7.2f}{:>7.2f}{:>7.2f}'.format(
+                phase[:13], stats['p50']*1000, stats['p95']*1000, stats['p99']*1000))
+
+        font = textrender.get_font()
+        rendered = [font.render(line, False, OVERLAY_COLOR, OVERLAY_BACKGROUND) for line in lines]
+
+        overlay = pygame.Surface((max(line.get_width() for line in rendered),
+                                  sum(line.get_height() for line in rendered)))
+        overlay.fill(OVERLAY_BACKGROUND)
+        y = 0
+        for line in rendered:
+            overlay.blit(line, (0, y))
+            y += line.get_height()
+
+        return overlay
+
+    def dump(self, filename):
+        """
+        Write the recorded timings (in seconds) to a .json file (summary and samples) or any other file as csv
+
+        :param: filename, path of the file to write
+        """
+        if filename.lower().endswith('.json'):
+            self.dump_json(filename)
+        else:
+            self.dump_csv(filename)
+
+    def dump_csv(self, filename):
+        """
+        Write one row per recorded frame: the frame time and the time of each phase
+
+        :param: filename, path of the .csv file to write
+        """
+        columns = [self.samples()] + [self.samples(phase) for phase in self.phases]
+        with open(filename, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['frame'] + list(self.phases))
+            for row in zip(*columns):
+                writer.writerow(['{:.9f}'.format(value) for value in row])
+
+    def dump_json(self, filename):
+        """
+        Write the summary and the samples of every phase
+
+        :param: filename, path of the .json file to write
+        """
+        data = {'frames': self.frames,
+                'summary': self.summary(),
+                'samples': OrderedDict([('frame', self.samples().tolist())] +
+                                       [(phase, self.samples(phase).tolist()) for phase in self.phases])}
+        with open(filename, 'w') as json_file:
+            json.dump(data, json_file, indent=2)
@@ -0,0 +1,301 @@
+#! /usr/bin/python3.5
+
+"""
+INPUT RECORDING AND REPLAY OF MY 2D GAME ENGINE
+Records the keys held down and the key presses of every simulation tick to a small file, and plays them back into
+an overworld at the same fixed timestep.  A replay takes the same steps as the recorded session, so it can time
+the same play session on different builds, and it checks that the game ends up in the same state as it did.
+
+record: python3 example.py --record session.replay
+usage:  python3 replay.py session.replay [profile.json|profile.csv] [--draw]
+        with a profile file, the time spent in each phase of every tick is written to it
+        with --draw, every tick is also drawn to an offscreen surface
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+
+import numpy
+import pygame
+from pygame.locals import *
+
+import overworld
+import simulation
+
+MAGIC = b'RPLY'
+VERSION = 1
+HEADER = struct.Struct('<4sIQ') #magic, version, length of the json header
+
+#the keys Overworld.handle_movement reads.  a tick's keyboard state is stored as a bit for each of them
+RECORDED_KEYS = (K_LSHIFT, K_UP, K_w, K_DOWN, K_s, K_LEFT, K_a, K_RIGHT, K_d)
+
+#key presses that end the game are not recorded, the recording ends there
+ENDING_KEYS = (K_ESCAPE,)
+
+CHECK_INTERVAL = 60 #ticks between checksums of the game state
+
+
+def key_mask(keyboard):
+    """
+    :param: keyboard, state of the keys, indexed by key constant
+    :rtype: bits of the recorded keys held down
+    """
+    mask = 0
+    for bit, key in enumerate(RECORDED_KEYS):
+        if keyboard[key]:
+            mask |= 1 << bit
+    return mask
+
+
+def checksum(game):
+    """
+    :param: game, overworld.Overworld
+    :rtype: crc32 of the map, player position and NPC positions of a game
+    """
+    value = zlib.crc32(game.filename.encode('utf-8'))
+    value = zlib.crc32(struct.pack('<2d', *game.playercharacter._position[:2]), value)
+    if game.npc_population is not None:
+        value = zlib.crc32(numpy.ascontiguousarray(game.npc_population.positions).tobytes(), value)
+    return value
+
+
+class ReplayKeys(object):
+    """
+    Keyboard state read back from a recorded key mask
+    """
+    def __init__(self, mask=0):
+        self.mask = mask
+
+    def __getitem__(self, key):
+        try:
+            return bool(self.mask >> RECORDED_KEYS.index(key) & 1)
+        except ValueError:
+            return False
+
+
+class Recording(object):
+    """
+    RECORDING
+    The input of a play session, tick by tick.
+
+    -settings - the overworld arguments the session started with (map, screen size, collision mode, chunk size)
+    -masks - array of the recorded keys held down in every tick, see key_mask.  Saved as runs of equal masks,
+     since keys are held for many ticks
+    -events - array of (tick, key) key presses.  A press at tick n was handled after n ticks had run
+    -checks - dictionary of {tick: checksum of the game state after that tick}
+    """
+    def __init__(self, settings, tick_rate=simulation.TICK_RATE, masks=None, events=None, checks=None):
+        self.settings = settings
+        self.tick_rate = tick_rate
+        self.masks = masks if masks is not None else numpy.zeros(0, dtype=numpy.uint16)
+        self.events = events if events is not None else numpy.zeros((0, 2), dtype=numpy.int64)
+        self.checks = checks if checks is not None else dict()
+
+    @property
+    def ticks(self):
+        return len(self.masks)
+
+    def save(self, filename):
+        """
+        :param: filename, path to write the recording to
+        """
+        masks = numpy.asarray(self.masks, dtype=numpy.uint16)
+        starts = numpy.flatnonzero(numpy.diff(masks, prepend=numpy.int32(-1)) != 0) if len(masks) else masks[:0]
+        lengths = numpy.diff(numpy.append(starts, len(masks))).astype(numpy.uint32)
+        run_masks = masks[starts]
+        events = numpy.asarray(self.events, dtype=numpy.int64).reshape(-1, 2)
+
+        header = {'settings': self.settings,
+                  'tick_rate': self.tick_rate,
+                  'runs': len(lengths),
+                  'events': len(events),
+                  'checks': sorted(self.checks.items())}
+        header_bytes = json.dumps(header).encode('utf-8')
+
+        with open(filename, 'wb') as replay_file:
+            replay_file.write(HEADER.pack(MAGIC, VERSION, len(header_bytes)))
+            replay_file.write(header_bytes)
+            for array in (lengths, run_masks, events):
+                replay_file.write(array.tobytes())
+
+    @classmethod
+    def load(cls, filename):
+        """
+        :param: filename, path to a recording
+        :rtype: Recording
+        """
+        with open(filename, 'rb') as replay_file:
+            data = replay_file.read()
+
+        magic, version, header_length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{}: not a version {} recording'.format(filename, VERSION))
+        header = json.loads(data[HEADER.size:HEADER.size + header_length].decode('utf-8'))
+
+        offset = HEADER.size + header_length
+        lengths = numpy.frombuffer(data, dtype=numpy.uint32, count=header['runs'], offset=offset)
+        offset += lengths.nbytes
+        run_masks = numpy.frombuffer(data, dtype=numpy.uint16, count=header['runs'], offset=offset)
+        offset += run_masks.nbytes
+        events = numpy.frombuffer(data, dtype=numpy.int64, count=header['events'] * 2, offset=offset).reshape(-1, 2)
+
+        return cls(header['settings'], header['tick_rate'], numpy.repeat(run_masks, lengths), events,
+                   {tick: value for tick, value in header['checks']})
+
+
+class Recorder(object):
+    """
+    RECORDER
+    Records the input a simulation is given.  Attach it with simulation.recorder = Recorder(simulation) before the
+    first tick, pass events to Simulation.handle_event, and save() the recording when the game ends.
+    """
+    def __init__(self, simulation):
+        game = simulation.game
+        settings = {'mapfile': game.mapfile,
+                    'screensize': list(game.screensize),
+                    'collision_mode': game.collision_mode,
+                    'chunk_size': game.chunk_size}
+        self.simulation = simulation
+        self.recording = Recording(settings, int(round(1. / simulation.timestep)))
+        self.masks = list()
+        self.events = list()
+
+    def step(self, keyboard):
+        """
+        Record a tick that just ran
+
+        :param: keyboard, state of the keys during the tick
+        """
+        self.masks.append(key_mask(keyboard))
+        ticks = len(self.masks)
+        if ticks % CHECK_INTERVAL == 0:
+            self.recording.checks[ticks] = checksum(self.simulation.game)
+
+    def event(self, event):
+        """
+        Record an event handled before the next tick
+        """
+        if event.type == KEYDOWN and event.key not in ENDING_KEYS:
+            self.events.append((len(self.masks), event.key))
+
+    def save(self, filename):
+        """
+        Write everything recorded so far, with the state the game ended in
+
+        :param: filename, path to write the recording to
+        """
+        recording = self.recording
+        recording.masks = numpy.array(self.masks, dtype=numpy.uint16)
+        recording.events = numpy.array(self.events, dtype=numpy.int64).reshape(-1, 2)
+        recording.checks[len(self.masks)] = checksum(self.simulation.game)
+        recording.save(filename)
+
+
+class Replayer(object):
+    """
+    REPLAYER
+    Plays a recording back into a new overworld at the recorded timestep.
+
+    -run(surface) - runs every tick as fast as possible, drawing each one to 'surface' if it is given.
+     Every tick is a frame to the game's profiler
+    -mismatches - list of (tick, recorded checksum, replayed checksum) where the replay did not end up in the
+     recorded state.  Empty if the replay matched the session
+    -ticks_per_second - replayed ticks per second of real time
+    """
+    def __init__(self, recording, profile=False):
+        settings = recording.settings
+        self.recording = recording
+        self.game = overworld.Overworld(settings['mapfile'], screensize=tuple(settings['screensize']),
+                                        collision_mode=settings['collision_mode'], profile=profile,
+                                        chunk_size=settings['chunk_size'])
+        self.simulation = simulation.Simulation(self.game, recording.tick_rate)
+        self.mismatches = list()
+        self.ticks_per_second = 0.
+
+    def handle_events(self, events, tick):
+        """
+        :param: events, the (tick, key) presses not handled yet
+        :param: tick, the tick about to run
+        :rtype: the presses left
+        """
+        while len(events) and events[0][0] == tick:
+            self.simulation.handle_event(pygame.event.Event(KEYDOWN, key=int(events[0][1])))
+            events = events[1:]
+        return events
+
+    def check(self, tick):
+        expected = self.recording.checks.get(tick)
+        if expected is not None:
+            value = checksum(self.game)
+            if value != expected:
+                self.mismatches.append((tick, expected, value))
+
+    def run(self, surface=None):
+        """
+        :param: surface, pygame Surface to draw every tick to, or None to only simulate
+        :rtype: ticks per second of real time
+        """
+        game = self.game
+        step = self.simulation.step
+        end_frame = game.profiler.end_frame
+        keyboard = ReplayKeys()
+        events = self.recording.events
+
+        start = time.perf_counter()
+        for tick, mask in enumerate(self.recording.masks.tolist()):
+            events = self.handle_events(events, tick)
+            keyboard.mask = mask
+            step(keyboard)
+            if surface is not None:
+                game.draw(surface)
+            end_frame()
+            self.check(tick + 1)
+        elapsed = time.perf_counter() - start
+
+        #key presses after the last tick, before the game ended
+        self.handle_events(events, self.recording.ticks)
+        self.check(self.recording.ticks)
+
+        self.ticks_per_second = self.recording.ticks / elapsed if elapsed > 0 else float('inf')
+        return self.ticks_per_second
+
+
+def main():
+    arguments = [argument for argument in sys.argv[1:] if argument != '--draw']
+    if not arguments:
+        print(__doc__)
+        return
+    recording_file = arguments[0]
+    profile_file = arguments[1] if len(arguments) > 1 else None
+
+    #no window.  a tiny dummy display mode is still set so images can be converted
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+
+    recording = Recording.load(recording_file)
+    replayer = Replayer(recording, profile=profile_file is not None)
+    surface = pygame.Surface(replayer.game.screensize) if '--draw' in sys.argv else None
+    ticks_per_second = replayer.run(surface)
+
+    print('{}: {} ticks, {:.0f} ticks per second ({:.1f}x real time)'.format(
+        recording_file, recording.ticks, ticks_per_second, ticks_per_second / recording.tick_rate))
+    for tick, expected, value in replayer.mismatches:
+        print('state differs after tick {}: recorded {:08x}, replayed {:08x}'.format(tick, expected, value))
+    if not replayer.mismatches:
+        print('state matches the recording')
+
+    if profile_file is not None:
+        for phase, stats in replayer.game.profiler.summary().items():
+            print('{:<16} p50 {:8.1f}us  p95 {:8.1f}us  p99 {:8.1f}us'.format(
+                phase, stats['p50']*1e6, stats['p95']*1e6, stats['p99']*1e6))
+        replayer.game.profiler.dump(profile_file)
+
+    sys.exit(1 if replayer.mismatches else 0)
+
+if __name__ == '__main__':
+    main()
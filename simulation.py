@@ -0,0 +1,149 @@
+#! /usr/bin/python3.5
+
+"""
+FIXED TIMESTEP SIMULATION OF MY 2D GAME ENGINE
+Steps an overworld at a fixed timestep, separately from drawing it.  Run on its own, it simulates a map
+without a display (using SDL's dummy video driver) as fast as the CPU allows and reports the ticks per second.
+
+usage: python3 simulation.py [map.tmx] [ticks] [profile.json|profile.csv]
+       with a profile file, the time spent in each phase of every tick is written to it
+"""
+
+import os
+import sys
+import time
+
+import pygame
+
+import overworld
+
+TICK_RATE = 60 #simulation ticks per second
+MAX_TICKS_PER_FRAME = 5 #ticks run to catch up after a slow frame.  any more time than that is dropped
+
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+
+STARTING_MAP = 'map1.tmx'
+TICKS = 6000
+
+
+class NoKeys(object):
+    """
+    Keyboard state with no keys held down, for simulations without a player at the keyboard
+    """
+    def __getitem__(self, key):
+        return False
+
+NO_KEYS = NoKeys()
+
+
+class Simulation(object):
+    """
+    SIMULATION
+    Runs an overworld's updates at a fixed timestep, so the same input always gives the same result
+    no matter how fast the game is drawn.
+
+    -step(keyboard) - runs one tick with the given keyboard state
+    -handle_event(event) - passes an event to the game between ticks
+    -advance(frame_time, keyboard) - runs the ticks that fit in the time since the last frame, and returns how far
+     (0 to 1) the frame is between the last two ticks, for drawing with Overworld.draw(surface, alpha)
+    -run(ticks, keyboard) - runs ticks as fast as possible.  without drawing, every tick is a frame to the game's profiler
+    -ticks_per_second - simulated ticks per second of real time, measured over the last run()
+    -recorder - a replay.Recorder that records the input of every tick and event, or None
+    """
+    def __init__(self, game, tick_rate=TICK_RATE):
+        self.game = game
+        self.timestep = 1. / tick_rate
+        self.accumulator = 0.
+        self.ticks = 0
+        self.ticks_per_second = 0.
+        self.recorder = None
+
+    def step(self, keyboard=NO_KEYS):
+        """
+        Run one tick of the simulation
+
+        :param: keyboard, state of the keys during the tick
+        """
+        self.game.handle_movement(keyboard)
+        self.game.update(self.timestep)
+        self.ticks += 1
+        if self.recorder is not None:
+            self.recorder.step(keyboard)
+
+    def handle_event(self, event):
+        """
+        Handle an event before the next tick
+
+        :param: event, pygame event
+        """
+        if self.recorder is not None:
+            self.recorder.event(event)
+        self.game.handle_interaction(event)
+
+    def advance(self, frame_time, keyboard=NO_KEYS):
+        """
+        Run the ticks due since the last frame
+
+        :param: frame_time, the length of time (in seconds) since the last frame
+        :param: keyboard, state of the keys during the frame
+        :return: alpha, how far (0 to 1) the frame is between the last two ticks
+        """
+        self.accumulator += frame_time
+
+        ticks = 0
+        while self.accumulator >= self.timestep:
+            if ticks == MAX_TICKS_PER_FRAME:
+                self.accumulator = 0.
+                break
+            self.step(keyboard)
+            self.accumulator -= self.timestep
+            ticks += 1
+
+        return self.accumulator / self.timestep
+
+    def run(self, ticks, keyboard=NO_KEYS):
+        """
+        Run ticks as fast as possible
+
+        :param: ticks, number of ticks to run
+        :param: keyboard, state of the keys during the ticks
+        :return: ticks per second of real time
+        """
+        end_frame = self.game.profiler.end_frame
+        
+        start = time.perf_counter()
+        for _ in range(ticks):
+            self.step(keyboard)
+            end_frame()
+        elapsed = time.perf_counter() - start
+
+        self.ticks_per_second = ticks / elapsed if elapsed > 0 else float('inf')
+        return self.ticks_per_second
+
+
+def main():
+    mapfile = sys.argv[1] if len(sys.argv) > 1 else STARTING_MAP
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else TICKS
+    profile_file = sys.argv[3] if len(sys.argv) > 3 else None
+
+    #no window.  a tiny dummy display mode is still set so images can be converted
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+
+    game = overworld.Overworld(mapfile, screensize=(SCREEN_WIDTH, SCREEN_HEIGHT), profile=profile_file is not None)
+    simulation = Simulation(game)
+    ticks_per_second = simulation.run(ticks)
+
+    print('{}: {} ticks, {:.0f} ticks per second ({:.1f}x real time)'.format(
+        mapfile, ticks, ticks_per_second, ticks_per_second / TICK_RATE))
+
+    if profile_file is not None:
+        for phase, stats in game.profiler.summary().items():
+            print('{:<16} p50 {:8.1f}us  p95 {:8.1f}us  p99 {:8.1f}us'.format(
+                phase, stats['p50']*1e6, stats['p95']*1e6, stats['p99']*1e6))
+        game.profiler.dump(profile_file)
+
+if __name__ == '__main__':
+    main()
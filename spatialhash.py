@@ -0,0 +1,143 @@
+import pygame
+
+DEFAULT_CELL_SIZE = 32 #pixels
+
+
+class SpatialHash(object):
+    """
+    SPATIAL HASH
+    Uniform grid index of world object rects.  Each rect is stored in every grid cell it overlaps, so
+    a query only has to test the objects in the few cells around the query rect instead of every object in the world.
+
+    -add(rect, item, order) - stores an item (the rect itself by default) under its rect
+    -remove(rect, item) - removes an item stored under the rect
+    -query(rect) - every item colliding with the rect, in the order they were added (or by their 'order')
+    -collide(rect) - the first item colliding with the rect, or None
+    -collideany(rect) - whether anything collides with the rect
+    """
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = int(cell_size)
+        self.cells = dict()
+        self._count = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _cells(self, rect):
+        """
+        :rtype: iterator over the (column, row) keys of the cells a rect overlaps
+        """
+        size = self.cell_size
+        left = rect.left // size
+        top = rect.top // size
+
+        #an empty rect still belongs to the cell its corner is in
+        right = max(left, (rect.right - 1) // size)
+        bottom = max(top, (rect.bottom - 1) // size)
+
+        for column in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                yield (column, row)
+
+    def add(self, rect, item=None, order=None):
+        """
+        Add an item to the index
+
+        :param: rect, pygame Rect of the item
+        :param: item, object returned by queries.  defaults to the rect
+        :param: order, position of the item in query results.  defaults to after every item added so far
+        """
+        rect = pygame.Rect(rect)
+        if order is None:
+            order = self._count
+        entry = (order, rect, rect if item is None else item)
+        self._count = max(self._count, order + 1)
+        self._size += 1
+
+        cells = self.cells
+        for key in self._cells(rect):
+            try:
+                cells[key].append(entry)
+            except KeyError:
+                cells[key] = [entry]
+
+    def remove(self, rect, item=None):
+        """
+        Remove an item from the index
+
+        :param: rect, pygame Rect the item was added with
+        :param: item, the item that was added.  defaults to an item added without one under an equal rect
+        """
+        rect = pygame.Rect(rect)
+        cells = self.cells
+        keys = list(self._cells(rect))
+
+        #the entry to remove.  entries added without an item hold a copy of their rect as the item
+        found = None
+        for key in keys:
+            for entry in cells.get(key, ()):
+                if entry[2] is item if item is not None else entry[2] is entry[1] and entry[1] == rect:
+                    found = entry
+                    break
+            if found is not None:
+                break
+        if found is None:
+            return
+
+        for key in keys:
+            cell = cells.get(key)
+            if cell is None:
+                continue
+            kept = [entry for entry in cell if entry is not found]
+            if kept:
+                cells[key] = kept
+            else:
+                del cells[key]
+
+        self._size -= 1
+
+    def query(self, rect):
+        """
+        Get every item colliding with a rect
+
+        :param: rect, pygame Rect
+        :rtype: list of items, in the order they were added
+        """
+        cells = self.cells
+        found = dict()
+        for key in self._cells(rect):
+            for entry in cells.get(key, ()):
+                if entry[0] not in found and rect.colliderect(entry[1]):
+                    found[entry[0]] = entry[2]
+
+        return [found[order] for order in sorted(found)]
+
+    def collide(self, rect):
+        """
+        Get the first item (in the order they were added) colliding with a rect
+
+        :param: rect, pygame Rect
+        :rtype: item, or None if nothing collides
+        """
+        first = None
+        cells = self.cells
+        for key in self._cells(rect):
+            for entry in cells.get(key, ()):
+                if (first is None or entry[0] < first[0]) and rect.colliderect(entry[1]):
+                    first = entry
+
+        return None if first is None else first[2]
+
+    def collideany(self, rect):
+        """
+        :param: rect, pygame Rect
+        :rtype: True if any item collides with the rect
+        """
+        cells = self.cells
+        for key in self._cells(rect):
+            for entry in cells.get(key, ()):
+                if rect.colliderect(entry[1]):
+                    return True
+
+        return False
@@ -0,0 +1,241 @@
+import os.path
+import struct
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+MAX_CACHED_SHEETS = 16 #unreferenced sheets kept around before the least recently used is evicted
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def image_size(filename):
+    """
+    Read the size of a .png image from its header, without decoding it
+
+    :param: filename, path to an image
+    :rtype: (width, height), or None if the image is not a readable .png
+    """
+    try:
+        with open(filename, 'rb') as image_file:
+            header = image_file.read(24)
+    except OSError:
+        return None
+
+    if len(header) < 24 or not header.startswith(PNG_SIGNATURE) or header[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+
+class SpriteSheet(object):
+    """
+    SPRITE SHEET
+    A sprite sheet image sliced into a grid of equally sized frames.
+
+    -The frames are subsurfaces of the sheet, so every frame shares the pixels of the one sheet image
+    -Animation sets built from the frames are cached on the sheet so every sprite using the same
+     layout gets the same frame tuples
+    -'references' counts how many sprites are currently using the sheet
+    -a sheet made with a placeholder 'image' is blank until set_image() copies the real image into it.  The frames
+     keep pointing at the same pixels, so sprites show the real frames as soon as they are copied
+    """
+    def __init__(self, filename, rows, cols, image=None):
+        self.filename = filename
+        self.rows = rows
+        self.cols = cols
+        self.loaded = image is None
+
+        if image is None:
+            image = pygame.image.load(filename)
+
+        #convert once for every sprite that will use the sheet.  fails if no display mode has been set yet
+        try:
+            image = image.convert_alpha()
+        except pygame.error:
+            pass
+
+        self.image = image
+
+        frame_width = image.get_width() // cols
+        frame_height = image.get_height() // rows
+        self.frames = tuple(image.subsurface((col*frame_width, row*frame_height, frame_width, frame_height))
+                            for row in range(rows)
+                            for col in range(cols))
+
+        self.animation_sets = dict()
+        self.references = 0
+
+    @property
+    def size(self):
+        """
+        :rtype: number of bytes of pixel data held by the sheet
+        """
+        return self.image.get_width() * self.image.get_height() * self.image.get_bytesize()
+
+    @classmethod
+    def placeholder(cls, filename, rows, cols):
+        """
+        Make a transparent sheet the size of an image, to show until the image is loaded
+
+        :param: filename, path to the sprite sheet image
+        :param: rows, cols, the size of the frame grid
+        :rtype: SpriteSheet, or None if the size of the image can not be read without loading it
+        """
+        size = image_size(filename)
+        if size is None:
+            return None
+
+        image = pygame.Surface(size, pygame.SRCALPHA)
+        image.fill((0, 0, 0, 0))
+        return cls(filename, rows, cols, image)
+
+    def set_image(self, image):
+        """
+        Copy the real image into a placeholder sheet
+
+        :param: image, the loaded sprite sheet image, the same size as the placeholder
+        """
+        try:
+            image = image.convert_alpha()
+        except pygame.error:
+            pass
+
+        #adding to the cleared placeholder copies every channel, alpha included
+        self.image.fill((0, 0, 0, 0))
+        self.image.blit(image, (0, 0), special_flags=pygame.BLEND_RGBA_ADD)
+        self.loaded = True
+
+    def get_animation_set(self, layout):
+        """
+        Get the frames for a set of animations, building it the first time it is asked for
+
+        :param: layout, dictionary of {animation name: sequence of frame indexes}
+        :rtype: dictionary of {animation name: tuple of frames}
+        """
+        key = tuple(sorted((name, tuple(indexes)) for name, indexes in layout.items()))
+
+        try:
+            return self.animation_sets[key]
+        except KeyError:
+            animation_set = {name: tuple(self.frames[index] for index in indexes)
+                             for name, indexes in layout.items()}
+            self.animation_sets[key] = animation_set
+            return animation_set
+
+
+class SpriteAtlas(object):
+    """
+    SPRITE ATLAS
+    Process wide cache of sliced sprite sheets, keyed by sheet path and grid layout.
+
+    -acquire(filename, rows, cols) returns the shared SpriteSheet and adds a reference to it
+    -release(sheet) drops a reference.  Sheets that are no longer referenced stay cached until
+     more than 'max_sheets' are held, then the least recently used ones are evicted
+    -hits/misses/evictions count cache activity, stats() reports them with the memory in use
+    -acquire(..., deferred=True) returns a transparent placeholder sheet right away and loads the image on a
+     background thread.  finish_loading() copies the loaded images into their sheets
+    """
+    def __init__(self, max_sheets=MAX_CACHED_SHEETS):
+        self.max_sheets = max_sheets
+        self._sheets = OrderedDict()
+
+        self._executor = None
+        self._loading = dict() #{placeholder SpriteSheet: future of the loaded image}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._sheets)
+
+    def acquire(self, filename, rows, cols, deferred=False):
+        """
+        Get a sliced sprite sheet, loading it if it is not already cached
+
+        :param: filename, path to the sprite sheet image
+        :param: rows, cols, the size of the frame grid
+        :param: deferred, True to get a placeholder sheet now and load the image in the background
+        :rtype: SpriteSheet
+        """
+        key = (os.path.normpath(filename), rows, cols)
+
+        sheet = self._sheets.get(key)
+        if sheet is None:
+            self.misses += 1
+            sheet = SpriteSheet.placeholder(filename, rows, cols) if deferred else None
+            if sheet is None:
+                sheet = SpriteSheet(filename, rows, cols)
+            else:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1)
+                self._loading[sheet] = self._executor.submit(pygame.image.load, filename)
+            self._sheets[key] = sheet
+        else:
+            self.hits += 1
+            self._sheets.move_to_end(key)
+
+        sheet.references += 1
+        self.evict()
+
+        return sheet
+
+    def finish_loading(self, wait=False):
+        """
+        Copy the images loaded in the background into their placeholder sheets
+
+        :param: wait, True to wait for the images that are still loading
+        :rtype: True if any sheet changed
+        """
+        if not self._loading:
+            return False
+
+        finished = [sheet for sheet, future in self._loading.items() if wait or future.done()]
+        for sheet in finished:
+            sheet.set_image(self._loading.pop(sheet).result())
+
+        return bool(finished)
+
+    def release(self, sheet):
+        """
+        Drop a reference to a sheet returned by acquire()
+
+        :param: sheet, SpriteSheet
+        """
+        sheet.references = max(0, sheet.references - 1)
+        self.evict()
+
+    def evict(self):
+        """
+        Evict least recently used unreferenced sheets until no more than 'max_sheets' are cached
+        """
+        if len(self._sheets) <= self.max_sheets:
+            return
+
+        for key in [key for key, sheet in self._sheets.items() if sheet.references == 0]:
+            del self._sheets[key]
+            self.evictions += 1
+            if len(self._sheets) <= self.max_sheets:
+                break
+
+    def clear(self):
+        """
+        Empty the cache.  Sheets still referenced by sprites stay alive until those sprites are gone
+        """
+        self._sheets.clear()
+
+    def stats(self):
+        """
+        :rtype: dictionary of cache counters and memory use (in bytes)
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'sheets': len(self._sheets),
+                'referenced': sum(1 for sheet in self._sheets.values() if sheet.references),
+                'bytes': sum(sheet.size for sheet in self._sheets.values())}
+
+
+#the atlas shared by every sprite in the process
+ATLAS = SpriteAtlas()
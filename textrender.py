@@ -0,0 +1,176 @@
+from collections import OrderedDict
+
+import pygame
+
+DEFAULT_FONT = 'freesansbold.ttf'
+DEFAULT_SIZE = 16
+MAX_CACHED_WRAPS = 128 #word wrapped texts kept by each glyph atlas
+
+_fonts = dict()
+_atlases = dict()
+
+
+def get_font(name=DEFAULT_FONT, size=DEFAULT_SIZE):
+    """
+    :param: name, font file
+    :param: size, font size
+    :rtype: the shared pygame Font of that name and size
+    """
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = _fonts[key] = pygame.font.Font(name, size)
+    return font
+
+
+def get_atlas(name=DEFAULT_FONT, size=DEFAULT_SIZE, color=(255, 255, 255), antialias=True):
+    """
+    :param: name, font file
+    :param: size, font size
+    :param: color, text color
+    :param: antialias, True for smooth glyphs
+    :rtype: the shared GlyphAtlas of the font, size and color
+    """
+    key = (name, size, tuple(color), antialias)
+    atlas = _atlases.get(key)
+    if atlas is None:
+        atlas = _atlases[key] = GlyphAtlas(get_font(name, size), color, antialias)
+    return atlas
+
+
+def paginate(lines, lines_per_page):
+    """
+    Split lines of text into pages
+
+    :param: lines, sequence of lines
+    :param: lines_per_page, number of lines that fit on a page
+    :rtype: tuple of pages, each a tuple of lines.  there is always at least one page
+    """
+    lines = tuple(lines)
+    lines_per_page = max(1, lines_per_page)
+    return tuple(lines[start:start + lines_per_page] for start in range(0, len(lines), lines_per_page)) or ((),)
+
+
+class GlyphAtlas(object):
+    """
+    GLYPH ATLAS
+    Every character of a font rendered once in one color.  Text is drawn by blitting the rendered characters,
+    so text that changes every frame (typewriter reveals, etc) is never rendered by the font again.
+
+    -glyph(char) - the rendered character and how far it advances the pen
+    -size(text) / width(text) - size of a line of text in pixels, the same as the font rendering it in one go
+    -render(surface, text, position) - draws a line of text.  Every character is placed where the font puts it in
+     the whole line, with kerning, so the text looks the same as text the font renders
+    -wrap(text, width) - splits text into lines no wider than 'width'.  recently wrapped texts are cached
+    """
+    def __init__(self, font, color, antialias=True):
+        self.font = font
+        self.color = tuple(color)
+        self.antialias = antialias
+        self.line_height = font.get_linesize()
+
+        self.glyphs = dict()
+        self._wraps = OrderedDict()
+
+    def glyph(self, char):
+        """
+        :param: char, a character
+        :rtype: (rendered character Surface, advance in pixels)
+        """
+        try:
+            return self.glyphs[char]
+        except KeyError:
+            pass
+
+        surface = self.font.render(char, self.antialias, self.color)
+        metrics = self.font.metrics(char)
+        advance = metrics[0][4] if metrics and metrics[0] else surface.get_width()
+
+        glyph = self.glyphs[char] = (surface, advance)
+        return glyph
+
+    def size(self, text):
+        """
+        :param: text, a line of text
+        :rtype: (width, height) of the line in pixels
+        """
+        return self.font.size(text)
+
+    def width(self, text):
+        """
+        :param: text, a line of text
+        :rtype: width of the line in pixels
+        """
+        return self.font.size(text)[0]
+
+    def positions(self, text, position):
+        """
+        :param: text, a line of text
+        :param: position, where the line starts
+        :rtype: list of (rendered character, position) for every character of the line
+        """
+        x, y = position
+        size = self.font.size
+        blits = list()
+        for end, char in enumerate(text, 1):
+            #the character ends where the line up to it ends, so the advances keep their fractions and kerning
+            surface = self.glyph(char)[0]
+            blits.append((surface, (x + size(text[:end])[0] - surface.get_width(), y)))
+        return blits
+
+    def render(self, surface, text, position):
+        """
+        Draw a line of text
+
+        :param: surface, surface to draw on
+        :param: text, a line of text
+        :param: position, topleft of the line
+        """
+        surface.blits(self.positions(text, position), doreturn=False)
+
+    def wrap(self, text, width):
+        """
+        Split text into lines.  Lines break at spaces, new lines, and inside words that are wider than a line
+
+        :param: text, text to wrap
+        :param: width, width of a line in pixels
+        :rtype: tuple of lines
+        """
+        key = (text, width)
+        lines = self._wraps.get(key)
+        if lines is not None:
+            self._wraps.move_to_end(key)
+            return lines
+
+        lines = list()
+        for paragraph in text.split('\n'):
+            line = ''
+            for word in paragraph.split():
+                word_width = self.width(word)
+
+                if line and self.width(line + ' ' + word) <= width:
+                    line += ' ' + word
+                    continue
+
+                if line:
+                    lines.append(line)
+
+                #break words that do not fit on a line of their own
+                while word_width > width and len(word) > 1:
+                    cut = 1
+                    while cut < len(word) and self.width(word[:cut + 1]) <= width:
+                        cut += 1
+                    lines.append(word[:cut])
+                    word = word[cut:]
+                    word_width = self.width(word)
+
+                line = word
+            lines.append(line)
+
+        lines = self._wraps[key] = tuple(lines)
+        while len(self._wraps) > MAX_CACHED_WRAPS:
+            self._wraps.popitem(last=False)
+
+        return lines
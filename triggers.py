@@ -0,0 +1,147 @@
+import pygame
+
+REGION_SIZE = 64 #pixels.  the trigger volumes around a rect are looked up for a region of this grid
+
+
+class Trigger(object):
+    """
+    A kind of trigger and its callbacks.  Callbacks are called with (kind, object)
+    """
+    __slots__ = ('kind', 'index', 'find', 'version', 'on_enter', 'on_stay', 'on_exit')
+
+    def __init__(self, kind, index=None, find=None, version=None, on_enter=None, on_stay=None, on_exit=None):
+        self.kind = kind
+        self.index = index
+        self.find = find
+        self.version = version
+        self.on_enter = on_enter
+        self.on_stay = on_stay
+        self.on_exit = on_exit
+
+
+class TriggerSystem(object):
+    """
+    TRIGGER SYSTEM
+    Calls enter, stay and exit callbacks as a rect (the player's) moves in and out of trigger volumes.  Nothing is
+    tested while the rect stands still, and the volumes around the rect are only looked up again when it leaves
+    the region of the REGION_SIZE grid they were looked up for.  In between, only the few volumes of that region are
+    tested, whatever kinds of triggers there are.
+
+    -add_volumes(kind, index, ...) - the world objects in a spatial hash are trigger volumes, of the size of their
+     'position' rect
+    -add_finder(kind, find, version, ...) - objects that move on their own, e.g. NPCs.  find(rect) returns the objects
+     the rect is in.  It is called when the rect moved, or when version() changed since the last call
+    -on_enter(kind, object) is called when the rect comes into an object, on_stay(kind, object) on every update
+     that tested the rect while it stays in, and on_exit(kind, object) when it leaves
+    -inside - dictionary of {object: kind} of the objects the rect is in, in the order it came into them
+    -refresh() - looks the volumes up again on the next update, e.g. after objects were added to the indexes.
+     reset() also forgets what the rect is in without calling exits, e.g. after the player was moved to another map
+    """
+    def __init__(self, region_size=REGION_SIZE):
+        self.region_size = region_size
+        self.volumes = list()
+        self.finders = list()
+        self.kinds = dict()
+        self.inside = dict()
+
+        self.rect = None
+        self.region = None
+        self.candidates = list() #(trigger, object) of the volumes in the region
+        self.found = dict() #{object: trigger} of the volumes the rect was last found in
+        self.versions = list()
+
+    def add_volumes(self, kind, index, on_enter=None, on_stay=None, on_exit=None):
+        """
+        :param: kind, name of the trigger, passed to the callbacks
+        :param: index, spatialhash.SpatialHash of objects with a 'position' rect
+        """
+        self.kinds[kind] = Trigger(kind, index=index, on_enter=on_enter, on_stay=on_stay, on_exit=on_exit)
+        self.volumes.append(self.kinds[kind])
+        self.refresh()
+
+    def add_finder(self, kind, find, version=None, on_enter=None, on_stay=None, on_exit=None):
+        """
+        :param: kind, name of the trigger, passed to the callbacks
+        :param: find, function of a pygame Rect returning the objects the rect is in
+        :param: version, function returning a value that changes when the objects may have moved.  None calls
+                'find' on every update
+        """
+        self.kinds[kind] = Trigger(kind, find=find, version=version, on_enter=on_enter, on_stay=on_stay,
+                                   on_exit=on_exit)
+        self.finders.append(self.kinds[kind])
+        self.refresh()
+
+    def refresh(self):
+        self.rect = None
+        self.region = None
+
+    def reset(self):
+        self.refresh()
+        self.inside = dict()
+        self.found = dict()
+
+    def region_of(self, rect):
+        """
+        :rtype: pygame Rect of the cells of the region grid a rect overlaps and the ring of cells around them, so
+                the rect can move a whole cell before the volumes are looked up again
+        """
+        size = self.region_size
+        left = rect.left // size * size - size
+        top = rect.top // size * size - size
+        right = -(-max(rect.right, rect.left + 1) // size) * size + size
+        bottom = -(-max(rect.bottom, rect.top + 1) // size) * size + size
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def update(self, rect):
+        """
+        Test a rect against the triggers and call the callbacks of the ones it came into, stays in or left
+
+        :param: rect, pygame Rect in map pixels
+        """
+        moved = rect != self.rect
+        versions = [finder.version() if finder.version is not None else None for finder in self.finders]
+        if not moved and versions == self.versions and all(finder.version is not None for finder in self.finders):
+            return
+
+        if moved:
+            self.rect = pygame.Rect(rect)
+            if self.region is None or not self.region.contains(rect):
+                self.region = self.region_of(rect)
+                self.candidates = [(volume, world_object) for volume in self.volumes
+                                   for world_object in volume.index.query(self.region)]
+            self.found = {world_object: volume for volume, world_object in self.candidates
+                          if rect.colliderect(world_object.position)}
+
+        found = dict(self.found)
+        for finder in self.finders:
+            for found_object in finder.find(rect):
+                found.setdefault(found_object, finder)
+        self.versions = versions
+
+        self.transition(found)
+
+    def transition(self, found):
+        """
+        :param: found, dictionary of {object: trigger} of every object the rect is in now
+        """
+        inside = self.inside
+        left = [(world_object, kind) for world_object, kind in inside.items() if world_object not in found]
+        stayed = [(world_object, kind) for world_object, kind in inside.items() if world_object in found]
+        entered = [(world_object, trigger) for world_object, trigger in found.items() if world_object not in inside]
+
+        #the callbacks see the objects the rect is in after the update
+        for world_object, kind in left:
+            del inside[world_object]
+        for world_object, trigger in entered:
+            inside[world_object] = trigger.kind
+
+        triggers = self.kinds
+        for world_object, kind in left:
+            if triggers[kind].on_exit is not None:
+                triggers[kind].on_exit(kind, world_object)
+        for world_object, kind in stayed:
+            if triggers[kind].on_stay is not None:
+                triggers[kind].on_stay(kind, world_object)
+        for world_object, trigger in entered:
+            if trigger.on_enter is not None:
+                trigger.on_enter(trigger.kind, world_object)
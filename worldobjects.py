@@ -0,0 +1,84 @@
+import sys
+
+import pygame
+
+
+class WorldObject(object):
+    """
+    WORLD OBJECT
+    An object on the map the player can interact with.  Objects only have slots for their fields, and their text
+    is interned, so a map with tens of thousands of objects keeps one copy of each message or destination.
+
+    -position - pygame Rect of the object in map pixels
+    -kind - object name on the map ('portal', 'sign' or 'item')
+    """
+    __slots__ = ('position',)
+    kind = None
+
+    def __init__(self, position):
+        self.position = position
+
+    def __repr__(self):
+        fields = ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__)
+        return '<{} {!r} {}>'.format(type(self).__name__, self.position, fields)
+
+
+class Portal(WorldObject):
+    """
+    PORTAL
+    Loads the 'destination' map when the player walks into it
+    """
+    __slots__ = ('destination',)
+    kind = 'portal'
+
+    def __init__(self, position, destination):
+        WorldObject.__init__(self, position)
+        self.destination = destination
+
+
+class Sign(WorldObject):
+    """
+    SIGN
+    Shows its 'message' when the player reads it
+    """
+    __slots__ = ('message',)
+    kind = 'sign'
+
+    def __init__(self, position, message):
+        WorldObject.__init__(self, position)
+        self.message = message
+
+
+class Item(WorldObject):
+    """
+    ITEM
+    Can be picked up by the player.  'name' is the kind of item
+    """
+    __slots__ = ('name',)
+    kind = 'item'
+
+    def __init__(self, position, name):
+        WorldObject.__init__(self, position)
+        self.name = name
+
+
+KINDS = {'portal': Portal, 'sign': Sign, 'item': Item}
+
+
+def intern(value):
+    """
+    :rtype: the shared copy of a string, or the value itself if it is not a string
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def make_world_object(kind, rect, value):
+    """
+    :param: kind, object name on the map ('blocker', 'portal', 'sign' or 'item')
+    :param: rect, (x, y, width, height) of the object
+    :param: value, type of the object on the map
+    :rtype: world object the way the overworld stores it.  blockers are rects, other objects are WorldObjects
+    """
+    if kind == 'blocker':
+        return pygame.Rect(rect)
+    return KINDS[kind](pygame.Rect(rect), intern(value))